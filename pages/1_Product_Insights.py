@@ -1,19 +1,18 @@
 import streamlit as st
 from datetime import datetime
-import psycopg
 import pandas as pd
 import plotly.express as px
 import numpy as np
 import os
 from dotenv import load_dotenv
-import boto3
 import json
 import base64
 import warnings
 import logging
 import time
-from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from botocore.exceptions import ClientError
+from services import answer_cache, aws_clients, claude_stream, database, embedding_cache, insights_aggregates, local_vector_index, schema
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -25,20 +24,9 @@ warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy conne
 # Load environment variables
 load_dotenv()
 
-# Initialize Bedrock client
-config = Config(
-    region_name='us-west-2',
-    retries={
-        'max_attempts': 3,
-        'mode': 'standard'
-    }
-)
-   
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    config=config
-)
+# Shared, process-wide Bedrock clients (see services/aws_clients.py)
+bedrock = aws_clients.get_client('bedrock-runtime', profile='generation')
+bedrock_embeddings = aws_clients.get_client('bedrock-runtime', profile='embedding')
 
 # Add this test function
 def test_bedrock_connection():
@@ -73,26 +61,14 @@ def get_base64_of_bin_file(bin_file):
         data = f.read()
         return base64.b64encode(data).decode()
 
-# Database functions
-def get_db_connection():
-    try:
-        return psycopg.connect(
-            host=os.getenv("DB_HOST"),
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            port=os.getenv("DB_PORT", "5432")
-        )
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        st.error("Failed to connect to database. Please check your configuration.")
-        return None
+def fetch_dataframe(query, params=None):
+    with database.connection() as conn:
+        return pd.read_sql(query, conn, params=params)
 
 # Database query function with proper error handling
 def execute_db_query(query, params=None):
     try:
-        with get_db_connection() as conn:
-            return pd.read_sql(query, conn, params=params)
+        return fetch_dataframe(query, params)
     except Exception as e:
         logger.error(f"Database query error: {e}")
         st.error("Failed to execute database query.")
@@ -116,11 +92,15 @@ def similarity_search(query_embedding, top_k=5):
     ORDER BY embedding <=> %s::vector
     LIMIT %s
     """
+    local_index = local_vector_index.get_local_index()
+    if local_index is not None:
+        return local_index.search(query_embedding, min(int(top_k), 100))
+
     query_embedding_list = query_embedding.tolist() if isinstance(query_embedding, np.ndarray) else query_embedding
     start_time = time.time()
 
     try:
-        with get_db_connection() as conn:
+        with database.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(similarity_search.__doc__, 
                           (query_embedding_list, query_embedding_list, min(int(top_k), 100)))
@@ -141,13 +121,12 @@ def similarity_search(query_embedding, top_k=5):
 
 def get_top_trending_categories(top_n=10):
     """
-    SELECT category_name, SUM(boughtinlastmonth) as total_bought
-    FROM bedrock_integration.product_catalog
-    GROUP BY category_name
+    SELECT category_name, total_bought
+    FROM bedrock_integration.mv_category_sales
     ORDER BY total_bought DESC
     LIMIT %s
     """
-    query = get_top_trending_categories.__doc__
+    query = insights_aggregates.with_live_fallback(get_top_trending_categories.__doc__, get_missing_views())
     return execute_db_query(query, (top_n,))
         
 def get_top_grossing_products(top_n=10):
@@ -173,204 +152,270 @@ def get_top_selling_products(top_n=10):
 
 def get_top_rated_categories(top_n=10):
     """
-    SELECT category_name, AVG(stars) as avg_rating
-    FROM bedrock_integration.product_catalog
-    GROUP BY category_name
+    SELECT category_name, avg_rating
+    FROM bedrock_integration.mv_category_sales
     ORDER BY avg_rating DESC
     LIMIT %s
     """
-    query = get_top_rated_categories.__doc__
+    query = insights_aggregates.with_live_fallback(get_top_rated_categories.__doc__, get_missing_views())
     return execute_db_query(query, (top_n,))
 
-# TO-DO
 def get_best_selling_by_category(top_n=10):
     """
-    # TO-DO
+    SELECT category_name, product_description, boughtinlastmonth
+    FROM bedrock_integration.mv_best_selling_by_category
+    ORDER BY boughtinlastmonth DESC
+    LIMIT %s
     """
-    query = get_best_selling_by_category.__doc__
+    query = insights_aggregates.with_live_fallback(get_best_selling_by_category.__doc__, get_missing_views())
     return execute_db_query(query, (top_n,))
 
 def get_spending_habits():
     """
-    WITH price_ranges AS (
-        SELECT 
-            CASE 
-                WHEN price < 20 THEN 'Under $20'
-                WHEN price >= 20 AND price < 50 THEN '$20 - $49.99'
-                WHEN price >= 50 AND price < 100 THEN '$50 - $99.99'
-                WHEN price >= 100 AND price < 200 THEN '$100 - $199.99'
-                ELSE '$200 and above'
-            END AS price_range,
-            boughtinlastmonth
-        FROM bedrock_integration.product_catalog
-    )
-    SELECT 
-        price_range,
-        COUNT(*) as product_count,
-        SUM(boughtinlastmonth) as total_sold
-    FROM price_ranges
-    GROUP BY price_range
-    ORDER BY 
-        CASE price_range
-            WHEN 'Under $20' THEN 1
-            WHEN '$20 - $49.99' THEN 2
-            WHEN '$50 - $99.99' THEN 3
-            WHEN '$100 - $199.99' THEN 4
-            ELSE 5
-        END
+    SELECT price_range, product_count, total_sold
+    FROM bedrock_integration.mv_spending_habits
+    ORDER BY sort_order
     """
-    query = get_spending_habits.__doc__
+    query = insights_aggregates.with_live_fallback(get_spending_habits.__doc__, get_missing_views())
     return execute_db_query(query)
 
+def get_missing_views():
+    """Aggregate views not created yet; their queries fall back to the live catalog"""
+    try:
+        with database.connection() as conn:
+            return insights_aggregates.missing_views(conn)
+    except Exception as e:
+        logger.error(f"Aggregate view lookup error: {e}")
+        return set(insights_aggregates.AGGREGATE_VIEWS)
+
+def get_insights_freshness():
+    """Time of the last materialized aggregate refresh (None if the views have not been created)"""
+    try:
+        schema.ensure_schema()
+        with database.connection() as conn:
+            return insights_aggregates.get_freshness(conn)
+    except Exception as e:
+        logger.error(f"Freshness lookup error: {e}")
+        return None
+
 # Bedrock functions
-def generate_embedding(text):
+def invoke_embedding_model(text):
     body = json.dumps({"inputText": text})
-    modelId = 'amazon.titan-embed-text-v2:0'
+    modelId = embedding_cache.EMBEDDING_MODEL_ID
     accept = 'application/json'
     contentType = 'application/json'
 
-    response = bedrock.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
+    response = bedrock_embeddings.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
     response_body = json.loads(response.get('body').read())
     embedding = response_body.get('embedding')
     return np.array(embedding, dtype=np.float32)
 
+def generate_embedding(text):
+    # Served from the shared two-tier cache; Bedrock is only called on a miss
+    return embedding_cache.get_embedding_cache().get_or_compute(text, invoke_embedding_model)
+
 # Get Claude response
-def get_claude_response(prompt, max_tokens=4096):
+def get_claude_response(prompt, max_tokens=4096, cache_question=None, cache_version=''):
+    """
+    Returns a ClaudeStream of text deltas (render with st.write_stream), or None on error.
+    Answers are reused from the semantic answer cache when a similar cache_question
+    (default: the prompt) was answered before for the same cache_version.
+    """
     try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        })
-        
-        response = bedrock.invoke_model(
-            body=body,
-            modelId=CLAUDE_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        return response_body['content'][0]['text']
+        question = cache_question or prompt
+        cached, question_embedding = answer_cache.lookup_question('insights', question, cache_version)
+        if cached:
+            return claude_stream.ClaudeStream.from_text(cached['answer'], CLAUDE_MODEL_ID, cached['lookup_ms'])
+        stream = claude_stream.stream_claude(bedrock, CLAUDE_MODEL_ID, prompt, max_tokens=max_tokens)
+        if question_embedding is not None:
+            stream.on_complete = lambda finished: answer_cache.get_answer_cache().store(
+                'insights', question, question_embedding, finished.text, version=cache_version)
+        return stream
     except Exception as e:
         print(f"Claude error: {str(e)}")  # For debugging
         return None
 
+# Dashboard data loader
+DASHBOARD_QUERIES = {
+    'trending_categories': (get_top_trending_categories, (10,)),
+    'top_grossing': (get_top_grossing_products, (10,)),
+    'top_selling': (get_top_selling_products, (10,)),
+    'top_categories': (get_top_rated_categories, (10,)),
+    'best_selling_by_category': (get_best_selling_by_category, (10,)),
+    'spending_habits': (get_spending_habits, None),
+}
+
+def run_dashboard_query(name, missing_views=()):
+    """Runs one dashboard query on its own pooled connection (no Streamlit calls: executes in a worker thread)"""
+    query_fn, params = DASHBOARD_QUERIES[name]
+    start_time = time.time()
+    try:
+        df = fetch_dataframe(insights_aggregates.with_live_fallback(query_fn.__doc__, missing_views), params)
+        error = None
+    except Exception as e:
+        logger.error(f"Dashboard query {name} failed: {e}")
+        df, error = pd.DataFrame(), e
+    return name, df, error, (time.time() - start_time) * 1000
+
+def load_dashboard_data(missing_views=()):
+    """
+    Issues all dashboard queries concurrently and yields (name, df, error, query_ms)
+    as each one completes, so the page is bounded by the slowest query rather than the sum.
+    Queries on views in missing_views run against the live catalog instead.
+    """
+    with ThreadPoolExecutor(max_workers=len(DASHBOARD_QUERIES), thread_name_prefix="dashboard") as executor:
+        futures = [executor.submit(run_dashboard_query, name, missing_views) for name in DASHBOARD_QUERIES]
+        for future in as_completed(futures):
+            yield future.result()
+
+# Chart renderers
+def render_trending_categories(trending_categories):
+    # Top 10 Trending Categories
+    if not trending_categories.empty:
+        fig_trending = px.bar(trending_categories.sort_values('total_bought', ascending=True), 
+                          x='total_bought', y='category_name',
+                          labels={'total_bought': 'Units Sold Last Month', 'category_name': 'Category'},
+                          title="Top 10 Trending Categories",
+                          orientation='h',
+                          color='total_bought',
+                          color_continuous_scale=px.colors.sequential.Viridis)
+        fig_trending.update_layout(showlegend=True, height=400, yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_trending, use_container_width=True)
+    else:
+        st.warning("No trending categories data available")
+
+def render_top_grossing(top_grossing):
+    # Top 10 Highest Grossing Products
+    if not top_grossing.empty:
+        # Create a shortened product name
+        top_grossing['short_name'] = top_grossing['product_description'].str[:20] + '...'
+        fig_grossing = px.bar(top_grossing, x='total_revenue', y='short_name',
+                          color='category_name', 
+                          hover_data=['product_description', 'boughtinlastmonth', 'price'],
+                          labels={'total_revenue': 'Total Revenue', 
+                                  'short_name': 'Product',
+                                  'product_description': 'Full Product Name'},
+                          title="Top 10 Highest Grossing Products",
+                          color_discrete_sequence=px.colors.qualitative.Vivid)
+        fig_grossing.update_layout(showlegend=True, height=400, legend_title_text='Category', yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_grossing, use_container_width=True)
+    else:
+        st.warning("No revenue data available")
+
+def render_top_selling(top_selling):
+    # Top 10 Best Selling Products
+    if not top_selling.empty:
+        top_selling['short_name'] = top_selling['product_description'].str[:20] + '...'
+        fig_top_selling = px.bar(top_selling, x='boughtinlastmonth', y='short_name',
+                             color='category_name', 
+                             hover_data=['product_description', 'stars', 'price'],
+                             labels={'boughtinlastmonth': 'Units Sold Last Month', 
+                                     'short_name': 'Product',
+                                     'product_description': 'Full Product Name'},
+                             title="Top 10 Best Selling Products",
+                             orientation='h',
+                             height=500,
+                             color_discrete_sequence=px.colors.qualitative.Bold)
+        fig_top_selling.update_layout(showlegend=True, legend_title_text='Category', yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_top_selling, use_container_width=True)
+    else:
+        st.warning("No sales data available")
+
+def render_top_categories(top_categories):
+    # Top 10 Categories by Rating
+    if not top_categories.empty:
+        fig_categories = px.bar(top_categories.sort_values('avg_rating', ascending=True), 
+                            x='avg_rating', y='category_name',
+                            labels={'avg_rating': 'Average Rating', 'category_name': 'Category'},
+                            title="Top 10 Categories by Average Rating",
+                            orientation='h',
+                            color='avg_rating',
+                            color_continuous_scale=px.colors.sequential.Magma)
+        fig_categories.update_layout(height=400, yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_categories, use_container_width=True)
+    else:
+        st.warning("No rating data available")
+
+def render_best_selling_by_category(best_selling_by_category):
+    # Best Selling Products in each category
+    if not best_selling_by_category.empty:
+        fig_best_selling = px.bar(best_selling_by_category.sort_values('boughtinlastmonth', ascending=True), 
+                              x='boughtinlastmonth', y='category_name',
+                              labels={'boughtinlastmonth': 'Units Sold Last Month', 'category_name': 'Category'},
+                              title="Best Selling Product in Each Category",
+                              orientation='h',
+                              color='product_description',
+                              hover_data=['product_description'],
+                              color_continuous_scale=px.colors.sequential.Inferno)
+        fig_best_selling.update_layout(showlegend=False, height=400, yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(fig_best_selling, use_container_width=True)
+    else:
+        st.warning("No category sales data available")
+
+def render_spending_habits(spending_habits):
+    # General Spending Habits
+    if not spending_habits.empty:
+        fig_spending = px.pie(spending_habits.sort_values('total_sold', ascending=False), 
+                          values='total_sold', names='price_range',
+                          title="General Spending Habits of Online Shoppers",
+                          hover_data=['product_count'],
+                          color_discrete_sequence=px.colors.qualitative.G10)
+        fig_spending.update_traces(textposition='inside', textinfo='percent+label')
+        fig_spending.update_layout(showlegend=True, legend_title_text='Price Range', height=400)
+        st.plotly_chart(fig_spending, use_container_width=True)
+    else:
+        st.warning("No spending habits data available")
+
+CHART_RENDERERS = {
+    'trending_categories': render_trending_categories,
+    'top_grossing': render_top_grossing,
+    'top_selling': render_top_selling,
+    'top_categories': render_top_categories,
+    'best_selling_by_category': render_best_selling_by_category,
+    'spending_habits': render_spending_habits,
+}
+
 # UI functions
 def show_product_insights():
     st.subheader("Product Insights Dashboard")
 
-    with st.spinner("Loading product insights..."):
-        # Create three columns for the first row of charts
-        col1, col2, col3 = st.columns(3)
-
-        with col1:
-            # Top 10 Trending Categories
-            trending_categories = get_top_trending_categories(10)
-            if not trending_categories.empty:
-                fig_trending = px.bar(trending_categories.sort_values('total_bought', ascending=True), 
-                                  x='total_bought', y='category_name',
-                                  labels={'total_bought': 'Units Sold Last Month', 'category_name': 'Category'},
-                                  title="Top 10 Trending Categories",
-                                  orientation='h',
-                                  color='total_bought',
-                                  color_continuous_scale=px.colors.sequential.Viridis)
-                fig_trending.update_layout(showlegend=True, height=400, yaxis={'categoryorder':'total ascending'})
-                st.plotly_chart(fig_trending, use_container_width=True)
-            else:
-                st.warning("No trending categories data available")
-
-        with col2:
-            # Top 10 Highest Grossing Products
-            top_grossing = get_top_grossing_products(10)
-            if not top_grossing.empty:
-                # Create a shortened product name
-                top_grossing['short_name'] = top_grossing['product_description'].str[:20] + '...'
-                fig_grossing = px.bar(top_grossing, x='total_revenue', y='short_name',
-                                  color='category_name', 
-                                  hover_data=['product_description', 'boughtinlastmonth', 'price'],
-                                  labels={'total_revenue': 'Total Revenue', 
-                                          'short_name': 'Product',
-                                          'product_description': 'Full Product Name'},
-                                  title="Top 10 Highest Grossing Products",
-                                  color_discrete_sequence=px.colors.qualitative.Vivid)
-                fig_grossing.update_layout(showlegend=True, height=400, legend_title_text='Category', yaxis={'categoryorder':'total ascending'})
-                st.plotly_chart(fig_grossing, use_container_width=True)
-            else:
-                st.warning("No revenue data available")
-
-        with col3:
-            # Top 10 Best Selling Products
-            top_selling = get_top_selling_products(10)
-            if not top_selling.empty:
-                top_selling['short_name'] = top_selling['product_description'].str[:20] + '...'
-                fig_top_selling = px.bar(top_selling, x='boughtinlastmonth', y='short_name',
-                                     color='category_name', 
-                                     hover_data=['product_description', 'stars', 'price'],
-                                     labels={'boughtinlastmonth': 'Units Sold Last Month', 
-                                             'short_name': 'Product',
-                                             'product_description': 'Full Product Name'},
-                                     title="Top 10 Best Selling Products",
-                                     orientation='h',
-                                     height=500,
-                                     color_discrete_sequence=px.colors.qualitative.Bold)
-                fig_top_selling.update_layout(showlegend=True, legend_title_text='Category', yaxis={'categoryorder':'total ascending'})
-                st.plotly_chart(fig_top_selling, use_container_width=True)
-            else:
-                st.warning("No sales data available")
-
-        # Create three columns for the second row of charts
-        col4, col5, col6 = st.columns(3)
-
-        with col4:
-            # Top 10 Categories by Rating
-            top_categories = get_top_rated_categories(10)
-            if not top_categories.empty:
-                fig_categories = px.bar(top_categories.sort_values('avg_rating', ascending=True), 
-                                    x='avg_rating', y='category_name',
-                                    labels={'avg_rating': 'Average Rating', 'category_name': 'Category'},
-                                    title="Top 10 Categories by Average Rating",
-                                    orientation='h',
-                                    color='avg_rating',
-                                    color_continuous_scale=px.colors.sequential.Magma)
-                fig_categories.update_layout(height=400, yaxis={'categoryorder':'total ascending'})
-                st.plotly_chart(fig_categories, use_container_width=True)
-            else:
-                st.warning("No rating data available")
-
-        with col5:
-            # Best Selling Products in each category
-            best_selling_by_category = get_best_selling_by_category()
-            if not best_selling_by_category.empty:
-                fig_best_selling = px.bar(best_selling_by_category.sort_values('boughtinlastmonth', ascending=True), 
-                                      x='boughtinlastmonth', y='category_name',
-                                      labels={'boughtinlastmonth': 'Units Sold Last Month', 'category_name': 'Category'},
-                                      title="Best Selling Product in Each Category",
-                                      orientation='h',
-                                      color='product_description',
-                                      hover_data=['product_description'],
-                                      color_continuous_scale=px.colors.sequential.Inferno)
-                fig_best_selling.update_layout(showlegend=False, height=400, yaxis={'categoryorder':'total ascending'})
-                st.plotly_chart(fig_best_selling, use_container_width=True)
-            else:
-                st.warning("No category sales data available")
-
-        with col6:
-            # General Spending Habits
-            spending_habits = get_spending_habits()
-            if not spending_habits.empty:
-                fig_spending = px.pie(spending_habits.sort_values('total_sold', ascending=False), 
-                                  values='total_sold', names='price_range',
-                                  title="General Spending Habits of Online Shoppers",
-                                  hover_data=['product_count'],
-                                  color_discrete_sequence=px.colors.qualitative.G10)
-                fig_spending.update_traces(textposition='inside', textinfo='percent+label')
-                fig_spending.update_layout(showlegend=True, legend_title_text='Price Range', height=400)
-                st.plotly_chart(fig_spending, use_container_width=True)
-            else:
-                st.warning("No spending habits data available")
+    missing_views = get_missing_views()
+    refreshed_at = get_insights_freshness() if not missing_views else None
+    if refreshed_at:
+        st.caption(f"Category and spending aggregates as of {refreshed_at.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+    else:
+        st.info("Aggregate views not found, so category and spending charts are computed from the live catalog. "
+                "Run `python -m services.insights_aggregates --create` to build them.")
+
+    # Two rows of three columns; each chart gets a placeholder that is filled
+    # as soon as its query lands, in whatever order the queries finish
+    col1, col2, col3 = st.columns(3)
+    col4, col5, col6 = st.columns(3)
+    chart_slots = {}
+    for name, col in zip(DASHBOARD_QUERIES, (col1, col2, col3, col4, col5, col6)):
+        with col:
+            chart_slots[name] = st.empty()
+            chart_slots[name].info("Loading...")
+
+    dashboard_data = {}
+    query_times = {}
+    dashboard_start = time.time()
+    for name, df, error, query_ms in load_dashboard_data(missing_views):
+        dashboard_data[name] = df
+        query_times[name] = query_ms
+        with chart_slots[name].container():
+            if error is not None:
+                st.error("Failed to execute database query.")
+            CHART_RENDERERS[name](df)
+    dashboard_ms = (time.time() - dashboard_start) * 1000
+    st.caption(f"Dashboard loaded in {dashboard_ms:.0f} ms (slowest query: {max(query_times.values()):.0f} ms, "
+               f"sum of queries: {sum(query_times.values()):.0f} ms)")
+
+    trending_categories = dashboard_data['trending_categories']
+    top_grossing = dashboard_data['top_grossing']
+    top_selling = dashboard_data['top_selling']
+    top_categories = dashboard_data['top_categories']
+    spending_habits = dashboard_data['spending_habits']
 
     # Show SQL queries in expanders
     with st.expander("View SQL Queries"):
@@ -381,13 +426,16 @@ def show_product_insights():
         st.code(get_top_rated_categories.__doc__, language="sql")
         st.code(get_best_selling_by_category.__doc__, language="sql")
         st.code(get_spending_habits.__doc__, language="sql")
+        st.caption("Materialized views behind the category and spending charts (refreshed concurrently by services/insights_aggregates.py).")
+        for view_name, (definition, _) in insights_aggregates.AGGREGATE_VIEWS.items():
+            st.code(f"CREATE MATERIALIZED VIEW bedrock_integration.{view_name} AS{definition}", language="sql")
 
     # AI-Powered Market Insights
     st.subheader("AI-Powered Market Insights")
     
     # Add button for generating insights
     if st.button("📊 Generate AI Insights", type="primary"):
-        with st.spinner("Generating AI insights..."):
+        with st.spinner("Requesting AI insights..."):
             # Prepare simplified data for the prompt
             insights_data = {
                 "trending_categories": trending_categories[['category_name', 'total_bought']].head().to_dict('records'),
@@ -414,22 +462,30 @@ def show_product_insights():
             Format the response in markdown with clear sections and bullet points.
             """
             
-            try:
-                claude_insights = get_claude_response(insights_prompt)
-                if claude_insights:
-                    st.markdown(claude_insights)
-                    
-                    # Add a download button for the insights
-                    st.download_button(
-                        label="📥 Download Insights",
-                        data=claude_insights,
-                        file_name="market_insights.md",
-                        mime="text/markdown"
-                    )
-                else:
-                    st.error("Unable to generate AI insights. Please try again.")
-            except Exception as e:
-                st.error(f"Error generating insights: {str(e)}")
+            # Cached insights are reused until the underlying aggregates change
+            insights_stream = get_claude_response(insights_prompt,
+                                                  cache_version=answer_cache.content_version(insights_data))
+
+        try:
+            if insights_stream:
+                # Tokens render as they arrive; write_stream returns the assembled text
+                claude_insights = st.write_stream(insights_stream)
+                metrics = insights_stream.metrics()
+                st.caption(f"First token after {metrics['time_to_first_token_ms'] or 0:.0f} ms, "
+                           f"complete after {metrics['total_ms']:.0f} ms "
+                           f"({metrics['output_tokens']} output tokens)")
+
+                # Add a download button for the insights
+                st.download_button(
+                    label="📥 Download Insights",
+                    data=claude_insights,
+                    file_name="market_insights.md",
+                    mime="text/markdown"
+                )
+            else:
+                st.error("Unable to generate AI insights. Please try again.")
+        except Exception as e:
+            st.error(f"Error generating insights: {str(e)}")
     else:
         st.info("Click the button above to generate AI-powered insights from your product data.")
                 
@@ -474,6 +530,16 @@ def main():
         st.cache_data.clear()
         st.rerun()
     
+    # Connection pool health
+    with st.sidebar.expander("Database Pool Stats"):
+        try:
+            pool_stats = database.get_pool_stats()
+            st.metric("Waiting clients", pool_stats.get('requests_waiting', 0))
+            st.metric("Checkout latency p95 (ms)", f"{pool_stats.get('checkout_ms_p95', 0.0):.2f}")
+            st.json(pool_stats)
+        except Exception as e:
+            st.caption(f"Pool stats unavailable: {e}")
+
     # Add version info
     st.sidebar.divider()
     st.sidebar.caption(f"""
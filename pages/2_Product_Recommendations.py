@@ -4,86 +4,28 @@ import pandas as pd
 import numpy as np
 import os
 from dotenv import load_dotenv
-import boto3
 import json
 import base64
 from botocore.exceptions import ClientError
-from botocore.config import Config
 from datetime import datetime
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from services import answer_cache, aws_clients, claude_stream, database, embedding_cache, local_vector_index, schema, vector_search
 
 # Load environment variables and set up configurations
 load_dotenv()
 
-# Initialize Bedrock client
-config = Config(
-    region_name='us-west-2',
-    retries={
-        'max_attempts': 3,
-        'mode': 'standard'
-    }
-)
-   
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    config=config
-)
+# Shared, process-wide Bedrock clients (see services/aws_clients.py)
+bedrock = aws_clients.get_client('bedrock-runtime', profile='generation')
+bedrock_embeddings = aws_clients.get_client('bedrock-runtime', profile='embedding')
 
 # Constants and configurations
 LOGO_URL = "static/Blaize.png"
 CLAUDE_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
 
 # Database functions
-def get_db_connection():
-    return psycopg.connect(
-        host=os.getenv("DB_HOST"),
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        port=os.getenv("DB_PORT", "5432")
-    )
-
-
-def init_user_tables():
-    """Initialize user-related database tables if they don't exist"""
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # Create users table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bedrock_integration.users (
-                    user_id SERIAL PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            # Create user preferences table with unique constraint on user_id
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bedrock_integration.user_preferences (
-                    preference_id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES bedrock_integration.users(user_id),
-                    category_preferences TEXT[],
-                    price_range_min NUMERIC,
-                    price_range_max NUMERIC,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id)
-                );
-            """)
-            
-            # Create user search history table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bedrock_integration.user_search_history (
-                    history_id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES bedrock_integration.users(user_id),
-                    search_query TEXT,
-                    search_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            conn.commit()
-
 def hash_password(password):
     """Create a secure hash of the password"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -91,7 +33,7 @@ def hash_password(password):
 def create_user(username, password):
     """Create a new user account"""
     password_hash = hash_password(password)
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             try:
                 cur.execute("""
@@ -104,12 +46,13 @@ def create_user(username, password):
                 return user_id
             except psycopg.Error as e:
                 st.error(f"Error creating user: {e}")
+                conn.rollback()
                 return None
 
 def authenticate_user(username, password):
     """Authenticate user credentials"""
     password_hash = hash_password(password)
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT user_id, username
@@ -121,7 +64,7 @@ def authenticate_user(username, password):
 
 def save_user_preferences(user_id, categories, min_price, max_price):
     """Save or update user preferences"""
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             try:
                 # First, check if preferences exist for this user
@@ -156,7 +99,7 @@ def save_user_preferences(user_id, categories, min_price, max_price):
 
 def get_user_preferences(user_id):
     """Retrieve user preferences"""
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT category_preferences, price_range_min, price_range_max
@@ -173,7 +116,7 @@ def get_personalized_initial_recommendations(user_id, limit=5):
     
     categories, min_price, max_price = preferences
     
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT DISTINCT "productId", product_description, category_name, stars, price, 
@@ -193,7 +136,7 @@ def get_personalized_initial_recommendations(user_id, limit=5):
 
 def log_search_history(user_id, search_query):
     """Log user search queries"""
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO bedrock_integration.user_search_history 
@@ -240,7 +183,7 @@ def show_preference_settings():
     st.subheader("Set Your Shopping Preferences")
     
     # Get available categories from the product catalog
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT DISTINCT category_name FROM bedrock_integration.product_catalog")
             available_categories = [cat[0] for cat in cur.fetchall()]
@@ -287,31 +230,55 @@ def show_preference_settings():
 
 
 def keyword_search(query, top_k=5):
-    with get_db_connection() as conn:
+    # search_vector is a GIN-indexed tsvector column maintained by a trigger
+    # (see utils/helper-functions/add_search_vector.py); the tsquery is parsed once
+    # and the rank is computed once per matching row.
+    with database.connection() as conn:
         with conn.cursor() as cur:
             try:
                 start_time = time.time()
                 cur.execute("""
                     SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
-                           imgURL, producturl
-                    FROM bedrock_integration.product_catalog
-                    WHERE to_tsvector('english', product_description || ' ' || category_name) @@ plainto_tsquery('english', %s)
-                    ORDER BY ts_rank(to_tsvector('english', product_description || ' ' || category_name), plainto_tsquery('english', %s)) DESC
+                           imgURL, producturl, ts_rank(search_vector, tsq) AS rank
+                    FROM bedrock_integration.product_catalog,
+                         plainto_tsquery('english', %s) AS tsq
+                    WHERE search_vector @@ tsq
+                    ORDER BY rank DESC
                     LIMIT %s
-                """, (query, query, top_k))
+                """, (query, top_k))
                 results = cur.fetchall()
                 end_time = time.time()
                 query_time = (end_time - start_time) * 1000  # Convert to milliseconds
+            except psycopg.errors.UndefinedColumn as e:
+                st.error(f"Error: {e}. Run utils/helper-functions/add_search_vector.py to add the full-text search index.")
+                st.stop()
             except psycopg.Error as e:
                 st.error(f"Error: {e}. Please check your database configuration.")
                 st.stop()
 
-    return pd.DataFrame(results, columns=['productId', 'product_description', 'category_name', 'stars', 'price', 'boughtinlastmonth', 'imgURL', 'producturl']), query_time
+    return pd.DataFrame(results, columns=['productId', 'product_description', 'category_name', 'stars', 'price', 'boughtinlastmonth', 'imgURL', 'producturl', 'rank']), query_time
+
+def similarity_search(query_embedding, top_k=5, storage_mode='full'):
+    # 'halfvec' / 'binary' search a compact index first and re-rank the candidates at full precision
+    if storage_mode != 'full':
+        try:
+            return vector_search.quantized_similarity_search(query_embedding, top_k, mode=storage_mode)
+        except (psycopg.errors.UndefinedObject, psycopg.errors.UndefinedFunction) as e:
+            st.error(f"Error: {e}. {storage_mode} search needs pgvector 0.7 or later; "
+                     f"build its index with python -m services.vector_search --create-quantized-index {storage_mode}.")
+            st.stop()
+        except psycopg.Error as e:
+            st.error(f"Error: {e}. Please check your database configuration.")
+            st.stop()
+
+    # With LOCAL_VECTOR_INDEX=true, answer from the in-process index and keep this traffic off Aurora
+    local_index = local_vector_index.get_local_index()
+    if local_index is not None:
+        return local_index.search(query_embedding, top_k)
 
-def similarity_search(query_embedding, top_k=5):
     query_embedding_list = query_embedding.tolist()
 
-    with get_db_connection() as conn:
+    with database.connection() as conn:
         with conn.cursor() as cur:
             try:
                 start_time = time.time()
@@ -332,47 +299,129 @@ def similarity_search(query_embedding, top_k=5):
 
     return pd.DataFrame(results, columns=['productId', 'product_description', 'category_name', 'stars', 'price', 'boughtinlastmonth', 'imgURL', 'producturl', 'similarity']), query_time
 
+def hybrid_search(query, query_embedding, top_k=5, keyword_weight=1.0, semantic_weight=1.0,
+                  candidate_depth=40, rrf_k=60):
+    """
+    Fuse full-text and vector candidates with reciprocal rank fusion in one statement.
+
+    Each candidate list contributes weight / (rrf_k + rank) to a product's score;
+    products found by only one list get 0 from the other. Returns the fused
+    results (with each component's rank, NULL if absent) and the query time.
+    """
+    query_embedding_list = query_embedding.tolist()
+
+    with database.connection() as conn:
+        with conn.cursor() as cur:
+            try:
+                start_time = time.time()
+                cur.execute("""
+                    WITH keyword AS (
+                        SELECT "productId", RANK() OVER (ORDER BY ts_rank(search_vector, tsq) DESC) AS rank
+                        FROM bedrock_integration.product_catalog,
+                             plainto_tsquery('english', %(query)s) AS tsq
+                        WHERE search_vector @@ tsq
+                        ORDER BY ts_rank(search_vector, tsq) DESC
+                        LIMIT %(depth)s
+                    ),
+                    semantic AS (
+                        SELECT "productId", RANK() OVER (ORDER BY embedding <=> %(embedding)s::vector) AS rank
+                        FROM bedrock_integration.product_catalog
+                        ORDER BY embedding <=> %(embedding)s::vector
+                        LIMIT %(depth)s
+                    ),
+                    fused AS (
+                        SELECT COALESCE(semantic."productId", keyword."productId") AS "productId",
+                               COALESCE(%(semantic_weight)s::float8 / (%(rrf_k)s + semantic.rank), 0.0) +
+                               COALESCE(%(keyword_weight)s::float8 / (%(rrf_k)s + keyword.rank), 0.0) AS score,
+                               keyword.rank AS keyword_rank,
+                               semantic.rank AS semantic_rank
+                        FROM semantic
+                        FULL OUTER JOIN keyword ON semantic."productId" = keyword."productId"
+                        ORDER BY score DESC
+                        LIMIT %(top_k)s
+                    )
+                    SELECT p."productId", p.product_description, p.category_name, p.stars, p.price, p.boughtinlastmonth,
+                           p.imgURL, p.producturl,
+                           1 - (p.embedding <=> %(embedding)s::vector) AS similarity,
+                           fused.score, fused.keyword_rank, fused.semantic_rank
+                    FROM fused
+                    JOIN bedrock_integration.product_catalog p ON p."productId" = fused."productId"
+                    ORDER BY fused.score DESC
+                """, {
+                    'query': query,
+                    'embedding': query_embedding_list,
+                    'depth': candidate_depth,
+                    'keyword_weight': keyword_weight,
+                    'semantic_weight': semantic_weight,
+                    'rrf_k': rrf_k,
+                    'top_k': top_k,
+                })
+                results = cur.fetchall()
+                end_time = time.time()
+                query_time = (end_time - start_time) * 1000  # Convert to milliseconds
+            except psycopg.Error as e:
+                st.error(f"Error: {e}. Please check your database configuration.")
+                st.stop()
+
+    return pd.DataFrame(results, columns=['productId', 'product_description', 'category_name', 'stars', 'price', 'boughtinlastmonth', 'imgURL', 'producturl', 'similarity', 'score', 'keyword_rank', 'semantic_rank']), query_time
+
 # Bedrock functions
-def generate_embedding(text):
+def invoke_embedding_model(text):
     body = json.dumps({"inputText": text})
-    modelId = 'amazon.titan-embed-text-v2:0'
+    modelId = embedding_cache.EMBEDDING_MODEL_ID
     accept = 'application/json'
     contentType = 'application/json'
 
-    response = bedrock.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
+    response = bedrock_embeddings.invoke_model(body=body, modelId=modelId, accept=accept, contentType=contentType)
     response_body = json.loads(response.get('body').read())
     embedding = response_body.get('embedding')
     return np.array(embedding, dtype=np.float32)
 
-def get_claude_response(prompt, max_tokens=4096):
-    try:
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        })
-
-        response = bedrock.invoke_model(
-            body=body,
-            modelId=CLAUDE_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
-        )
+def generate_embedding(text):
+    # Served from the shared two-tier cache; Bedrock is only called on a miss
+    return embedding_cache.get_embedding_cache().get_or_compute(text, invoke_embedding_model)
 
-        response_body = json.loads(response.get('body').read())
-        return response_body['content'][0]['text']
+def get_claude_response(prompt, max_tokens=4096, cache_question=None, cache_version=''):
+    """
+    Returns a ClaudeStream of text deltas (render with st.write_stream), or None on error.
+    Answers are reused from the semantic answer cache when a similar cache_question
+    (default: the prompt) was answered before for the same cache_version.
+    """
+    try:
+        question = cache_question or prompt
+        cached, question_embedding = answer_cache.lookup_question('recommendations', question, cache_version)
+        if cached:
+            return claude_stream.ClaudeStream.from_text(cached['answer'], CLAUDE_MODEL_ID, cached['lookup_ms'])
+        stream = claude_stream.stream_claude(bedrock, CLAUDE_MODEL_ID, prompt, max_tokens=max_tokens)
+        if question_embedding is not None:
+            stream.on_complete = lambda finished: answer_cache.get_answer_cache().store(
+                'recommendations', question, question_embedding, finished.text, version=cache_version)
+        return stream
     except ClientError as e:
         st.error(f"An error occurred: {e}")
         return None
 
-def get_personalized_recommendations(user_preferences, top_k=3):
+def get_personalized_recommendations(user_preferences, top_k=3, user_id=None, min_stars=None):
     # Generate embedding for user preferences
     preference_embedding = generate_embedding(user_preferences)
     
-    # Perform similarity search in product catalog
-    results, query_time = similarity_search(preference_embedding, top_k)
+    # Perform similarity search in product catalog, constrained by the user's saved
+    # categories and price range (and the requested minimum rating) when present
+    saved_preferences = get_user_preferences(user_id) if user_id else None
+    categories, min_price, max_price = saved_preferences if saved_preferences else (None, None, None)
+    try:
+        results, query_time, search_plan = vector_search.filtered_similarity_search(
+            preference_embedding, top_k,
+            categories=categories or None,
+            min_price=min_price,
+            max_price=max_price,
+            min_stars=min_stars
+        )
+    except psycopg.Error as e:
+        st.error(f"Error: {e}. Please check your database configuration.")
+        st.stop()
+    st.caption(f"Filtered vector search strategy: {search_plan['strategy']} "
+               f"(~{search_plan['estimated_rows']:,.0f} matching products)")
     
     # Prepare the prompt for Claude
     recommendations_prompt = f"""
@@ -389,7 +438,12 @@ def get_personalized_recommendations(user_preferences, top_k=3):
     """
     
     # Get recommendations from Claude
-    claude_recommendations = get_claude_response(recommendations_prompt)
+    # Similar preferences can share an answer, but only for the same retrieved products
+    claude_recommendations = get_claude_response(
+        recommendations_prompt,
+        cache_question=user_preferences,
+        cache_version=answer_cache.content_version(results['productId'].tolist())
+    )
     
     return claude_recommendations, results, query_time
 
@@ -406,8 +460,41 @@ def display_products(results, query_time):
             st.write(f"Rating: {product['stars']:.1f}")
             if 'similarity' in product:
                 st.write(f"Similarity: {product['similarity']:.4f}")
+            if 'score' in product:
+                keyword_rank = '-' if pd.isna(product['keyword_rank']) else int(product['keyword_rank'])
+                semantic_rank = '-' if pd.isna(product['semantic_rank']) else int(product['semantic_rank'])
+                st.write(f"RRF Score: {product['score']:.4f} (keyword rank: {keyword_rank}, semantic rank: {semantic_rank})")
         st.write("---")
 
+def timed_call(fn, *args, **kwargs):
+    start_time = time.time()
+    result = fn(*args, **kwargs)
+    return result, (time.time() - start_time) * 1000
+
+def run_concurrent_search(search_query, hybrid_options, storage_mode='full'):
+    """
+    Starts the Titan embedding call and the keyword query at the same time; the
+    vector and hybrid queries fire the moment the embedding returns.
+    Yields (stage, result, elapsed_ms) in completion order so callers can render
+    each result as soon as it lands.
+    """
+    # Worker threads share this session's script context so st.error/st.stop still work
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=3, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        pending = {
+            executor.submit(timed_call, generate_embedding, search_query): 'embedding',
+            executor.submit(timed_call, keyword_search, search_query): 'keyword',
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = pending.pop(future)
+                result, elapsed_ms = future.result()
+                if stage == 'embedding':
+                    pending[executor.submit(timed_call, similarity_search, result, storage_mode=storage_mode)] = 'semantic'
+                    pending[executor.submit(timed_call, hybrid_search, search_query, result, **hybrid_options)] = 'hybrid'
+                yield stage, result, elapsed_ms
+
 def show_product_recommendations():
     st.subheader("Product Search Comparison")
     
@@ -429,22 +516,55 @@ def show_product_recommendations():
     selected_query = st.selectbox("Choose an example query or enter your own:", example_queries)
     
     search_query = st.text_input("Enter a product description:", value=selected_query if selected_query != example_queries[0] else "")
+    with st.expander("Hybrid search settings"):
+        hybrid_col1, hybrid_col2, hybrid_col3 = st.columns(3)
+        with hybrid_col1:
+            keyword_weight = st.slider("Keyword weight", 0.0, 2.0, 1.0, 0.1)
+        with hybrid_col2:
+            semantic_weight = st.slider("Semantic weight", 0.0, 2.0, 1.0, 0.1)
+        with hybrid_col3:
+            candidate_depth = st.slider("Candidates per list", 10, 200, 40, 10)
+    storage_modes = {
+        "Full precision (vector)": 'full',
+        "Half precision (halfvec) + exact re-rank": 'halfvec',
+        "Binary quantized (bit) + exact re-rank": 'binary',
+    }
+    storage_mode = storage_modes[st.selectbox("Semantic search index", list(storage_modes))]
     if st.button("Search"):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Keyword-based Search")
-            with st.spinner("Performing keyword search..."):
-                keyword_results, keyword_query_time = keyword_search(search_query)
-            display_products(keyword_results, keyword_query_time)
-        
-        with col2:
-            st.subheader("Semantic Search")
-            with st.spinner("Generating embedding..."):
-                query_embedding = generate_embedding(search_query)
-            with st.spinner("Performing semantic search..."):
-                semantic_results, semantic_query_time = similarity_search(query_embedding)
-            display_products(semantic_results, semantic_query_time)
+        col1, col2, col3 = st.columns(3)
+        result_slots = {}
+        for stage, col, title in (('keyword', col1, "Keyword-based Search"),
+                                  ('semantic', col2, "Semantic Search"),
+                                  ('hybrid', col3, "Hybrid Search")):
+            with col:
+                st.subheader(title)
+                result_slots[stage] = st.empty()
+                result_slots[stage].info("Searching...")
+
+        timings = {'render': 0.0}
+        search_start = time.time()
+        hybrid_options = {
+            'keyword_weight': keyword_weight,
+            'semantic_weight': semantic_weight,
+            'candidate_depth': candidate_depth
+        }
+        for stage, result, elapsed_ms in run_concurrent_search(search_query, hybrid_options, storage_mode):
+            if stage == 'embedding':
+                timings['embedding'] = elapsed_ms
+                continue
+            results, query_time = result
+            timings[stage] = query_time
+            render_start = time.time()
+            with result_slots[stage].container():
+                display_products(results, query_time)
+            timings['render'] += (time.time() - render_start) * 1000
+        timings['total'] = (time.time() - search_start) * 1000
+
+        st.caption("Search stage timings (embedding and keyword SQL run concurrently; vector and hybrid SQL start when the embedding returns)")
+        for col, (label, key) in zip(st.columns(6), (("Embedding", 'embedding'), ("Keyword SQL", 'keyword'),
+                                                     ("Vector SQL", 'semantic'), ("Hybrid SQL", 'hybrid'),
+                                                     ("Render", 'render'), ("Wall clock", 'total'))):
+            col.metric(label, f"{timings.get(key, 0.0):.0f} ms")
             
         st.subheader("Search Comparison Explanation")
         st.write("""
@@ -456,6 +576,9 @@ def show_product_recommendations():
             
         In this example, notice how semantic search might return more relevant results,
         especially for queries that don't exactly match product descriptions.
+
+        Hybrid search fuses both result lists with reciprocal rank fusion in a single SQL statement:
+        products ranked highly by either method, and especially by both, rise to the top.
         """)
     else:
         st.warning("Please enter a search query.")
@@ -464,11 +587,19 @@ def show_product_recommendations():
     # Personalized AI Recommendations
     st.subheader("Personalized AI Recommendations")
     user_preferences = st.text_area("Tell us about your preferences and what you're looking for:")
+    min_stars = st.slider("Minimum rating", 0.0, 5.0, 0.0, 0.5)
     if st.button("Get Personalized Recommendations"):
         with st.spinner("Generating personalized recommendations..."):
-            recommendations, top_products, query_time = get_personalized_recommendations(user_preferences)
+            recommendations, top_products, query_time = get_personalized_recommendations(
+                user_preferences,
+                user_id=st.session_state.user_id,
+                min_stars=min_stars or None
+            )
         if recommendations:
-            st.markdown(recommendations)
+            try:
+                st.write_stream(recommendations)
+            except ClientError as e:
+                st.error(f"An error occurred: {e}")
             st.subheader(f"Top Matching Products (Query Time: {query_time:.2f} ms)")
             display_products(top_products, query_time)
         else:
@@ -485,13 +616,15 @@ def main():
     if 'show_preferences' not in st.session_state:
         st.session_state.show_preferences = False
     
-    # Initialize database tables
-    init_user_tables()
+    # Apply any pending schema migrations (checked once per process)
+    schema.ensure_schema()
     
     st.subheader('Product Recommendations - Blaize Bazaar', divider='orange')
     st.sidebar.image(LOGO_URL, use_container_width=True)
     st.sidebar.title('**About**')
     st.sidebar.info("At Blaize Bazaar, we use AI-powered semantic search to match you with products you'll love, going beyond simple keyword matching to understand what you're really looking for.")
+    with st.sidebar.expander("Embedding Cache Stats"):
+        st.json(embedding_cache.get_embedding_cache().stats())
     
     # Show login/signup if user is not logged in
     if not st.session_state.user_id:
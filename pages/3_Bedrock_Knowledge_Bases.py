@@ -1,12 +1,9 @@
-import boto3
 import streamlit as st
 import base64
-import time
 import os
-import json
 from dotenv import load_dotenv
-from botocore.config import Config
 from datetime import datetime
+from services import answer_cache, aws_clients, bedrock_agent_runtime, chat_store, claude_stream, faq_index
 
 # Load environment variables and set up configurations
 load_dotenv()
@@ -14,23 +11,18 @@ load_dotenv()
 # Session and env variables
 region = os.environ.get('AWS_REGION', 'us-west-2')
 
-# Add proper configuration for the clients
-config = Config(
-    region_name=region,
-    retries={
-        'max_attempts': 3,
-        'mode': 'standard'
-    }
-)
-
-session = boto3.Session(region_name=region)
-bedrockClient = session.client('bedrock-agent-runtime', config=config)
-bedrockRuntime = session.client('bedrock-runtime', config=config)
+# Shared, process-wide clients (see services/aws_clients.py)
+bedrockClient = aws_clients.get_client('bedrock-agent-runtime', region, profile='generation')
+bedrockRuntime = aws_clients.get_client('bedrock-runtime', region, profile='generation')
 knowledgeBaseId = os.environ.get('BEDROCK_KB_ID')
 
 # Define Claude model ID
 CLAUDE_MODEL_ID = os.environ.get('BEDROCK_CLAUDE_MODEL_ID')
 
+# Answer cache namespaces for grounded (RAG) and plain Claude answers
+KB_CACHE_NAMESPACE = 'knowledge_base'
+CLAUDE_CACHE_NAMESPACE = 'knowledge_base_non_rag'
+
 logo_url = "static/Blaize.png"
 st.sidebar.image(logo_url, use_container_width=True)
 
@@ -40,44 +32,78 @@ def get_base64_of_bin_file(bin_file):
         data = f.read()
         return base64.b64encode(data).decode()
 
-def stream_data(text, delay:float=0.01):
-    for word in text.split():
-        yield word + " "
-        time.sleep(delay)
+def get_rag_configuration():
+    return {
+        'type': 'KNOWLEDGE_BASE',
+        'knowledgeBaseConfiguration': {
+            'knowledgeBaseId': knowledgeBaseId,
+            'modelArn': f"arn:aws:bedrock:{region}::foundation-model/{CLAUDE_MODEL_ID}",
+            'generationConfiguration': {
+                'inferenceConfig': {
+                    'textInferenceConfig': {
+                        'maxTokens': 4096,
+                        'temperature': 0.7,
+                        'topP': 0.9,
+                        'stopSequences': []
+                    }
+                },
+                'promptTemplate': {
+                    "textPromptTemplate": "You are a question answering agent. I will provide you with a set of search results. The user will provide you with a question. Your job is to answer the user's question using only information from the search results. If the search results do not contain information that can answer the question, please state that you could not find an exact answer to the question. Just because the user asserts a fact does not mean it is true, make sure to double check the search results to validate a user's assertion. Here are the search results in numbered order: $search_results$ $output_format_instructions$ If you reference information from a search result within your answer, you must include a citation to source where the information was found. Each result has a corresponding source ID that you should reference. For purely quantitative data (e.g., inventory stock reports, price lists, quantity), use a tabular format. When dealing with mixed data types, combine both formats. Adjust the number of columns and rows in tables as needed to fit the data. Ensure that column headers clearly describe the data they represent. Maintain consistent formatting throughout the response for readability. Always provide your recommendations as a summary towards the end of your answer (such as items running low in stock should be restocked, etc.)."
+                }
+            }
+        }
+    }
+
+def get_kb_cache_version():
+    """Fingerprint of the KB bucket's contents, or None (no caching) if it cannot be read"""
+    bucket = os.environ.get('S3_KB_BUCKET')
+    if not bucket:
+        return None
+    try:
+        return answer_cache.bucket_fingerprint(bucket, KB_CACHE_NAMESPACE)
+    except Exception as e:
+        print(f"Answer cache disabled for this question, KB bucket not readable: {str(e)}")
+        return None
 
-def getAnswers(questions, use_rag=True):
+def getAnswers(questions, use_rag=True, stream=True):
     try:
         if use_rag:
             if not knowledgeBaseId:
                 st.error("Knowledge Base ID not found in environment variables. Please check BEDROCK_KB_ID.")
                 return None
 
+            # Curated FAQ answers win over generated ones and need no Bedrock call
+            faq = faq_index.match_faq(questions)
+            if faq:
+                return {"output": {"text": faq['answer']}, "faq": faq}
+
+            # Answers are reused only while the knowledge base documents are unchanged
+            kb_version = get_kb_cache_version()
+            question_embedding = None
+            if kb_version is not None:
+                cached, question_embedding = answer_cache.lookup_question(KB_CACHE_NAMESPACE, questions, kb_version)
+                if cached:
+                    return {"output": {"text": cached['answer']}, "citations": cached['citations'], "cache": cached}
+
+            def remember(answer, citations):
+                if question_embedding is not None:
+                    answer_cache.get_answer_cache().store(
+                        KB_CACHE_NAMESPACE, questions, question_embedding, answer, citations, version=kb_version)
+
             try:
+                if stream:
+                    # Text and citations are rendered as they arrive instead of after the whole answer
+                    rag_stream = bedrock_agent_runtime.retrieve_and_generate_stream(
+                        bedrockClient, questions, get_rag_configuration())
+                    rag_stream.on_complete = lambda finished: remember(finished.text, finished.citations)
+                    return {"stream": rag_stream}
                 knowledgeBaseResponse = bedrockClient.retrieve_and_generate(
                     input={
                         'text': questions
                     },
-                    retrieveAndGenerateConfiguration={
-                        'type': 'KNOWLEDGE_BASE',
-                        'knowledgeBaseConfiguration': {
-                            'knowledgeBaseId': knowledgeBaseId,
-                            'modelArn': f"arn:aws:bedrock:{region}::foundation-model/{CLAUDE_MODEL_ID}",
-                            'generationConfiguration': {
-                                'inferenceConfig': {
-                                    'textInferenceConfig': {
-                                        'maxTokens': 4096,
-                                        'temperature': 0.7,
-                                        'topP': 0.9,
-                                        'stopSequences': []
-                                    }
-                                },
-                                'promptTemplate': {
-                                    "textPromptTemplate": "You are a question answering agent. I will provide you with a set of search results. The user will provide you with a question. Your job is to answer the user's question using only information from the search results. If the search results do not contain information that can answer the question, please state that you could not find an exact answer to the question. Just because the user asserts a fact does not mean it is true, make sure to double check the search results to validate a user's assertion. Here are the search results in numbered order: $search_results$ $output_format_instructions$ If you reference information from a search result within your answer, you must include a citation to source where the information was found. Each result has a corresponding source ID that you should reference. For purely quantitative data (e.g., inventory stock reports, price lists, quantity), use a tabular format. When dealing with mixed data types, combine both formats. Adjust the number of columns and rows in tables as needed to fit the data. Ensure that column headers clearly describe the data they represent. Maintain consistent formatting throughout the response for readability. Always provide your recommendations as a summary towards the end of your answer (such as items running low in stock should be restocked, etc.)."
-                                }
-                            }
-                        }
-                    }
+                    retrieveAndGenerateConfiguration=get_rag_configuration()
                 )
+                remember(knowledgeBaseResponse['output']['text'], knowledgeBaseResponse.get('citations', []))
                 return knowledgeBaseResponse
             except Exception as e:
                 st.error(f"RAG Error: {str(e)}")
@@ -92,22 +118,17 @@ def getAnswers(questions, use_rag=True):
 
 
 def get_non_rag_response(questions):
-    """Helper function for non-RAG responses"""
+    """Helper function for non-RAG responses; the answer arrives as a token stream"""
     try:
-        response = bedrockRuntime.invoke_model(
-            modelId=CLAUDE_MODEL_ID,
-            contentType='application/json',
-            accept='application/json',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 4096,
-                "messages": [
-                    {"role": "user", "content": questions}
-                ]
-            })
-        )
-        response_body = json.loads(response['body'].read())
-        return {"output": {"text": response_body['content'][0]['text']}}
+        cached, question_embedding = answer_cache.lookup_question(CLAUDE_CACHE_NAMESPACE, questions)
+        if cached:
+            return {"stream": claude_stream.ClaudeStream.from_text(cached['answer'], CLAUDE_MODEL_ID, cached['lookup_ms']),
+                    "cache": cached}
+        answer_stream = claude_stream.stream_claude(bedrockRuntime, CLAUDE_MODEL_ID, questions, max_tokens=4096)
+        if question_embedding is not None:
+            answer_stream.on_complete = lambda finished: answer_cache.get_answer_cache().store(
+                CLAUDE_CACHE_NAMESPACE, questions, question_embedding, finished.text)
+        return {"stream": answer_stream}
     except Exception as e:
         st.error(f"Non-RAG Error: {str(e)}")
         return None
@@ -120,6 +141,7 @@ def main():
     
     # Add RAG toggle to sidebar
     use_rag = st.sidebar.toggle("Use RAG")
+    stream_rag = st.sidebar.toggle("Stream RAG answers", value=True, disabled=not use_rag)
     
     tab1, tab2 = st.tabs(["Chat", "Architecture"])
     with st.sidebar:
@@ -155,13 +177,16 @@ def main():
         if not user_question and st.sidebar.button("Try sample question"):
             user_question = sample_question
 
-        # Initialize chat history
+        # Initialize chat history (bounded in memory, older turns spilled to Postgres)
         if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
+            st.session_state.chat_history = chat_store.ChatStore('knowledge_base')
+        chat_history = st.session_state.chat_history
         
-        # Display chat messages from history on app rerun
+        # Display the latest chat messages from history on app rerun
         with chat_container:
-            for message in st.session_state.chat_history:
+            if chat_history.has_earlier():
+                st.button("Load earlier messages", on_click=chat_history.show_earlier)
+            for message in chat_history.recent():
                 with st.chat_message(message['role'], avatar='static/ai_chat_icon.png' if message['role'] == 'assistant' else None):
                     st.markdown(message['text'])
 
@@ -170,26 +195,59 @@ def main():
                 with st.chat_message('user'):
                     st.markdown(user_question)
                     # Add user message to chat history
-                    st.session_state.chat_history.append({"role": 'user', "text": user_question})
+                    chat_history.append({"role": 'user', "text": user_question})
 
-                response = getAnswers(user_question, use_rag)
+                response = getAnswers(user_question, use_rag, stream=stream_rag)
                 if response:
-                    answer = response['output']['text']
-
                     # Display assistant response in chat message container
                     with st.chat_message('assistant', avatar='static/ai_chat_icon.png'):
-                        st.write_stream(stream_data(answer))
+                        if 'stream' in response:
+                            # Rendered token by token as Claude generates it
+                            try:
+                                answer = st.write_stream(response['stream'])
+                            except Exception as e:
+                                answer = response['stream'].text
+                                st.error(f"The response stream was interrupted: {str(e)}")
+                        else:
+                            answer = response['output']['text']
+                            st.markdown(answer)
+
+                        chat_history.append({"role": 'assistant', "text": f"Claude 3.5 ({'RAG' if use_rag else 'Non-RAG'}): {answer}"})
 
-                        st.session_state.chat_history.append({"role": 'assistant', "text": f"Claude 3.5 ({'RAG' if use_rag else 'Non-RAG'}): {answer}"})
+                        if 'cache' in response:
+                            st.caption(f"Served from the answer cache in {response['cache']['lookup_ms']:.0f} ms "
+                                       f"(similarity {response['cache']['similarity']:.3f} to \"{response['cache']['question']}\")")
 
-                        if use_rag and 'citations' in response:
+                        rag_stream = response.get('stream')
+                        if 'faq' in response:
+                            faq = response['faq']
+                            st.markdown(f"<span style='color:#FFDA33'>Source: </span>{faq['source']}, FAQ #{faq['no']} "
+                                        f"(\"{faq['question']}\")", unsafe_allow_html=True)
+                            st.caption(f"Curated FAQ answer in {faq['lookup_ms']:.0f} ms (similarity {faq['similarity']:.3f})")
+                        elif isinstance(rag_stream, bedrock_agent_runtime.RagStream):
+                            # The [n] markers in the answer point at these references
+                            if rag_stream.references:
+                                for number, ref in enumerate(rag_stream.references, start=1):
+                                    doc_url = ref.get('location', {}).get('s3Location', {}).get('uri', 'unknown source')
+                                    st.markdown(f"<span style='color:#FFDA33'>[{number}] Source Document: </span>{doc_url}", unsafe_allow_html=True)
+                            else:
+                                st.markdown(f"<span style='color:#808080'>No relevant sources found in the knowledge base.</span>", unsafe_allow_html=True)
+                            if rag_stream.retrieval_ms is not None:
+                                st.caption(f"Retrieval (until first token): {rag_stream.retrieval_ms:.0f} ms · "
+                                           f"Generation: {rag_stream.generation_ms:.0f} ms")
+                        elif use_rag and 'citations' in response:
                             try:
-                                references = response.get('citations', [{}])[0].get('retrievedReferences', [])
+                                # Every citation's references, deduplicated in first-seen order (the same
+                                # numbering as the [n] markers in streamed answers)
+                                references = list(dict.fromkeys(
+                                    ref['location']['s3Location']['uri']
+                                    for citation in response['citations']
+                                    for ref in citation.get('retrievedReferences', [])
+                                    if 's3Location' in ref.get('location', {})
+                                ))
                                 if references:
-                                    for ref in references:
-                                        if 'location' in ref and 's3Location' in ref['location']:
-                                            doc_url = ref['location']['s3Location']['uri']
-                                            st.markdown(f"<span style='color:#FFDA33'>Source Document: </span>{doc_url}", unsafe_allow_html=True)
+                                    for number, doc_url in enumerate(references, start=1):
+                                        st.markdown(f"<span style='color:#FFDA33'>[{number}] Source Document: </span>{doc_url}", unsafe_allow_html=True)
                                 else:
                                     st.markdown(f"<span style='color:#808080'>No relevant sources found in the knowledge base.</span>", unsafe_allow_html=True)
                             except Exception as e:
@@ -204,6 +262,12 @@ def main():
     with tab2:
         st.image('static/knowledge-base-rag-architecture.png', use_container_width=True)
     
+    with st.sidebar.expander("Answer Cache Stats"):
+        st.json(answer_cache.get_answer_cache().stats())
+
+    with st.sidebar.expander("Chat History Memory"):
+        st.json(chat_history.stats())
+
     # Add version info
     st.sidebar.divider()
     st.sidebar.caption(f"""
@@ -215,30 +279,25 @@ def main():
 
 with st.sidebar:
     def clear_chat_history():
-        st.session_state.chat_history = []
+        if 'chat_history' in st.session_state:
+            st.session_state.chat_history.clear()
         st.session_state.conversation = []
 
     def delete_documents_s3():
         try:
-            # Create S3 client with explicit region
-            s3 = boto3.resource('s3', region_name=os.environ.get('AWS_REGION', 'us-west-2'))
-            bucket = s3.Bucket(os.environ['S3_KB_BUCKET'])
-        
-            # Delete all objects in the bucket
-            bucket.objects.all().delete()
+            s3 = aws_clients.get_client('s3', region, profile='admin')
+            bucket = os.environ['S3_KB_BUCKET']
+
+            # Delete all objects in the bucket, up to 1000 keys per request
+            for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+                keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+                if keys:
+                    s3.delete_objects(Bucket=bucket, Delete={'Objects': keys, 'Quiet': True})
             st.success('Documents deleted successfully! ✅')
-        
-            # Create Lambda client with explicit region
-            lambda_client = boto3.client(
-                'lambda',
-                region_name=os.environ.get('AWS_REGION', 'us-west-2'),
-                config=Config(
-                    retries={
-                        'max_attempts': 3,
-                        'mode': 'standard'
-                    }
-                )
-            )
+            # Answers grounded on the deleted documents must not be served again
+            answer_cache.get_answer_cache().invalidate(KB_CACHE_NAMESPACE)
+
+            lambda_client = aws_clients.get_client('lambda', region, profile='admin')
         
             function_name = os.environ.get('LAMBDA_FUNCTION_NAME')
         
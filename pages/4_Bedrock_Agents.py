@@ -1,7 +1,7 @@
-import json
 import os
 import base64
-from services import bedrock_agent_runtime
+from botocore.exceptions import ClientError
+from services import agent_trace, bedrock_agent_runtime, chat_store, citations
 import streamlit as st
 import uuid
 from dotenv import load_dotenv
@@ -17,7 +17,7 @@ agent_alias_id = os.environ.get('BEDROCK_AGENT_ALIAS_ID')
 def init_state():
     st.session_state['key'] = 'value'
     st.session_state.session_id = str(uuid.uuid4())
-    st.session_state.messages = []
+    st.session_state.messages.clear()
     st.session_state.citations = []
     st.session_state.trace = {}
 
@@ -35,8 +35,28 @@ def get_base64_of_bin_file(bin_file):
     data = f.read()
     return base64.b64encode(data).decode()
 
+def describe_trace_step(trace_type, step):
+    """One-line status label for a trace event, or None for events not worth showing"""
+    if trace_type == "preProcessingTrace":
+        return "Pre-processing the request..."
+    if trace_type == "postProcessingTrace":
+        return "Post-processing the response..."
+    if "rationale" in step:
+        return "Reasoning: " + step["rationale"].get("text", "")[:150]
+    if "invocationInput" in step:
+        invocation = step["invocationInput"]
+        if "actionGroupInvocationInput" in invocation:
+            action = invocation["actionGroupInvocationInput"]
+            return f"Calling {action.get('actionGroupName', 'action group')} {action.get('function') or action.get('apiPath', '')}"
+        if "knowledgeBaseLookupInput" in invocation:
+            return "Searching the knowledge base..."
+    if "observation" in step:
+        return f"Received {step['observation'].get('type', 'result').replace('_', ' ').lower()}"
+    return None
+
+# Chat messages, bounded in memory with older turns spilled to Postgres
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = chat_store.ChatStore('agents')
 
 if "trace" not in st.session_state:
     st.session_state.trace = {}
@@ -89,8 +109,10 @@ with tab1:
         st.session_state.chat_history = []
 
     with chat_container:
-        # Messages in the conversation
-        for message in st.session_state.messages:
+        # Latest messages in the conversation
+        if st.session_state.messages.has_earlier():
+            st.button("Load earlier messages", on_click=st.session_state.messages.show_earlier)
+        for message in st.session_state.messages.recent():
             with st.chat_message(message["role"]):
                 st.markdown(message["content"], unsafe_allow_html=True)
 
@@ -101,38 +123,46 @@ with tab1:
                 st.markdown(user_question)
 
             with st.chat_message("assistant"):
-                with st.status("Thinking...", state="running", expanded=False) as status:
-                    placeholder = st.empty()
-                    placeholder.markdown("...")
-                    response = bedrock_agent_runtime.invoke_agent(
+                status = st.status("Thinking...", state="running", expanded=False)
+                placeholder = st.empty()
+                placeholder.markdown("...")
+                # Render orchestration steps and answer text as the agent emits them. A Streamlit
+                # rerun (e.g. a new question) stops this loop and closes the agent stream.
+                agent_stream = None
+                try:
+                    # Throttling and access errors are raised here, when the turn is started
+                    agent_stream = bedrock_agent_runtime.stream_agent(
                         agent_id,
                         agent_alias_id,
                         st.session_state.session_id,
                         user_question
                     )
-                    status.update(label="", state="complete", expanded=True)
-                
+                    for event in agent_stream:
+                        if event["type"] == "text":
+                            placeholder.markdown(agent_stream.output_text + " ▌", unsafe_allow_html=True)
+                        elif event["type"] == "trace":
+                            label = describe_trace_step(event["trace_type"], event["trace"])
+                            if label:
+                                status.update(label=label)
+                                status.write(label)
+                    status.update(label="Done", state="complete", expanded=False)
+                except bedrock_agent_runtime.AgentTimeoutError as e:
+                    status.update(label=str(e), state="error", expanded=False)
+                except ClientError as e:
+                    status.update(label=f"Agent error: {e}", state="error", expanded=False)
+                if agent_stream is not None:
+                    response = agent_stream.result()
+                else:
+                    response = {"output_text": "", "citations": [], "trace": {}}
+
                 output_text = response["output_text"]
 
-                # Add citations
-                if len(response["citations"]) > 0:
-                    citation_num = 1
-                    num_citation_chars = 0
-                    citation_locs = ""
-                    for citation in response["citations"]:
-                        end_span = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
-                        for retrieved_ref in citation["retrievedReferences"]:
-                            citation_marker = f"[{citation_num}]"
-                            output_text = output_text[:end_span + num_citation_chars] + citation_marker + output_text[end_span + num_citation_chars:]
-                            citation_locs = citation_locs + "\n<br>" + citation_marker + " " + retrieved_ref["location"]["s3Location"]["uri"]
-                            citation_num = citation_num + 1
-                            num_citation_chars = num_citation_chars + len(citation_marker)
-                        output_text = output_text[:end_span + num_citation_chars] + "\n" + output_text[end_span + num_citation_chars:]
-                        num_citation_chars = num_citation_chars + 1
-                    output_text = output_text + "\n" + citation_locs
+                # Add citation markers and the reference list
+                output_text = citations.format_citations(output_text, response["citations"])
 
                 placeholder.markdown(output_text, unsafe_allow_html=True)
                 st.session_state.messages.append({"role": "assistant", "content": output_text})
+                st.session_state.response_id = str(uuid.uuid4())
                 st.session_state.citations = response["citations"]
                 st.session_state.trace = response["trace"]
 
@@ -141,58 +171,54 @@ with tab1:
 with tab2:
     st.image('static/bedrock-agent-architecture.png', use_container_width=True)
 
-trace_type_headers = {
-    "preProcessingTrace": "Pre-Processing",
-    "orchestrationTrace": "Orchestration",
-    "postProcessingTrace": "Post-Processing"
-}
-trace_info_types = ["invocationInput", "modelInvocationInput", "modelInvocationOutput", "observation", "rationale"]
+def get_trace_view():
+    """Trace viewer for the latest response, built once and reused across reruns"""
+    view = st.session_state.get("trace_view")
+    if view is None or view.trace is not st.session_state.trace:
+        view = agent_trace.TraceView(st.session_state.get("response_id", ""), st.session_state.trace, st.session_state.citations)
+        st.session_state.trace_view = view
+    return view
+
+def show_json_pages(pages, key):
+    """Show serialized JSON, one page at a time if it is long"""
+    page = 1
+    if len(pages) > 1:
+        page = st.number_input(f"Page (1-{len(pages)})", min_value=1, max_value=len(pages), key=key)
+    st.code(pages[page - 1], language="json", line_numbers=True)
 
 # Sidebar section for trace
 with st.sidebar:
     st.divider()
     st.title("Trace")
+    trace_view = get_trace_view()
 
     # Show each trace types in separate sections
     step_num = 1
-    for trace_type in trace_type_headers:
-        st.subheader(trace_type_headers[trace_type])
-
-        # Organize traces by step similar to how it is shown in the Bedrock console
-        if trace_type in st.session_state.trace:
-            trace_steps = {}
-            for trace in st.session_state.trace[trace_type]:
-                # Each trace type and step may have different information for the end-to-end flow
-                for trace_info_type in trace_info_types:
-                    if trace_info_type in trace:
-                        trace_id = trace[trace_info_type]["traceId"]
-                        if trace_id not in trace_steps:
-                            trace_steps[trace_id] = [trace]
-                        else:
-                            trace_steps[trace_id].append(trace)
-                        break
-
-            # Show trace steps in JSON similar to the Bedrock console
-            for trace_id in trace_steps.keys():
+    for trace_type, header in agent_trace.TRACE_TYPE_HEADERS.items():
+        st.subheader(header)
+
+        # Traces are organized by step similar to how it is shown in the Bedrock console
+        if trace_type in trace_view.sections:
+            for step_index in range(len(trace_view.sections[trace_type])):
                 with st.expander("Trace Step " + str(step_num), expanded=False):
-                    for trace in trace_steps[trace_id]:
-                        trace_str = json.dumps(trace, indent=2)
-                        st.code(trace_str, language="json", line_numbers=trace_str.count("\n"))
+                    # Expander bodies run even when collapsed, so the JSON is only built and sent on request
+                    key = f"trace_{trace_view.response_id}_{trace_type}_{step_index}"
+                    if st.toggle("Show trace JSON", key=key):
+                        for event_num, pages in enumerate(trace_view.step_pages(trace_type, step_index)):
+                            show_json_pages(pages, key=f"{key}_{event_num}_page")
                 step_num = step_num + 1
         else:
             st.text("None")
 
     st.subheader("Citations")
-    if len(st.session_state.citations) > 0:
-        citation_num = 1
-        for citation in st.session_state.citations:
-            for retrieved_ref_num, retrieved_ref in enumerate(citation["retrievedReferences"]):
-                with st.expander("Citation [" + str(citation_num) + "]", expanded=False):
-                    citation_str = json.dumps({
-                        "generatedResponsePart": citation["generatedResponsePart"],
-                        "retrievedReference": citation["retrievedReferences"][retrieved_ref_num]
-                    }, indent=2)
-                    st.code(citation_str, language="json", line_numbers=trace_str.count("\n"))
-                citation_num = citation_num + 1
+    if len(trace_view.citation_refs) > 0:
+        for index in range(len(trace_view.citation_refs)):
+            with st.expander(trace_view.citation_label(index), expanded=False):
+                key = f"citation_{trace_view.response_id}_{index}"
+                if st.toggle("Show citation JSON", key=key):
+                    show_json_pages(trace_view.citation_pages(index), key=f"{key}_page")
     else:
-        st.text("None")
\ No newline at end of file
+        st.text("None")
+
+    with st.expander("Chat History Memory"):
+        st.json(st.session_state.messages.stats())
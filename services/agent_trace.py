@@ -0,0 +1,97 @@
+"""
+Trace and citation viewer model for the Agents page sidebar.
+
+Orchestration traces for a multi-step agent run can be hundreds of KB. A
+TraceView is built once per agent response: steps are grouped by traceId when
+it is built, and each step or citation is serialized to indented JSON the first
+time it is opened, then kept. Reruns that only redraw the sidebar (any widget
+interaction) reuse it instead of regrouping and re-serializing everything.
+Serialized bodies are split into pages of about JSON_PAGE_CHARS characters so a
+large model invocation payload (whose prompt is one long escaped JSON string) is
+not sent to the browser in one block.
+"""
+import json
+import os
+
+from services.citations import reference_uri
+
+TRACE_TYPE_HEADERS = {
+    "preProcessingTrace": "Pre-Processing",
+    "orchestrationTrace": "Orchestration",
+    "postProcessingTrace": "Post-Processing"
+}
+TRACE_INFO_TYPES = ["invocationInput", "modelInvocationInput", "modelInvocationOutput", "observation", "rationale"]
+
+JSON_PAGE_CHARS = int(os.environ.get('TRACE_JSON_PAGE_CHARS', '20000'))
+
+
+def group_trace_steps(traces):
+    """Group the trace events of one trace type by traceId, in first-seen order"""
+    trace_steps = {}
+    for trace in traces:
+        # Each trace type and step may have different information for the end-to-end flow
+        for trace_info_type in TRACE_INFO_TYPES:
+            if trace_info_type in trace:
+                trace_steps.setdefault(trace[trace_info_type]["traceId"], []).append(trace)
+                break
+    return list(trace_steps.values())
+
+
+def paginate(text, page_chars=JSON_PAGE_CHARS):
+    """Split text into pages of at most page_chars characters, at line breaks where possible"""
+    pages = []
+    while len(text) > page_chars:
+        cut = text.rfind("\n", 0, page_chars)
+        if cut <= 0:
+            # A single line longer than a page
+            pages.append(text[:page_chars])
+            text = text[page_chars:]
+        else:
+            pages.append(text[:cut])
+            text = text[cut + 1:]
+    pages.append(text)
+    return pages
+
+
+class TraceView:
+    def __init__(self, response_id, trace, citations):
+        self.response_id = response_id
+        self.trace = trace
+        self.citations = citations
+        # {trace_type: [[trace, ...] per step]}, grouped once
+        self.sections = {
+            trace_type: group_trace_steps(trace[trace_type])
+            for trace_type in TRACE_TYPE_HEADERS if trace_type in trace
+        }
+        # One entry per retrieved reference, with the reference number the answer text uses
+        self.citation_refs = []
+        numbers = {}
+        for citation in citations:
+            for reference in citation.get("retrievedReferences", []):
+                number = numbers.setdefault(reference_uri(reference), len(numbers) + 1)
+                self.citation_refs.append((citation, reference, number))
+        self._pages = {}
+
+    def step_pages(self, trace_type, step_index):
+        """Pages of indented JSON for each trace event of a step: [[page, ...] per event]"""
+        key = ("step", trace_type, step_index)
+        if key not in self._pages:
+            self._pages[key] = [
+                paginate(json.dumps(trace, indent=2))
+                for trace in self.sections[trace_type][step_index]
+            ]
+        return self._pages[key]
+
+    def citation_pages(self, index):
+        """Pages of indented JSON for one retrieved reference and the text it supports"""
+        key = ("citation", index)
+        if key not in self._pages:
+            citation, reference, _ = self.citation_refs[index]
+            self._pages[key] = paginate(json.dumps({
+                "generatedResponsePart": citation["generatedResponsePart"],
+                "retrievedReference": reference
+            }, indent=2))
+        return self._pages[key]
+
+    def citation_label(self, index):
+        return f"Citation [{self.citation_refs[index][2]}]"
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from services import aws_clients, database, embedding_cache, schema
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+# Minimum cosine similarity between the new and the cached question for a hit
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', '0.92'))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '86400'))
+# Per namespace; least recently hit entries are evicted first
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '5000'))
+# How long a knowledge base bucket fingerprint is trusted before S3 is listed again
+FINGERPRINT_TTL_SECONDS = float(os.environ.get('ANSWER_CACHE_FINGERPRINT_TTL_SECONDS', '60'))
+
+# Eviction keeps each namespace small enough that an exact scan is a few milliseconds,
+# so lookups need no ANN index (and cannot miss a match the way a filtered HNSW scan can)
+LOOKUP_SQL = """
+SELECT id, question, answer, citations, 1 - (embedding <=> %(embedding)s::vector) AS similarity
+FROM bedrock_integration.answer_cache
+WHERE namespace = %(namespace)s AND version = %(version)s
+AND created_at > CURRENT_TIMESTAMP - make_interval(secs => %(ttl)s)
+ORDER BY embedding <=> %(embedding)s::vector
+LIMIT 1
+"""
+
+EVICT_SQL = """
+DELETE FROM bedrock_integration.answer_cache
+WHERE namespace = %(namespace)s
+AND (created_at <= CURRENT_TIMESTAMP - make_interval(secs => %(ttl)s)
+     OR id IN (SELECT id FROM bedrock_integration.answer_cache
+               WHERE namespace = %(namespace)s
+               ORDER BY last_hit_at DESC OFFSET %(max_entries)s))
+"""
+
+
+def invoke_embedding_model(text):
+    response = aws_clients.get_client('bedrock-runtime', profile='embedding').invoke_model(
+        body=json.dumps({"inputText": text}),
+        modelId=embedding_cache.EMBEDDING_MODEL_ID,
+        accept='application/json',
+        contentType='application/json'
+    )
+    return np.array(json.loads(response['body'].read())['embedding'], dtype=np.float32)
+
+
+def embed_question(text):
+    return embedding_cache.get_embedding_cache().get_or_compute(text, invoke_embedding_model)
+
+
+def content_version(*parts):
+    """Short digest of whatever the cached answer depends on (prompt data, retrieved product ids, ...)"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+_fingerprints = {}
+_refreshing = set()
+_fingerprint_lock = threading.Lock()
+
+
+def bucket_fingerprint(bucket, namespace):
+    """
+    Digest of every key and ETag in the knowledge base bucket, used as the
+    namespace's cache version; when it changes (any upload, overwrite or delete)
+    the namespace's older answers are dropped. Only the first call per bucket
+    lists S3 on the caller's thread. Once the fingerprint is older than
+    FINGERPRINT_TTL_SECONDS it is still returned, and a background thread lists
+    the bucket again.
+    """
+    cached = _fingerprints.get(bucket)
+    if cached is None:
+        return _list_fingerprint(bucket, namespace)
+    if time.time() - cached[0] >= FINGERPRINT_TTL_SECONDS:
+        with _fingerprint_lock:
+            start_refresh = bucket not in _refreshing
+            _refreshing.add(bucket)
+        if start_refresh:
+            threading.Thread(target=_refresh_fingerprint, args=(bucket, namespace),
+                             name=f"fingerprint-{bucket}", daemon=True).start()
+    return cached[1]
+
+
+def _refresh_fingerprint(bucket, namespace):
+    try:
+        _list_fingerprint(bucket, namespace)
+    except Exception as e:
+        logger.warning(f"Could not refresh the fingerprint of s3://{bucket}: {e}")
+    finally:
+        with _fingerprint_lock:
+            _refreshing.discard(bucket)
+
+
+def _list_fingerprint(bucket, namespace):
+    cached = _fingerprints.get(bucket)
+    digest = hashlib.sha256()
+    s3 = aws_clients.get_client('s3', profile='admin')
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            digest.update(f"{obj['Key']}|{obj['ETag']}\n".encode())
+    fingerprint = digest.hexdigest()[:16]
+    if cached is None or cached[1] != fingerprint:
+        get_answer_cache().invalidate(namespace, keep_version=fingerprint)
+    _fingerprints[bucket] = (time.time(), fingerprint)
+    return fingerprint
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers in bedrock_integration.answer_cache.
+
+    Entries are grouped by namespace (which page/model produced them) and
+    version (what the answer was grounded on). A lookup returns the most similar
+    cached question in the same namespace and version if it is within the
+    similarity threshold and younger than the TTL. All failures are logged and
+    treated as misses, so Q&A keeps working without the cache.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, enabled=ANSWER_CACHE_ENABLED):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def lookup(self, namespace, question_embedding, version=''):
+        """Return {'question', 'answer', 'citations', 'similarity', 'lookup_ms'} on a hit, else None"""
+        if not self.enabled:
+            return None
+        start_time = time.time()
+        try:
+            schema.ensure_schema()
+            with database.connection() as conn:
+                row = conn.execute(LOOKUP_SQL, {
+                    'embedding': np.asarray(question_embedding).tolist(), 'namespace': namespace,
+                    'version': version, 'ttl': self.ttl_seconds,
+                }).fetchone()
+                if row and row[4] >= self.threshold:
+                    conn.execute("""
+                        UPDATE bedrock_integration.answer_cache
+                        SET last_hit_at = CURRENT_TIMESTAMP, hit_count = hit_count + 1
+                        WHERE id = %s
+                    """, (row[0],))
+                    with self._lock:
+                        self.hits += 1
+                    return {'question': row[1], 'answer': row[2], 'citations': row[3], 'similarity': row[4],
+                            'lookup_ms': (time.time() - start_time) * 1000}
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, namespace, question, question_embedding, answer, citations=None, version=''):
+        if not self.enabled or not answer:
+            return
+        try:
+            schema.ensure_schema()
+            with database.connection() as conn:
+                params = {'namespace': namespace, 'ttl': self.ttl_seconds, 'max_entries': self.max_entries}
+                conn.execute(EVICT_SQL, params)
+                conn.execute("""
+                    INSERT INTO bedrock_integration.answer_cache
+                    (namespace, version, question, embedding, answer, citations)
+                    VALUES (%s, %s, %s, %s::vector, %s, %s::jsonb)
+                """, (namespace, version, question, np.asarray(question_embedding).tolist(), answer,
+                      json.dumps(citations or [], default=str)))
+            with self._lock:
+                self.stores += 1
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    def invalidate(self, namespace=None, keep_version=None):
+        """Drop every cached answer, or one namespace's (optionally all but keep_version)"""
+        try:
+            schema.ensure_schema()
+            with database.connection() as conn:
+                if namespace is None:
+                    conn.execute("DELETE FROM bedrock_integration.answer_cache")
+                else:
+                    conn.execute("""
+                        DELETE FROM bedrock_integration.answer_cache
+                        WHERE namespace = %s AND version IS DISTINCT FROM %s
+                    """, (namespace, keep_version))
+            if namespace is None or keep_version is None:
+                _fingerprints.clear()
+        except Exception as e:
+            logger.warning(f"Answer cache invalidation failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'threshold': self.threshold,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Process-wide cache instance shared by all pages and sessions"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
+
+
+def lookup_question(namespace, question, version=''):
+    """
+    Embed question and look it up. Returns (hit or None, question embedding);
+    the embedding is None if it could not be computed, in which case the answer
+    should not be stored either.
+    """
+    try:
+        question_embedding = embed_question(question)
+    except Exception as e:
+        logger.warning(f"Answer cache could not embed the question: {e}")
+        return None, None
+    return get_answer_cache().lookup(namespace, question_embedding, version), question_embedding
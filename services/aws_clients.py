@@ -0,0 +1,67 @@
+"""
+Process-wide AWS clients.
+
+boto3 clients are thread-safe and keep a pool of warm (TLS, keep-alive)
+connections, so they are created once per (service, region, call profile) and
+shared by every page and Streamlit session. Creating a client costs tens of
+milliseconds and starts with a cold connection pool.
+
+Each call profile sets connect/read timeouts suited to that kind of call; all
+clients use adaptive retries (client-side rate limiting on throttling), TCP
+keep-alive and a connection pool sized by AWS_MAX_POOL_CONNECTIONS (default 50).
+Settings are read from the environment when a client is first created, so
+pages can call load_dotenv() after importing this module.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Call profile -> timeouts in seconds
+CALL_PROFILES = {
+    'default': {'connect_timeout': 5, 'read_timeout': 60},
+    # Titan embeddings return in well under a second; fail fast and retry
+    'embedding': {'connect_timeout': 2, 'read_timeout': 10},
+    # Streaming generation: read_timeout bounds the gap between chunks, not the whole answer
+    'generation': {'connect_timeout': 5, 'read_timeout': 120},
+    'agent': {'connect_timeout': 5, 'read_timeout': 60},
+    'admin': {'connect_timeout': 5, 'read_timeout': 30},
+}
+
+_clients = {}
+_sessions = {}
+_lock = threading.Lock()
+
+
+def build_config(region_name, profile='default', **overrides):
+    settings = {
+        'region_name': region_name,
+        'max_pool_connections': int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50')),
+        'tcp_keepalive': True,
+        'retries': {'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '3')), 'mode': 'adaptive'},
+        **CALL_PROFILES[profile],
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_client(service_name, region_name=None, profile='default', **overrides):
+    """
+    Cached client for service_name. overrides are botocore Config arguments
+    (e.g. read_timeout, retries) and get their own cached client.
+    """
+    region_name = region_name or os.environ.get('AWS_REGION', 'us-west-2')
+    key = (service_name, region_name, profile, repr(sorted(overrides.items())))
+    client = _clients.get(key)
+    if client is None:
+        # boto3 sessions are not thread-safe, so clients are created under the lock
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                session = _sessions.get(region_name)
+                if session is None:
+                    session = _sessions[region_name] = boto3.session.Session(region_name=region_name)
+                client = session.client(service_name, config=build_config(region_name, profile, **overrides))
+                _clients[key] = client
+    return client
@@ -1,45 +1,232 @@
-import boto3
+import codecs
 import os
-from botocore.exceptions import ClientError
+import queue
+import threading
+import time
+from botocore.exceptions import ConnectionError as BotocoreConnectionError, ReadTimeoutError
+from urllib3.exceptions import ProtocolError, ReadTimeoutError as Urllib3ReadTimeoutError
+
+from services import aws_clients
+
+TRACE_TYPES = ["preProcessingTrace", "orchestrationTrace", "postProcessingTrace"]
+# Upper bound on a whole agent turn, and on the wait for any single event
+AGENT_TIMEOUT_SECONDS = float(os.environ.get('BEDROCK_AGENT_TIMEOUT_SECONDS', '120'))
+AGENT_READ_TIMEOUT_SECONDS = 60
+# How often a wait for the next event wakes up to check cancel_event
+CANCEL_POLL_SECONDS = 0.5
+# Read timeouts and dropped connections while the event stream is being read
+STREAM_ERRORS = (ReadTimeoutError, BotocoreConnectionError, Urllib3ReadTimeoutError, ProtocolError, TimeoutError)
+
+
+class AgentTimeoutError(TimeoutError):
+    pass
+
+
+class AgentStream:
+    """
+    Iterable over an invoke_agent completion stream. Yields events as they arrive:
+
+        {"type": "text", "text": ...}
+        {"type": "citations", "citations": [...]}
+        {"type": "trace", "trace_type": ..., "trace": {...}}
+
+    while collecting them, so result() returns the same dict invoke_agent always
+    has. Text parts are joined once and citations extended in place, so assembly
+    is linear in the answer length. Iteration stops early (and the HTTP stream is
+    closed) when cancel_event is set. It raises AgentTimeoutError once the turn has
+    run longer than timeout seconds, even if the stream has stalled (events are
+    read on a helper thread so the wait itself is bounded), and when the stream
+    fails with a read timeout or a dropped connection.
+    """
+
+    def __init__(self, response, timeout=AGENT_TIMEOUT_SECONDS, cancel_event=None):
+        self.citations = []
+        self.trace = {}
+        self.cancelled = False
+        self._completion = response.get("completion")
+        self._parts = []
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._deadline = time.time() + timeout
+        self._timeout = timeout
+        self._cancel_event = cancel_event
+        self._consumed = False
+
+    @property
+    def output_text(self):
+        return "".join(self._parts)
+
+    def _read_events(self, events):
+        """Helper thread: move stream events onto the queue, then a sentinel (or the error)"""
+        try:
+            for event in self._completion:
+                events.put(("event", event))
+            events.put(("end", None))
+        except Exception as e:
+            events.put(("error", e))
+
+    def _events(self):
+        """Completion events, waiting no longer than the deadline for each one"""
+        events = queue.Queue()
+        threading.Thread(target=self._read_events, args=(events,), daemon=True, name="agent-stream").start()
+        while True:
+            if self._cancel_event is not None and self._cancel_event.is_set():
+                self.cancelled = True
+                return
+            remaining = self._deadline - time.time()
+            if remaining <= 0:
+                raise AgentTimeoutError(f"Agent did not finish within {self._timeout:.0f}s")
+            try:
+                kind, value = events.get(timeout=min(remaining, CANCEL_POLL_SECONDS))
+            except queue.Empty:
+                continue
+            if kind == "end":
+                return
+            if kind == "error":
+                if isinstance(value, STREAM_ERRORS):
+                    raise AgentTimeoutError(f"Agent stream was interrupted: {value}") from value
+                raise value
+            yield value
+
+    def __iter__(self):
+        if self._consumed:
+            return
+        self._consumed = True
+        try:
+            for event in self._events():
+                # Combine the chunks to get the output text
+                if "chunk" in event:
+                    chunk = event["chunk"]
+                    text = self._decoder.decode(chunk.get("bytes", b""))
+                    if text:
+                        self._parts.append(text)
+                        yield {"type": "text", "text": text}
+                    if "attribution" in chunk:
+                        citations = chunk["attribution"]["citations"]
+                        self.citations.extend(citations)
+                        yield {"type": "citations", "citations": citations}
+
+                # Extract trace information from all events
+                if "trace" in event:
+                    for trace_type in TRACE_TYPES:
+                        if trace_type in event["trace"]["trace"]:
+                            step = event["trace"]["trace"][trace_type]
+                            self.trace.setdefault(trace_type, []).append(step)
+                            yield {"type": "trace", "trace_type": trace_type, "trace": step}
+            tail = self._decoder.decode(b"", final=True)
+            if tail:
+                self._parts.append(tail)
+                yield {"type": "text", "text": tail}
+        finally:
+            # Releases the connection when the caller stops early (cancel, timeout, Streamlit rerun);
+            # this also ends the helper thread's read
+            close = getattr(self._completion, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass  # never mask the error (or the early exit) that got us here
+
+    def result(self):
+        """Drain whatever is left and return {"output_text", "citations", "trace"}"""
+        for _ in self:
+            pass
+        return {
+            "output_text": self.output_text,
+            "citations": self.citations,
+            "trace": self.trace
+        }
+
+
+def stream_agent(agent_id, agent_alias_id, session_id, prompt, timeout=AGENT_TIMEOUT_SECONDS, cancel_event=None):
+    """Start an agent turn and return an AgentStream over its events"""
+    # Cached per process, so agent turns reuse warm connections
+    client = aws_clients.get_client("bedrock-agent-runtime", profile="agent",
+                                    read_timeout=min(timeout, AGENT_READ_TIMEOUT_SECONDS))
+    # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/invoke_agent.html
+    response = client.invoke_agent(
+        agentId=agent_id,
+        agentAliasId=agent_alias_id,
+        enableTrace=True,
+        sessionId=session_id,
+        inputText=prompt,
+    )
+    return AgentStream(response, timeout=timeout, cancel_event=cancel_event)
+
 
 def invoke_agent(agent_id, agent_alias_id, session_id, prompt):
-    try:
-        region = os.environ.get('AWS_REGION', 'us-west-2')
-        client = boto3.session.Session(region_name=region).client(service_name="bedrock-agent-runtime")
-        # See https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/bedrock-agent-runtime/client/invoke_agent.html
-        response = client.invoke_agent(
-            agentId=agent_id,
-            agentAliasId=agent_alias_id,
-            enableTrace=True,
-            sessionId=session_id,
-            inputText=prompt,
-        )
-
-        output_text = ""
-        citations = []
-        trace = {}
-
-        for event in response.get("completion"):
-            # Combine the chunks to get the output text
-            if "chunk" in event:
-                chunk = event["chunk"]
-                output_text += chunk["bytes"].decode()
-                if "attribution" in chunk:
-                    citations = citations + chunk["attribution"]["citations"]
-
-            # Extract trace information from all events
-            if "trace" in event:
-                for trace_type in ["preProcessingTrace", "orchestrationTrace", "postProcessingTrace"]:
-                    if trace_type in event["trace"]["trace"]:
-                        if trace_type not in trace:
-                            trace[trace_type] = []
-                        trace[trace_type].append(event["trace"]["trace"][trace_type])
-
-    except ClientError as e:
-        raise
-
-    return {
-        "output_text": output_text,
-        "citations": citations,
-        "trace": trace
-    }
+    return stream_agent(agent_id, agent_alias_id, session_id, prompt).result()
+
+
+class RagStream:
+    """
+    Iterable over a retrieve_and_generate_stream response. Yields answer text as
+    it arrives, plus a " [n]" marker after each passage once its citation event
+    lands; the numbered references are collected in .references.
+
+    Timings: retrieval_ms runs from the request to the first output event (the
+    service does not report retrieval separately, so this also includes the
+    model's first-token latency); generation_ms runs from there to the end.
+    on_complete, if set, is called with the stream once it has been read to the end.
+    """
+
+    def __init__(self, response, start_time):
+        self.session_id = response.get("sessionId")
+        self.text = ""
+        self.citations = []
+        self.references = []
+        self.retrieval_ms = None
+        self.generation_ms = None
+        self.on_complete = None
+        self._events = response["stream"]
+        self._start_time = start_time
+        self._reference_numbers = {}
+
+    def _reference_number(self, reference):
+        uri = reference.get("location", {}).get("s3Location", {}).get("uri")
+        key = uri or reference.get("content", {}).get("text")
+        if key not in self._reference_numbers:
+            self._reference_numbers[key] = len(self.references) + 1
+            self.references.append(reference)
+        return self._reference_numbers[key]
+
+    def __iter__(self):
+        parts = []
+        first_event_time = None
+        completed = False
+        try:
+            for event in self._events:
+                if first_event_time is None and ("output" in event or "citation" in event):
+                    first_event_time = time.time()
+                    self.retrieval_ms = (first_event_time - self._start_time) * 1000
+                if "output" in event:
+                    parts.append(event["output"]["text"])
+                    yield event["output"]["text"]
+                elif "citation" in event:
+                    # Newer responses put the fields on the event itself; older ones nest them under "citation"
+                    citation = event["citation"]
+                    if "retrievedReferences" not in citation:
+                        citation = citation.get("citation", {})
+                    self.citations.append(citation)
+                    numbers = sorted({self._reference_number(reference)
+                                      for reference in citation.get("retrievedReferences", [])})
+                    if numbers:
+                        marker = " " + "".join(f"[{number}]" for number in numbers)
+                        parts.append(marker)
+                        yield marker
+            completed = True
+        finally:
+            self.text = "".join(parts)
+            if first_event_time is not None:
+                self.generation_ms = (time.time() - first_event_time) * 1000
+        if completed and self.on_complete is not None:
+            self.on_complete(self)
+
+
+def retrieve_and_generate_stream(client, input_text, configuration):
+    """Start a streaming RAG call against a knowledge base; errors in the request itself are raised here"""
+    start_time = time.time()
+    response = client.retrieve_and_generate_stream(
+        input={'text': input_text},
+        retrieveAndGenerateConfiguration=configuration,
+    )
+    return RagStream(response, start_time)
@@ -0,0 +1,159 @@
+"""
+Bounded per-session chat history for the knowledge base and agent pages.
+
+A ChatStore keeps only the most recent messages in session memory, at most
+CHAT_WINDOW_MESSAGES of them and CHAT_MAX_MEMORY_BYTES in total (the latest
+message always stays, even if it is larger on its own). Older messages
+are spilled to bedrock_integration.chat_history. Pages render the last few
+messages (CHAT_RENDER_MESSAGES) and read anything older back from Postgres only
+when the user asks for it with "Load earlier messages".
+
+If a spill fails, the message is dropped and counted, so the memory cap always
+holds.
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+
+from services import database, schema
+
+logger = logging.getLogger(__name__)
+
+CHAT_WINDOW_MESSAGES = int(os.environ.get('CHAT_WINDOW_MESSAGES', '50'))
+CHAT_MAX_MEMORY_BYTES = int(os.environ.get('CHAT_MAX_MEMORY_BYTES', str(1024 * 1024)))
+CHAT_RENDER_MESSAGES = int(os.environ.get('CHAT_RENDER_MESSAGES', '20'))
+CHAT_HISTORY_RETENTION_DAYS = int(os.environ.get('CHAT_HISTORY_RETENTION_DAYS', '7'))
+
+_purged = False
+_purge_lock = threading.Lock()
+
+
+def _prepare(conn):
+    """Apply pending migrations and purge expired chats, once per process"""
+    global _purged
+    schema.ensure_schema()
+    if _purged:
+        return
+    with _purge_lock:
+        if not _purged:
+            conn.execute("""
+                DELETE FROM bedrock_integration.chat_history
+                WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+            """, (CHAT_HISTORY_RETENTION_DAYS,))
+            _purged = True
+
+
+class ChatStore:
+    def __init__(self, page, window=CHAT_WINDOW_MESSAGES, max_bytes=CHAT_MAX_MEMORY_BYTES,
+                 render_messages=CHAT_RENDER_MESSAGES):
+        self.page = page
+        self.chat_id = str(uuid.uuid4())
+        self.window = window
+        self.max_bytes = max_bytes
+        self.render_messages = render_messages
+        # How many of the latest messages the page shows; grows with "Load earlier messages"
+        self.visible_count = render_messages
+        self._messages = deque()  # (seq, message, size in bytes)
+        self._bytes = 0
+        self._next_seq = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    def __len__(self):
+        """Messages in the conversation, in memory or spilled"""
+        return self._next_seq
+
+    def append(self, message):
+        """Add a message dict (JSON-serializable) and spill the oldest ones if over the cap"""
+        size = len(json.dumps(message, default=str))
+        self._messages.append((self._next_seq, message, size))
+        self._next_seq += 1
+        self._bytes += size
+
+        overflow = []
+        while len(self._messages) > 1 and (len(self._messages) > self.window or self._bytes > self.max_bytes):
+            entry = self._messages.popleft()
+            self._bytes -= entry[2]
+            overflow.append(entry)
+        if overflow:
+            self._spill(overflow)
+
+    def _spill(self, entries):
+        try:
+            with database.connection() as conn:
+                _prepare(conn)
+                with conn.cursor() as cur:
+                    cur.executemany("""
+                        INSERT INTO bedrock_integration.chat_history (chat_id, seq, page, message)
+                        VALUES (%s, %s, %s, %s::jsonb)
+                        ON CONFLICT (chat_id, seq) DO NOTHING
+                    """, [(self.chat_id, seq, self.page, json.dumps(message, default=str))
+                          for seq, message, _ in entries])
+            self.spilled += len(entries)
+        except Exception as e:
+            self.dropped += len(entries)
+            logger.warning(f"Could not spill {len(entries)} chat messages to Postgres, dropping them: {e}")
+
+    def _first_in_memory_seq(self):
+        return self._messages[0][0] if self._messages else self._next_seq
+
+    def recent(self):
+        """The visible_count latest messages, oldest first; older ones are read from Postgres"""
+        in_memory = [message for _, message, _ in self._messages]
+        if self.visible_count <= len(in_memory):
+            return in_memory[len(in_memory) - self.visible_count:]
+
+        first_seq = self._first_in_memory_seq()
+        earlier_count = min(self.visible_count - len(in_memory), first_seq)
+        if earlier_count <= 0:
+            return in_memory
+        try:
+            with database.connection() as conn:
+                _prepare(conn)
+                rows = conn.execute("""
+                    SELECT message FROM bedrock_integration.chat_history
+                    WHERE chat_id = %s AND seq >= %s AND seq < %s
+                    ORDER BY seq
+                """, (self.chat_id, first_seq - earlier_count, first_seq)).fetchall()
+        except Exception as e:
+            logger.warning(f"Could not load earlier chat messages: {e}")
+            rows = []
+        return [row[0] for row in rows] + in_memory
+
+    def has_earlier(self):
+        """Whether there are messages before the visible ones"""
+        return self.visible_count < len(self) - self.dropped
+
+    def show_earlier(self):
+        self.visible_count += self.render_messages
+
+    def clear(self):
+        """Forget the conversation, including its spilled messages"""
+        if self.spilled:
+            try:
+                with database.connection() as conn:
+                    conn.execute("DELETE FROM bedrock_integration.chat_history WHERE chat_id = %s", (self.chat_id,))
+            except Exception as e:
+                logger.warning(f"Could not delete spilled chat messages: {e}")
+        self.chat_id = str(uuid.uuid4())
+        self.visible_count = self.render_messages
+        self._messages.clear()
+        self._bytes = 0
+        self._next_seq = 0
+        self.spilled = 0
+        self.dropped = 0
+
+    def stats(self):
+        return {
+            'messages': len(self),
+            'in_memory_messages': len(self._messages),
+            'in_memory_bytes': self._bytes,
+            'window_messages': self.window,
+            'max_memory_bytes': self.max_bytes,
+            'spilled_messages': self.spilled,
+            'dropped_messages': self.dropped,
+            'visible_messages': min(self.visible_count, len(self)),
+        }
@@ -0,0 +1,61 @@
+"""
+Citation annotation for Bedrock agent / knowledge base answers.
+
+Each citation covers a span of the generated text and lists the documents it
+was drawn from. annotate_citations appends "[n]" markers (plus a line break)
+after each cited span and a numbered reference list after the answer:
+
+- insertion points are collected from the span ends first, then the output is
+  built in a single pass over the text, so the cost is linear in the answer
+  length plus the number of references;
+- a document cited more than once keeps its first reference number.
+"""
+
+
+def reference_uri(reference):
+    """S3 URI (or web URL) of a retrieved reference"""
+    location = reference.get("location", {})
+    if "s3Location" in location:
+        return location["s3Location"].get("uri", "")
+    for value in location.values():
+        if isinstance(value, dict) and ("uri" in value or "url" in value):
+            return value.get("uri") or value.get("url")
+    return "unknown source"
+
+
+def annotate_citations(output_text, citations):
+    """Return (annotated text, list of reference URIs in reference-number order)"""
+    numbers = {}
+    insertions = []
+    for citation in citations:
+        # span.end is inclusive
+        position = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
+        markers = []
+        for reference in citation.get("retrievedReferences", []):
+            uri = reference_uri(reference)
+            if uri not in numbers:
+                numbers[uri] = len(numbers) + 1
+            marker = f"[{numbers[uri]}]"
+            if marker not in markers:
+                markers.append(marker)
+        insertions.append((min(max(position, 0), len(output_text)), "".join(markers) + "\n"))
+
+    # Stable sort keeps citations that end at the same position in their original order
+    insertions.sort(key=lambda insertion: insertion[0])
+    pieces = []
+    previous = 0
+    for position, text in insertions:
+        pieces.append(output_text[previous:position])
+        pieces.append(text)
+        previous = position
+    pieces.append(output_text[previous:])
+    return "".join(pieces), list(numbers)
+
+
+def format_citations(output_text, citations):
+    """Annotated answer followed by its reference list, as rendered on the agents page"""
+    if not citations:
+        return output_text
+    annotated, references = annotate_citations(output_text, citations)
+    reference_lines = "".join(f"\n<br>[{number}] {uri}" for number, uri in enumerate(references, start=1))
+    return annotated + "\n" + reference_lines
@@ -0,0 +1,122 @@
+"""
+Token streaming for Claude on Bedrock (invoke_model_with_response_stream).
+
+stream_claude starts the request immediately, so request errors (throttling,
+validation, access) are raised to the caller as before, and returns a
+ClaudeStream. Iterating it yields text deltas as they arrive, so it can be
+handed straight to st.write_stream. Once it has been consumed it also holds the
+assembled text, token usage and timings for caching and logging; on_complete, if
+set, is called with the stream after Claude ends the answer itself (end_turn or
+stop_sequence), so truncated max_tokens answers are never cached.
+"""
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+# Stop reasons of an answer that ended on its own (not max_tokens or a tool call)
+COMPLETE_STOP_REASONS = ("end_turn", "stop_sequence")
+
+
+class ClaudeStream:
+    def __init__(self, response, model_id, start_time):
+        self.model_id = model_id
+        self.text = ""
+        self.stop_reason = None
+        self.usage = {"input_tokens": 0, "output_tokens": 0}
+        self.time_to_first_token_ms = None
+        self.total_ms = None
+        self.cached = False
+        self.on_complete = None
+        self._events = response["body"]
+        self._start_time = start_time
+        self._consumed = False
+
+    @classmethod
+    def from_text(cls, text, model_id, elapsed_ms=0.0):
+        """An already-finished stream, e.g. for an answer served from a cache"""
+        stream = cls({"body": iter(())}, model_id, time.time())
+        stream.text = text
+        stream.stop_reason = "end_turn"
+        stream.time_to_first_token_ms = stream.total_ms = elapsed_ms
+        stream.cached = True
+        stream._consumed = True
+        return stream
+
+    def __iter__(self):
+        if self._consumed:
+            # Already drained (e.g. rendered once); replay the assembled text
+            if self.text:
+                yield self.text
+            return
+        self._consumed = True
+        parts = []
+        completed = False
+        try:
+            for event in self._events:
+                if "chunk" not in event:
+                    continue
+                message = json.loads(event["chunk"]["bytes"])
+                message_type = message.get("type")
+                if message_type == "content_block_delta" and message["delta"].get("type") == "text_delta":
+                    if self.time_to_first_token_ms is None:
+                        self.time_to_first_token_ms = (time.time() - self._start_time) * 1000
+                    parts.append(message["delta"]["text"])
+                    yield message["delta"]["text"]
+                elif message_type == "message_start":
+                    self.usage["input_tokens"] = message["message"].get("usage", {}).get("input_tokens", 0)
+                elif message_type == "message_delta":
+                    self.stop_reason = message.get("delta", {}).get("stop_reason")
+                    self.usage["output_tokens"] = message.get("usage", {}).get("output_tokens", 0)
+            completed = self.stop_reason in COMPLETE_STOP_REASONS
+        finally:
+            # Parts are joined once at the end rather than concatenated per token
+            self.text = "".join(parts)
+            self.total_ms = (time.time() - self._start_time) * 1000
+            logger.info(
+                f"Claude stream {self.model_id}: ttft={self.time_to_first_token_ms or 0:.0f}ms "
+                f"total={self.total_ms:.0f}ms input_tokens={self.usage['input_tokens']} "
+                f"output_tokens={self.usage['output_tokens']} stop_reason={self.stop_reason}"
+            )
+        if completed and self.on_complete is not None:
+            self.on_complete(self)
+
+    def read(self):
+        """Drain the stream (if not already) and return the full text"""
+        for _ in self:
+            pass
+        return self.text
+
+    def metrics(self):
+        return {
+            "time_to_first_token_ms": self.time_to_first_token_ms,
+            "total_ms": self.total_ms,
+            "stop_reason": self.stop_reason,
+            **self.usage,
+        }
+
+
+def stream_claude(client, model_id, prompt, max_tokens=4096, system=None, temperature=None):
+    """Start a streaming Messages API call and return a ClaudeStream over its text deltas"""
+    body = {
+        "anthropic_version": ANTHROPIC_VERSION,
+        "max_tokens": max_tokens,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if system:
+        body["system"] = system
+    if temperature is not None:
+        body["temperature"] = temperature
+
+    start_time = time.time()
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(body)
+    )
+    return ClaudeStream(response, model_id, start_time)
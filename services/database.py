@@ -0,0 +1,101 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing and lifecycle, overridable from the environment (.env)
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))           # seconds a client waits for a connection
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))  # recycle connections after 30 minutes
+POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))        # close idle connections above min_size
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Rolling window of checkout latencies (ms) for the stats panel
+_checkout_times = deque(maxlen=1000)
+_checkout_lock = threading.Lock()
+
+
+def get_conninfo():
+    """Build the libpq connection string from the DB_* environment variables"""
+    return " ".join([
+        f"host={os.environ.get('DB_HOST')}",
+        f"dbname={os.environ.get('DB_NAME')}",
+        f"user={os.environ.get('DB_USER')}",
+        f"password={os.environ.get('DB_PASSWORD')}",
+        f"port={os.environ.get('DB_PORT', '5432')}",
+        f"application_name={os.environ.get('DB_APPLICATION_NAME', 'blaize-bazaar')}",
+    ])
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+
+    Streamlit re-executes page scripts on every interaction, but imported modules
+    stay in sys.modules, so the pool is shared by every session in the process.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    conninfo=get_conninfo(),
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                    max_idle=POOL_MAX_IDLE,
+                    check=ConnectionPool.check_connection,
+                    name="blaize-bazaar",
+                    open=True,
+                )
+                atexit.register(close_pool)
+                logger.info(f"Opened database pool (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE})")
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def connection():
+    """
+    Borrow a connection from the pool.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises; the connection is then returned to the pool, not closed.
+    """
+    pool = get_pool()
+    start_time = time.perf_counter()
+    with pool.connection() as conn:
+        with _checkout_lock:
+            _checkout_times.append((time.perf_counter() - start_time) * 1000)
+        yield conn
+
+
+def get_pool_stats():
+    """Pool counters plus checkout latency (ms) over the last 1000 checkouts"""
+    stats = dict(get_pool().get_stats())
+    with _checkout_lock:
+        samples = sorted(_checkout_times)
+    if samples:
+        stats['checkout_ms_avg'] = sum(samples) / len(samples)
+        stats['checkout_ms_p95'] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        stats['checkout_ms_max'] = samples[-1]
+    stats.setdefault('requests_waiting', 0)
+    return stats
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from services import database, schema
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_ID = 'amazon.titan-embed-text-v2:0'
+EMBEDDING_DIMENSION = 1024
+
+# In-process tier size; 1024 float32 dims is 4 KB per entry, so 5000 entries is ~20 MB
+CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', '5000'))
+CACHE_PERSISTENT = os.environ.get('EMBEDDING_CACHE_PERSISTENT', 'true').lower() == 'true'
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFKC, case-folded, single-spaced"""
+    return " ".join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def make_cache_key(text, model_id=EMBEDDING_MODEL_ID, dimension=EMBEDDING_DIMENSION):
+    return hashlib.sha256(f"{model_id}|{dimension}|{normalize_text(text)}".encode()).digest()
+
+
+def to_bytes(embedding):
+    """Pack a vector as little-endian float32 (4 bytes per dimension)"""
+    return np.asarray(embedding, dtype='<f4').tobytes()
+
+
+def from_bytes(data):
+    embedding = np.frombuffer(data, dtype='<f4')
+    embedding.flags.writeable = False
+    return embedding
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings.
+
+    Tier 1 is an in-process LRU bounded by max_entries (least recently used entry
+    is evicted first). Tier 2 is the bedrock_integration.embedding_cache table,
+    shared by every app process; entries found there are promoted into tier 1.
+    Vectors are stored as raw float32 bytes in both tiers.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, persistent=CACHE_PERSISTENT):
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, text, compute_fn, model_id=EMBEDDING_MODEL_ID, dimension=EMBEDDING_DIMENSION):
+        """Return the cached embedding for text, calling compute_fn(text) on a miss"""
+        key = make_cache_key(text, model_id, dimension)
+
+        embedding = self._get_memory(key)
+        if embedding is not None:
+            return embedding
+
+        embedding = self._get_persistent(key)
+        if embedding is not None:
+            with self._lock:
+                self.persistent_hits += 1
+            self._put_memory(key, embedding)
+            return embedding
+
+        with self._lock:
+            self.misses += 1
+        embedding = from_bytes(to_bytes(compute_fn(text)))
+        self._put_memory(key, embedding)
+        self._put_persistent(key, text, model_id, dimension, embedding)
+        return embedding
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.persistent_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # In-process LRU tier
+    def _get_memory(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return embedding
+
+    def _put_memory(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Persistent tier; failures are logged and treated as misses so search keeps working
+    def _get_persistent(self, key):
+        if not self.persistent:
+            return None
+        try:
+            schema.ensure_schema()
+            with database.connection() as conn:
+                row = conn.execute(
+                    "SELECT embedding FROM bedrock_integration.embedding_cache WHERE cache_key = %s",
+                    (key,)
+                ).fetchone()
+            return from_bytes(row[0]) if row else None
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return None
+
+    def _put_persistent(self, key, text, model_id, dimension, embedding):
+        if not self.persistent:
+            return
+        try:
+            schema.ensure_schema()
+            with database.connection() as conn:
+                conn.execute("""
+                    INSERT INTO bedrock_integration.embedding_cache
+                    (cache_key, model_id, dimension, query_text, embedding)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (cache_key) DO NOTHING
+                """, (key, model_id, dimension, normalize_text(text), to_bytes(embedding)))
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide cache instance shared by all pages and sessions"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
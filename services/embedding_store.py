@@ -0,0 +1,91 @@
+"""
+Read and write product embeddings in compact binary formats.
+
+The format is chosen from the file suffix:
+
+- .csv      legacy: embeddings as decimal text lists (~20 KB per 1024-dim vector)
+- .parquet  one row per product; `embedding` is a fixed_size_list<float32>[dim] column
+- .npy      embeddings as a contiguous (n, dim) float32 matrix, memory-mapped on load;
+            the other columns go to a row-aligned sidecar `<name>.meta.csv`
+
+load_embeddings always returns (metadata DataFrame, float32 matrix). For .npy the
+matrix is a read-only memory map of the file and for .parquet it is a view over
+the Arrow buffer, so neither copies the vectors.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def _metadata_path(npy_path):
+    return os.path.splitext(npy_path)[0] + ".meta.csv"
+
+
+# Titan Text Embeddings v2; only used to shape the matrix when there are no rows to infer it from
+DEFAULT_DIMENSION = 1024
+
+
+def to_matrix(embeddings, dimension=DEFAULT_DIMENSION):
+    """Stack a sequence of vectors (lists or arrays) into a C-contiguous float32 matrix"""
+    vectors = [np.asarray(e, dtype=np.float32) for e in embeddings]
+    if not vectors:
+        # e.g. an empty export, or every row dead-lettered
+        return np.empty((0, dimension), dtype=np.float32)
+    return np.ascontiguousarray(np.vstack(vectors))
+
+
+def save_embeddings(df, path, embedding_column='embedding'):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.csv':
+        df.to_csv(path, index=False)
+        return
+
+    matrix = to_matrix(df[embedding_column])
+    metadata = df.drop(columns=[embedding_column])
+
+    if suffix == '.parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        num_rows, dimension = matrix.shape
+        embedding_array = pa.FixedSizeListArray.from_arrays(pa.array(matrix.reshape(-1)), dimension)
+        table = pa.Table.from_pandas(metadata, preserve_index=False).append_column(embedding_column, embedding_array)
+        # A single row group lets the loader hand out one contiguous view
+        pq.write_table(table, path, row_group_size=max(num_rows, 1))
+    elif suffix == '.npy':
+        np.save(path, matrix)
+        metadata.to_csv(_metadata_path(path), index=False)
+    else:
+        raise ValueError(f"Unsupported embedding file format: {path} (use .csv, .parquet or .npy)")
+
+
+def load_embeddings(path, embedding_column='embedding', mmap=True):
+    """Return (metadata DataFrame, (n, dim) float32 matrix) for a file written by save_embeddings"""
+    suffix = os.path.splitext(path)[1].lower()
+
+    if suffix == '.npy':
+        matrix = np.load(path, mmap_mode='r' if mmap else None)
+        metadata_path = _metadata_path(path)
+        metadata = pd.read_csv(metadata_path) if os.path.exists(metadata_path) else pd.DataFrame(index=range(len(matrix)))
+        return metadata, matrix
+
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, memory_map=mmap)
+        column = table.column(embedding_column)
+        chunk = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        dimension = chunk.type.list_size
+        # flatten() of a fixed-size list is a slice of the float32 child buffer, so no copy
+        matrix = chunk.flatten().to_numpy(zero_copy_only=True).reshape(-1, dimension)
+        metadata = table.drop_columns([embedding_column]).to_pandas()
+        return metadata, matrix
+
+    if suffix == '.csv':
+        df = pd.read_csv(path)
+        matrix = to_matrix(df[embedding_column].map(json.loads))
+        return df.drop(columns=[embedding_column]), matrix
+
+    raise ValueError(f"Unsupported embedding file format: {path} (use .csv, .parquet or .npy)")
@@ -0,0 +1,145 @@
+"""
+FAQ fast path for knowledge base questions.
+
+The curated question/answer pairs in knowledgebase/Blaize_Bazaar_Product_FAQs_Policy.csv
+are embedded once into an in-memory float32 matrix (30 rows, so an exact dot
+product beats any index). A question whose nearest FAQ question clears the
+similarity threshold gets the curated answer straight away, with the CSV row as
+its citation; anything else falls through to RAG.
+
+The CSV is re-checked on every lookup with a stat() call and the index is rebuilt
+when its content changes. Question embeddings go through the shared embedding
+cache, so rebuilds and restarts only call Bedrock for new or edited questions.
+A failed build is not retried for FAQ_INDEX_RETRY_SECONDS; until then lookups
+keep using the previous index, or fall through to RAG if there is none.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from services.answer_cache import embed_question
+from services.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+FAQ_CSV_PATH = os.environ.get('FAQ_CSV_PATH', 'knowledgebase/Blaize_Bazaar_Product_FAQs_Policy.csv')
+FAQ_SIMILARITY_THRESHOLD = float(os.environ.get('FAQ_SIMILARITY_THRESHOLD', '0.85'))
+FAQ_INDEX_RETRY_SECONDS = float(os.environ.get('FAQ_INDEX_RETRY_SECONDS', '300'))
+
+
+class FaqIndex:
+    def __init__(self, path=FAQ_CSV_PATH, threshold=FAQ_SIMILARITY_THRESHOLD, retry_seconds=FAQ_INDEX_RETRY_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.retry_seconds = retry_seconds
+        self.faqs = None
+        self.matrix = None
+        self.exact = {}
+        self.built_at = None
+        self._stat = None
+        self._digest = None
+        # CSV signature whose build failed, and when to try it again
+        self._failed_stat = None
+        self._retry_after = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Rebuild if the CSV changed since the last build (cheap stat() when it has not)"""
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._stat or self._backing_off(signature):
+            return
+        with self._lock:
+            if signature == self._stat or self._backing_off(signature):
+                return
+            with open(self.path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            if digest != self._digest:
+                try:
+                    self._build()
+                except Exception:
+                    # Otherwise every question re-runs the whole build while Bedrock is failing
+                    self._failed_stat = signature
+                    self._retry_after = time.time() + self.retry_seconds
+                    raise
+                self._digest = digest
+            self._stat = signature
+            self._failed_stat = None
+
+    def _backing_off(self, signature):
+        """Whether the build for this CSV signature failed recently and should not be retried yet"""
+        return signature == self._failed_stat and time.time() < self._retry_after
+
+    def _build(self):
+        start_time = time.time()
+        faqs = pd.read_csv(self.path).dropna(subset=['Question', 'Answer']).reset_index(drop=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            embeddings = list(executor.map(embed_question, faqs['Question']))
+        matrix = np.vstack([np.asarray(e, dtype=np.float32) for e in embeddings])
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.faqs, self.matrix = faqs, matrix
+        self.exact = {normalize_text(question): row for row, question in enumerate(faqs['Question'])}
+        self.built_at = time.time()
+        logger.info(f"Built FAQ index from {self.path}: {len(faqs)} questions in {time.time() - start_time:.1f}s")
+
+    def match(self, question):
+        """
+        Best FAQ entry for question if it clears the threshold:
+        {'no', 'question', 'answer', 'similarity', 'source', 'lookup_ms'}; otherwise None.
+        """
+        start_time = time.time()
+        self._refresh()
+        faqs, matrix = self.faqs, self.matrix
+        if matrix is None:
+            return None
+
+        # Sample questions are usually verbatim FAQ questions: no embedding call needed
+        row = self.exact.get(normalize_text(question))
+        if row is not None:
+            similarity = 1.0
+        else:
+            query = np.asarray(embed_question(question), dtype=np.float32)
+            scores = matrix @ (query / np.linalg.norm(query))
+            row = int(np.argmax(scores))
+            similarity = float(scores[row])
+            if similarity < self.threshold:
+                return None
+
+        faq = faqs.iloc[row]
+        return {
+            'no': int(faq['No.']) if 'No.' in faq and pd.notna(faq['No.']) else row + 1,
+            'question': faq['Question'],
+            'answer': faq['Answer'],
+            'similarity': similarity,
+            'source': os.path.basename(self.path),
+            'lookup_ms': (time.time() - start_time) * 1000,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_faq_index():
+    """Process-wide FAQ index shared by all sessions"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FaqIndex()
+    return _index
+
+
+def match_faq(question):
+    """FAQ match for question, or None if there is none (or the index cannot be built)"""
+    try:
+        return get_faq_index().match(question)
+    except Exception as e:
+        logger.warning(f"FAQ lookup failed: {e}")
+        return None
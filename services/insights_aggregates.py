@@ -0,0 +1,180 @@
+"""
+Materialized aggregates behind the Product Insights dashboard.
+
+The dashboard reads small pre-aggregated views instead of scanning and grouping
+bedrock_integration.product_catalog on every page load. Views are refreshed with
+REFRESH MATERIALIZED VIEW CONCURRENTLY, so readers are never blocked.
+
+Usage (from the repository root):
+    python -m services.insights_aggregates --create            # create views (first build)
+    python -m services.insights_aggregates --refresh           # one-off refresh, e.g. from cron
+    python -m services.insights_aggregates --watch --interval 60 --max-age 3600
+                                                               # refresh when the catalog changes
+"""
+import argparse
+import logging
+import time
+
+import psycopg
+from dotenv import load_dotenv
+
+from services import schema
+from services.database import get_conninfo
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key so only one refresher runs at a time
+REFRESH_LOCK_KEY = 301_0001
+
+# view name -> (definition, unique index columns required by REFRESH ... CONCURRENTLY)
+AGGREGATE_VIEWS = {
+    "mv_category_sales": ("""
+        SELECT category_name,
+               SUM(boughtinlastmonth) AS total_bought,
+               AVG(stars) AS avg_rating,
+               COUNT(*) AS product_count
+        FROM bedrock_integration.product_catalog
+        GROUP BY category_name
+    """, "category_name"),
+    "mv_best_selling_by_category": ("""
+        SELECT DISTINCT ON (category_name)
+               category_name, product_description, boughtinlastmonth
+        FROM bedrock_integration.product_catalog
+        ORDER BY category_name, boughtinlastmonth DESC
+    """, "category_name"),
+    "mv_spending_habits": ("""
+        WITH price_ranges AS (
+            SELECT
+                CASE
+                    WHEN price < 20 THEN 'Under $20'
+                    WHEN price >= 20 AND price < 50 THEN '$20 - $49.99'
+                    WHEN price >= 50 AND price < 100 THEN '$50 - $99.99'
+                    WHEN price >= 100 AND price < 200 THEN '$100 - $199.99'
+                    ELSE '$200 and above'
+                END AS price_range,
+                CASE
+                    WHEN price < 20 THEN 1
+                    WHEN price >= 20 AND price < 50 THEN 2
+                    WHEN price >= 50 AND price < 100 THEN 3
+                    WHEN price >= 100 AND price < 200 THEN 4
+                    ELSE 5
+                END AS sort_order,
+                boughtinlastmonth
+            FROM bedrock_integration.product_catalog
+        )
+        SELECT price_range, sort_order, COUNT(*) AS product_count, SUM(boughtinlastmonth) AS total_sold
+        FROM price_ranges
+        GROUP BY price_range, sort_order
+    """, "price_range"),
+}
+
+# Write activity on the catalog as seen by the statistics collector; a change
+# in this counter since the last refresh means the aggregates may be stale
+CATALOG_CHANGES_SQL = """
+SELECT n_tup_ins + n_tup_upd + n_tup_del
+FROM pg_stat_user_tables
+WHERE schemaname = 'bedrock_integration' AND relname = 'product_catalog'
+"""
+
+FRESHNESS_SQL = """
+SELECT MIN(refreshed_at) FROM bedrock_integration.insights_refresh_log
+"""
+
+
+def create_views(conn):
+    """Create the views and their unique indexes (idempotent); the refresh log is a schema migration"""
+    schema.ensure_schema()
+    for view_name, (definition, unique_columns) in AGGREGATE_VIEWS.items():
+        start_time = time.time()
+        conn.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS bedrock_integration.{view_name} AS {definition}")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {view_name}_key "
+                     f"ON bedrock_integration.{view_name} ({unique_columns})")
+        _log_refresh(conn, view_name, (time.time() - start_time) * 1000)
+
+
+def refresh_views(conn):
+    """
+    Refresh every view concurrently. Returns False without doing anything if
+    another process already holds the refresh lock.
+    """
+    if not conn.execute("SELECT pg_try_advisory_lock(%s)", (REFRESH_LOCK_KEY,)).fetchone()[0]:
+        logger.info("Another refresh is in progress; skipping")
+        return False
+    try:
+        for view_name in AGGREGATE_VIEWS:
+            start_time = time.time()
+            conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY bedrock_integration.{view_name}")
+            _log_refresh(conn, view_name, (time.time() - start_time) * 1000)
+            logger.info(f"Refreshed {view_name} in {(time.time() - start_time) * 1000:.0f} ms")
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(%s)", (REFRESH_LOCK_KEY,))
+    return True
+
+
+def missing_views(conn):
+    """Names of the aggregate views that have not been created yet"""
+    rows = conn.execute("""
+        SELECT view_name FROM unnest(%s::text[]) AS view_name
+        WHERE to_regclass('bedrock_integration.' || view_name) IS NULL
+    """, (list(AGGREGATE_VIEWS),)).fetchall()
+    return {row[0] for row in rows}
+
+
+def with_live_fallback(query, missing):
+    """
+    Rewrite a dashboard query so that each missing view is read through its
+    definition as a subquery: slower, but the dashboard works before --create
+    and after a bulk swap has dropped the views.
+    """
+    for view_name in missing:
+        definition, _ = AGGREGATE_VIEWS[view_name]
+        query = query.replace(f"bedrock_integration.{view_name}", f"({definition}) AS {view_name}")
+    return query
+
+
+def get_freshness(conn):
+    """Timestamp of the oldest view refresh, i.e. how current the whole dashboard is"""
+    return conn.execute(FRESHNESS_SQL).fetchone()[0]
+
+
+def _log_refresh(conn, view_name, duration_ms):
+    conn.execute("""
+        INSERT INTO bedrock_integration.insights_refresh_log (view_name, refreshed_at, duration_ms)
+        VALUES (%s, CURRENT_TIMESTAMP, %s)
+        ON CONFLICT (view_name) DO UPDATE
+        SET refreshed_at = EXCLUDED.refreshed_at, duration_ms = EXCLUDED.duration_ms
+    """, (view_name, duration_ms))
+
+
+def watch(conn, interval, max_age):
+    """Poll catalog write activity and refresh when it changes or the views get older than max_age"""
+    last_changes = None
+    last_refresh = 0.0
+    while True:
+        changes = conn.execute(CATALOG_CHANGES_SQL).fetchone()
+        changes = changes[0] if changes else None
+        if changes != last_changes or time.time() - last_refresh >= max_age:
+            if refresh_views(conn):
+                last_changes = changes
+                last_refresh = time.time()
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--create", action="store_true", help="create the materialized views")
+    parser.add_argument("--refresh", action="store_true", help="refresh the views once")
+    parser.add_argument("--watch", action="store_true", help="keep refreshing when the catalog changes")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between change checks")
+    parser.add_argument("--max-age", type=float, default=3600, help="refresh at least this often (seconds)")
+    args = parser.parse_args()
+
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        if args.create:
+            create_views(conn)
+        if args.refresh:
+            refresh_views(conn)
+        if args.watch:
+            watch(conn, args.interval, args.max_age)
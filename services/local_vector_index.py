@@ -0,0 +1,329 @@
+"""
+In-process vector index: a low-latency, read-only path for similarity search.
+
+Product embeddings are held as one contiguous (n, 1024) float32 matrix of
+L2-normalised rows, so cosine similarity is a single matrix-vector product and
+top-k selection is an argpartition. Larger catalogs can add an IVF coarse
+quantizer (spherical k-means) and scan only the nprobe closest lists.
+
+The matrix is loaded from a .npy snapshot (memory-mapped, see
+services/embedding_store.py) and/or from the database. It is then kept current
+incrementally using product_catalog.embedding_updated_at, which a trigger bumps
+whenever an embedding is written; deleted products drop out on the next full
+reload (restart from the database, or a table swap by the bulk loader). Because
+it can start from the snapshot, search keeps working while the database is
+unreachable.
+
+Usage (from the repository root):
+    python -m services.local_vector_index --setup                       # add change tracking column/trigger
+    python -m services.local_vector_index --snapshot datasets/catalog_index.npy
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import psycopg
+from dotenv import load_dotenv
+from pgvector.psycopg import register_vector
+
+from services.database import get_conninfo
+from services.embedding_store import load_embeddings, save_embeddings
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_ENABLED = os.environ.get('LOCAL_VECTOR_INDEX', 'false').lower() == 'true'
+LOCAL_INDEX_SNAPSHOT = os.environ.get('LOCAL_VECTOR_INDEX_SNAPSHOT', 'datasets/catalog_index.npy')
+LOCAL_INDEX_REFRESH_SECONDS = float(os.environ.get('LOCAL_VECTOR_INDEX_REFRESH_SECONDS', '60'))
+# Catalogs at least this large get an IVF coarse quantizer
+IVF_MIN_ROWS = int(os.environ.get('LOCAL_VECTOR_INDEX_IVF_MIN_ROWS', '200000'))
+# Extra seconds re-read before the watermark on every sync, for writers whose start time is not visible to us
+SYNC_OVERLAP_SECONDS = float(os.environ.get('LOCAL_VECTOR_INDEX_SYNC_OVERLAP_SECONDS', '30'))
+
+METADATA_COLUMNS = ['productId', 'product_description', 'category_name', 'stars', 'price',
+                    'boughtinlastmonth', 'imgURL', 'producturl']
+
+CHANGE_TRACKING_SQL = """
+ALTER TABLE bedrock_integration.product_catalog
+    ADD COLUMN IF NOT EXISTS embedding_updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION bedrock_integration.product_catalog_embedding_touch()
+RETURNS trigger AS $$
+BEGIN
+    NEW.embedding_updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS product_catalog_embedding_touch_trg ON bedrock_integration.product_catalog;
+CREATE TRIGGER product_catalog_embedding_touch_trg
+    BEFORE INSERT OR UPDATE OF embedding ON bedrock_integration.product_catalog
+    FOR EACH ROW EXECUTE FUNCTION bedrock_integration.product_catalog_embedding_touch();
+"""
+
+# The trigger stamps rows with the *writer's* transaction start time, so a writer that
+# started before a sync and commits after it leaves rows stamped below the sync's own
+# start. The watermark is therefore held back to the oldest transaction still open when
+# the sync begins (LEAST ignores the NULL when there is none).
+SYNC_WATERMARK_SQL = """
+SELECT LEAST(CURRENT_TIMESTAMP, (
+    SELECT MIN(xact_start) FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL
+))
+"""
+
+SELECT_EMBEDDINGS_SQL = """
+SELECT "productId", product_description, category_name, stars::float8, price::float8, boughtinlastmonth,
+       imgURL, producturl, embedding
+FROM bedrock_integration.product_catalog
+WHERE embedding IS NOT NULL
+"""
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k scores, best first, without a full sort"""
+    if top_k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class LocalVectorIndex:
+    def __init__(self, metadata, matrix):
+        self.metadata = metadata.reset_index(drop=True)
+        self.matrix = matrix
+        self.row_of = {product_id: row for row, product_id in enumerate(self.metadata['productId'])}
+        self.ivf = None  # (centroids, lists); swapped as one object so searches never see a half-built pair
+        self.assignments = None
+        self.nprobe = 8
+        self.last_sync = None
+        self.table_oid = None
+        self._lock = threading.Lock()
+
+    # Loading
+    @classmethod
+    def from_snapshot(cls, path):
+        """Memory-map a snapshot written by save_snapshot (rows are already normalised)"""
+        metadata, matrix = load_embeddings(path, mmap=True)
+        index = cls(metadata[METADATA_COLUMNS], matrix)
+        sync_path = os.path.splitext(path)[0] + ".sync.json"
+        if os.path.exists(sync_path):
+            with open(sync_path) as f:
+                sync_state = json.load(f)
+            index.last_sync = pd.Timestamp(sync_state['last_sync']).to_pydatetime()
+            index.table_oid = sync_state['table_oid']
+        if len(matrix) >= IVF_MIN_ROWS:
+            index.build_ivf()
+        return index
+
+    @classmethod
+    def from_database(cls, conn):
+        index = cls(pd.DataFrame(columns=METADATA_COLUMNS), np.empty((0, 0), dtype=np.float32))
+        index.refresh(conn, full=True)
+        return index
+
+    def save_snapshot(self, path):
+        df = self.metadata.copy()
+        df['embedding'] = list(self.matrix)
+        save_embeddings(df, path)
+        # Lets a process starting from this snapshot sync incrementally instead of reloading everything
+        if self.last_sync is not None:
+            with open(os.path.splitext(path)[0] + ".sync.json", "w") as f:
+                json.dump({'last_sync': self.last_sync.isoformat(), 'table_oid': self.table_oid}, f)
+
+    # IVF coarse quantizer
+    def build_ivf(self, nlist=None, nprobe=8, iterations=10, sample_size=50000, seed=0):
+        """Spherical k-means on a sample; rows are then bucketed by nearest centroid"""
+        num_rows = len(self.matrix)
+        nlist = nlist or max(1, int(np.sqrt(num_rows)))
+        rng = np.random.default_rng(seed)
+        sample = self.matrix[rng.choice(num_rows, size=min(sample_size, num_rows), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+        self.nprobe = nprobe
+        self.assignments = None
+        self._assign(centroids, np.arange(num_rows))
+
+    def _assign(self, centroids, rows):
+        assignments = np.empty(len(self.matrix), dtype=np.int32) if self.assignments is None else self.assignments
+        if len(assignments) < len(self.matrix):
+            assignments = np.concatenate([assignments, np.zeros(len(self.matrix) - len(assignments), dtype=np.int32)])
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            assignments[chunk] = np.argmax(self.matrix[chunk] @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        self.assignments = assignments
+        self.ivf = (centroids, [order[boundaries[c]:boundaries[c + 1]] for c in range(len(centroids))])
+
+    # Search
+    def search(self, query_embedding, top_k=5):
+        """Top-k cosine search; returns (DataFrame shaped like similarity_search, query_time_ms)"""
+        start_time = time.time()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            matrix, metadata, ivf = self.matrix, self.metadata, self.ivf
+        if len(matrix) == 0:
+            return pd.DataFrame(columns=METADATA_COLUMNS + ['similarity']), (time.time() - start_time) * 1000
+
+        if ivf is not None:
+            centroids, lists = ivf
+            probes = top_k_indices(centroids @ query, min(self.nprobe, len(centroids)))
+            candidates = np.concatenate([lists[c] for c in probes])
+            scores = matrix[candidates] @ query
+            best = candidates[top_k_indices(scores, top_k)]
+            best_scores = matrix[best] @ query
+        else:
+            scores = matrix @ query
+            best = top_k_indices(scores, top_k)
+            best_scores = scores[best]
+
+        results = metadata.iloc[best].copy()
+        results['similarity'] = best_scores
+        return results.reset_index(drop=True), (time.time() - start_time) * 1000
+
+    # Incremental sync
+    def refresh(self, conn, full=False):
+        """
+        Pull embeddings written since the last sync (or everything, if full or if
+        the table was swapped by the bulk loader). Returns the number of rows applied.
+        """
+        table_oid = conn.execute("SELECT 'bedrock_integration.product_catalog'::regclass::oid").fetchone()[0]
+        has_tracking = conn.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'bedrock_integration' AND table_name = 'product_catalog'
+            AND column_name = 'embedding_updated_at'
+        """).fetchone() is not None
+        full = full or self.last_sync is None or table_oid != self.table_oid or not has_tracking
+
+        # Read before the rows themselves, so anything committed after this point is stamped above it
+        watermark = conn.execute(SYNC_WATERMARK_SQL).fetchone()[0]
+        query, params = SELECT_EMBEDDINGS_SQL, None
+        if not full:
+            # Re-reading an overlap is harmless: upsert replaces rows by productId
+            query, params = query + " AND embedding_updated_at > %s", (self.last_sync - timedelta(seconds=SYNC_OVERLAP_SECONDS),)
+        with conn.cursor(binary=True) as cur:
+            rows = cur.execute(query, params).fetchall()
+
+        if rows:
+            metadata = pd.DataFrame([row[:-1] for row in rows], columns=METADATA_COLUMNS)
+            matrix = normalize_rows(np.vstack([row[-1] for row in rows]))
+            if full or len(self.matrix) == 0:
+                with self._lock:
+                    self.metadata, self.matrix = metadata, matrix
+                    self.row_of = {product_id: row for row, product_id in enumerate(metadata['productId'])}
+                    self.ivf = self.assignments = None
+                if len(matrix) >= IVF_MIN_ROWS:
+                    self.build_ivf()
+            else:
+                self.upsert(metadata, matrix)
+        # Rows from transactions still open at the watermark are stamped at or after it, so the
+        # next sync (> watermark - overlap) picks them up once they commit
+        self.last_sync, self.table_oid = watermark, table_oid
+        return len(rows)
+
+    def upsert(self, metadata, matrix):
+        with self._lock:
+            if not self.matrix.flags.writeable:
+                self.matrix = np.array(self.matrix)  # detach from the read-only snapshot map
+            existing = metadata['productId'].map(self.row_of)
+            update_mask = existing.notna().to_numpy()
+            update_rows = existing[update_mask].astype(int).to_numpy()
+            self.matrix[update_rows] = matrix[update_mask]
+            self.metadata.iloc[update_rows] = metadata[update_mask].to_numpy()
+
+            new_metadata, new_matrix = metadata[~update_mask], matrix[~update_mask]
+            touched = update_rows
+            if len(new_matrix):
+                first_new = len(self.matrix)
+                self.matrix = np.concatenate([self.matrix, new_matrix])
+                self.metadata = pd.concat([self.metadata, new_metadata], ignore_index=True)
+                for offset, product_id in enumerate(new_metadata['productId']):
+                    self.row_of[product_id] = first_new + offset
+                touched = np.concatenate([touched, np.arange(first_new, len(self.matrix))])
+            if self.ivf is not None and len(touched):
+                self._assign(self.ivf[0], touched)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """
+    Process-wide index, or None if disabled or nothing could be loaded. Starts
+    from the snapshot when present, then keeps itself current in a daemon thread.
+    """
+    global _index
+    if not LOCAL_INDEX_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = None
+                if os.path.exists(LOCAL_INDEX_SNAPSHOT):
+                    index = LocalVectorIndex.from_snapshot(LOCAL_INDEX_SNAPSHOT)
+                    logger.info(f"Loaded local vector index snapshot with {len(index.matrix)} rows")
+                try:
+                    with psycopg.connect(get_conninfo()) as conn:
+                        register_vector(conn)
+                        if index is None:
+                            index = LocalVectorIndex.from_database(conn)
+                        else:
+                            index.refresh(conn)
+                except Exception as e:
+                    logger.warning(f"Local vector index could not sync from the database: {e}")
+                if index is not None:
+                    threading.Thread(target=_refresh_loop, args=(index,), daemon=True, name="local-vector-index").start()
+                _index = index
+    return _index
+
+
+def _refresh_loop(index):
+    while True:
+        time.sleep(LOCAL_INDEX_REFRESH_SECONDS)
+        try:
+            with psycopg.connect(get_conninfo()) as conn:
+                register_vector(conn)
+                applied = index.refresh(conn)
+            if applied:
+                logger.info(f"Local vector index applied {applied} changed rows")
+        except Exception as e:
+            logger.warning(f"Local vector index refresh failed (serving last good copy): {e}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setup", action="store_true", help="add the embedding_updated_at column and trigger")
+    parser.add_argument("--snapshot", help="write a .npy snapshot of the current catalog embeddings")
+    args = parser.parse_args()
+
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        register_vector(conn)
+        if args.setup:
+            conn.execute(CHANGE_TRACKING_SQL)
+            logger.info("Change tracking installed on bedrock_integration.product_catalog")
+        if args.snapshot:
+            index = LocalVectorIndex.from_database(conn)
+            index.save_snapshot(args.snapshot)
+            logger.info(f"Wrote {len(index.matrix)} rows to {args.snapshot}")
@@ -0,0 +1,24 @@
+-- Accounts, preferences and search history for the Product Recommendations page
+CREATE TABLE IF NOT EXISTS bedrock_integration.users (
+    user_id SERIAL PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS bedrock_integration.user_preferences (
+    preference_id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES bedrock_integration.users(user_id),
+    category_preferences TEXT[],
+    price_range_min NUMERIC,
+    price_range_max NUMERIC,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS bedrock_integration.user_search_history (
+    history_id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES bedrock_integration.users(user_id),
+    search_query TEXT,
+    search_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
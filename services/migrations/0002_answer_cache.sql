@@ -0,0 +1,16 @@
+-- Semantic answer cache (services/answer_cache.py); 1024 = Titan v2 embedding dimension
+CREATE TABLE IF NOT EXISTS bedrock_integration.answer_cache (
+    id BIGSERIAL PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    version TEXT NOT NULL DEFAULT '',
+    question TEXT NOT NULL,
+    embedding vector(1024) NOT NULL,
+    answer TEXT NOT NULL,
+    citations JSONB NOT NULL DEFAULT '[]',
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    last_hit_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    hit_count INT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS answer_cache_namespace_idx
+    ON bedrock_integration.answer_cache (namespace, version, created_at);
@@ -0,0 +1,12 @@
+-- Chat messages spilled out of session memory (services/chat_store.py)
+CREATE TABLE IF NOT EXISTS bedrock_integration.chat_history (
+    chat_id UUID NOT NULL,
+    seq INT NOT NULL,
+    page TEXT NOT NULL,
+    message JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (chat_id, seq)
+);
+
+CREATE INDEX IF NOT EXISTS chat_history_created_at_idx
+    ON bedrock_integration.chat_history (created_at);
@@ -0,0 +1,10 @@
+-- Persistent tier of the query embedding cache (services/embedding_cache.py);
+-- vectors are little-endian float32 bytes, keyed by sha256(model_id|dimension|normalized text)
+CREATE TABLE IF NOT EXISTS bedrock_integration.embedding_cache (
+    cache_key BYTEA PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    dimension INT NOT NULL,
+    query_text TEXT NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,6 @@
+-- Last refresh of each Product Insights materialized view (services/insights_aggregates.py)
+CREATE TABLE IF NOT EXISTS bedrock_integration.insights_refresh_log (
+    view_name TEXT PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    duration_ms NUMERIC
+);
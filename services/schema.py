@@ -0,0 +1,159 @@
+"""
+Versioned schema migrations for the tables the app owns.
+
+Migrations are the SQL files in services/migrations, named NNNN_description.sql
+and applied in version order. Each one runs in its own transaction together with
+its row in bedrock_integration.schema_migrations. The runner holds a Postgres
+advisory lock, so app replicas that start at the same time apply each migration
+once. The existing migrations use IF NOT EXISTS, so databases whose tables were
+created by earlier versions of the app are adopted as they are.
+
+Pages call ensure_schema(). It compares the applied versions with the files on
+disk once per process and, with SCHEMA_AUTO_MIGRATE=true (the default), applies
+anything pending. Later calls return without touching the database.
+
+    python -m services.schema --status
+    python -m services.schema --migrate
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import psycopg
+from dotenv import load_dotenv
+
+from services import database
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_KEY = 301_0002
+
+VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bedrock_integration.schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] for every migration file, in version order"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = re.fullmatch(r'(\d+)_(\w+)\.sql', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def applied_migrations(conn):
+    """{version: checksum} of applied migrations; empty if the version table does not exist yet"""
+    if conn.execute("SELECT to_regclass('bedrock_integration.schema_migrations')").fetchone()[0] is None:
+        return {}
+    return dict(conn.execute("SELECT version, checksum FROM bedrock_integration.schema_migrations").fetchall())
+
+
+def pending_migrations(conn):
+    applied = applied_migrations(conn)
+    return [migration for migration in list_migrations() if migration[0] not in applied]
+
+
+def migrate(conn):
+    """
+    Apply pending migrations on an autocommit connection, under the migration
+    advisory lock. Returns the versions applied by this call.
+    """
+    conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        conn.execute(VERSION_TABLE_SQL)
+        # Re-read under the lock: another replica may have just applied them
+        applied = []
+        for version, name, path in pending_migrations(conn):
+            with open(path) as f:
+                migration_sql = f.read()
+            with conn.transaction():
+                conn.execute(migration_sql)
+                conn.execute("""
+                    INSERT INTO bedrock_integration.schema_migrations (version, name, checksum)
+                    VALUES (%s, %s, %s)
+                """, (version, name, _checksum(path)))
+            logger.info(f"Applied migration {version:04d}_{name}")
+            applied.append(version)
+        return applied
+    finally:
+        conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+
+
+def status(conn):
+    """[(version, name, state)] where state is 'applied', 'pending' or 'changed since applied'"""
+    applied = applied_migrations(conn)
+    rows = []
+    for version, name, path in list_migrations():
+        if version not in applied:
+            state = 'pending'
+        elif applied[version] != _checksum(path):
+            state = 'changed since applied'
+        else:
+            state = 'applied'
+        rows.append((version, name, state))
+    return rows
+
+
+def ensure_schema():
+    """
+    Make sure every migration has been applied, checking the database only on
+    the first call in the process. Raises if migrations are pending and
+    SCHEMA_AUTO_MIGRATE is off.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with database.connection() as conn:
+            pending = pending_migrations(conn)
+        if pending:
+            # Read here rather than at import: pages call load_dotenv() after their imports
+            if os.environ.get('SCHEMA_AUTO_MIGRATE', 'true').lower() != 'true':
+                raise RuntimeError(f"{len(pending)} schema migration(s) pending; run: python -m services.schema --migrate")
+            with psycopg.connect(database.get_conninfo(), autocommit=True) as conn:
+                migrate(conn)
+        _schema_ready = True
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--migrate", action="store_true", help="apply pending migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    args = parser.parse_args()
+    if not (args.migrate or args.status):
+        parser.print_help()
+    else:
+        with psycopg.connect(database.get_conninfo(), autocommit=True) as conn:
+            if args.migrate:
+                applied = migrate(conn)
+                logger.info(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+            if args.status:
+                for version, name, state in status(conn):
+                    print(f"{version:04d}_{name}: {state}")
@@ -0,0 +1,311 @@
+"""
+Filtered semantic search over bedrock_integration.product_catalog.
+
+Adding a WHERE clause to an HNSW ORDER BY makes pgvector filter *after* the
+index returns its ef_search candidates, so narrow filters silently return too
+few (or no) rows. filtered_similarity_search picks a plan from the planner's
+selectivity estimate instead:
+
+- exact:         few rows match; filter first (btree/seq) and rank them by exact distance
+- partial_index: a single category with its own partial HNSW index
+- iterative:     HNSW with pgvector >= 0.8 iterative index scans, which keep
+                 walking the graph until enough rows pass the filter
+
+quantized_similarity_search is the unfiltered two-stage variant: an HNSW index
+over a compact expression of the embedding (halfvec: 2 bytes/dim, binary: 1
+bit/dim) returns rerank_depth candidates, which are then re-ranked by exact
+distance on the full-precision column.
+
+Per-category partial indexes and the quantized indexes can be built with:
+    python -m services.vector_search --create-category-indexes --top 5
+    python -m services.vector_search --create-quantized-index halfvec
+"""
+import argparse
+import hashlib
+import logging
+import re
+import threading
+import time
+
+import pandas as pd
+import psycopg
+from dotenv import load_dotenv
+from psycopg import sql
+
+from services import database
+from services.embedding_cache import EMBEDDING_DIMENSION
+
+logger = logging.getLogger(__name__)
+
+# Estimated matching rows at or below which exact distance over the filtered set wins
+EXACT_SCAN_MAX_ROWS = 20000
+# Upper bounds for the iterative scan (pgvector defaults are 40 / 20000)
+ITERATIVE_EF_SEARCH = 100
+ITERATIVE_MAX_SCAN_TUPLES = 40000
+# How long the list of partial indexes is trusted before re-reading the catalog
+INDEX_CACHE_TTL = 300
+# Candidates fetched from a quantized index per result returned
+RERANK_FACTOR = 10
+
+# Expression indexes: the compact copy lives only in the index, not in the heap.
+# Each mode maps to (index name, indexed expression, opclass, query-side expression).
+QUANTIZED_INDEXES = {
+    'halfvec': ("product_catalog_embedding_halfvec_idx",
+                f"(embedding::halfvec({EMBEDDING_DIMENSION}))", "halfvec_cosine_ops",
+                f"embedding::halfvec({EMBEDDING_DIMENSION}) <=> %(embedding)s::halfvec({EMBEDDING_DIMENSION})"),
+    'binary': ("product_catalog_embedding_binary_idx",
+               f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSION}))", "bit_hamming_ops",
+               f"binary_quantize(embedding)::bit({EMBEDDING_DIMENSION}) <~> binary_quantize(%(embedding)s::vector)"),
+}
+
+RESULT_COLUMNS = ['productId', 'product_description', 'category_name', 'stars', 'price',
+                  'boughtinlastmonth', 'imgURL', 'producturl', 'similarity']
+
+_pgvector_version = None
+_partial_indexes = (0.0, frozenset())
+_state_lock = threading.Lock()
+
+
+def category_index_name(category):
+    """Deterministic, identifier-safe name for a category's partial HNSW index"""
+    slug = re.sub(r'[^a-z0-9]+', '_', category.lower()).strip('_')[:30]
+    digest = hashlib.sha1(category.encode()).hexdigest()[:8]
+    return f"product_catalog_embedding_{slug}_{digest}_idx"
+
+
+def build_filters(categories=None, min_price=None, max_price=None, min_stars=None):
+    """Return (WHERE clause, params) for the given predicates; unset predicates are skipped"""
+    clauses = [sql.SQL("embedding IS NOT NULL")]
+    params = {}
+    if categories:
+        if len(categories) == 1:
+            # Inlined literal equality so the planner can prove a per-category partial
+            # index's predicate (it cannot with a bind parameter under a generic plan)
+            clauses.append(sql.SQL("category_name = {}").format(sql.Literal(categories[0])))
+        else:
+            clauses.append(sql.SQL("category_name = ANY(%(categories)s)"))
+            params['categories'] = list(categories)
+    if min_price is not None:
+        clauses.append(sql.SQL("price >= %(min_price)s"))
+        params['min_price'] = min_price
+    if max_price is not None:
+        clauses.append(sql.SQL("price <= %(max_price)s"))
+        params['max_price'] = max_price
+    if min_stars is not None:
+        clauses.append(sql.SQL("stars >= %(min_stars)s"))
+        params['min_stars'] = min_stars
+    return sql.SQL(" AND ").join(clauses), params
+
+
+def estimate_matching_rows(conn, where, params):
+    """Planner's row estimate for the filter alone (no execution)"""
+    plan = conn.execute(
+        sql.SQL("EXPLAIN (FORMAT JSON) SELECT 1 FROM bedrock_integration.product_catalog WHERE {}").format(where),
+        params
+    ).fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
+
+
+def get_pgvector_version(conn):
+    global _pgvector_version
+    if _pgvector_version is None:
+        row = conn.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()
+        _pgvector_version = tuple(int(part) for part in row[0].split('.')[:2]) if row else (0, 0)
+    return _pgvector_version
+
+
+def get_partial_indexes(conn):
+    """Names of the per-category HNSW indexes, cached for INDEX_CACHE_TTL seconds"""
+    global _partial_indexes
+    loaded_at, names = _partial_indexes
+    if time.time() - loaded_at > INDEX_CACHE_TTL:
+        rows = conn.execute("""
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = 'bedrock_integration' AND tablename = 'product_catalog'
+            AND indexdef ILIKE '%USING hnsw%' AND indexdef ILIKE '%WHERE%'
+        """).fetchall()
+        names = frozenset(row[0] for row in rows)
+        with _state_lock:
+            _partial_indexes = (time.time(), names)
+    return names
+
+
+def choose_strategy(conn, categories, estimated_rows):
+    if estimated_rows <= EXACT_SCAN_MAX_ROWS:
+        return 'exact'
+    if categories and len(categories) == 1 and category_index_name(categories[0]) in get_partial_indexes(conn):
+        return 'partial_index'
+    return 'iterative'
+
+
+def filtered_similarity_search(query_embedding, top_k=5, categories=None, min_price=None, max_price=None,
+                               min_stars=None, strategy='auto'):
+    """
+    Top-k cosine search restricted to products matching the given predicates.
+
+    Returns (DataFrame, query_time_ms, plan) where plan records the chosen
+    strategy and the estimated number of matching rows.
+    """
+    where, params = build_filters(categories, min_price, max_price, min_stars)
+    params['embedding'] = query_embedding.tolist()
+    params['top_k'] = top_k
+
+    with database.connection() as conn:
+        start_time = time.time()
+        estimated_rows = estimate_matching_rows(conn, where, params)
+        if strategy == 'auto':
+            strategy = choose_strategy(conn, categories, estimated_rows)
+
+        if strategy == 'exact':
+            # MATERIALIZED keeps the HNSW index out of the plan: the filter runs
+            # first and every surviving row is ranked by its exact distance
+            query = sql.SQL("""
+                WITH candidates AS MATERIALIZED (
+                    SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                           imgURL, producturl, embedding
+                    FROM bedrock_integration.product_catalog
+                    WHERE {where}
+                )
+                SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                       imgURL, producturl, 1 - (embedding <=> %(embedding)s::vector) AS similarity
+                FROM candidates
+                ORDER BY embedding <=> %(embedding)s::vector
+                LIMIT %(top_k)s
+            """).format(where=where)
+        else:
+            if get_pgvector_version(conn) >= (0, 8):
+                # relaxed_order may return slightly out-of-order rows, hence the outer ORDER BY
+                conn.execute("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)")
+                conn.execute("SELECT set_config('hnsw.max_scan_tuples', %s, true)", (str(ITERATIVE_MAX_SCAN_TUPLES),))
+                conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(max(ITERATIVE_EF_SEARCH, top_k)),))
+            else:
+                # No iterative scans: widen the candidate list in proportion to the filter selectivity
+                total_rows = conn.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = 'bedrock_integration.product_catalog'::regclass"
+                ).fetchone()[0]
+                selectivity = max(estimated_rows / total_rows, 0.001) if total_rows > 0 else 1.0
+                ef_search = min(1000, max(ITERATIVE_EF_SEARCH, int(top_k / selectivity)))
+                conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(ef_search),))
+            query = sql.SQL("""
+                WITH candidates AS MATERIALIZED (
+                    SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                           imgURL, producturl, embedding <=> %(embedding)s::vector AS distance
+                    FROM bedrock_integration.product_catalog
+                    WHERE {where}
+                    ORDER BY embedding <=> %(embedding)s::vector
+                    LIMIT %(top_k)s
+                )
+                SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                       imgURL, producturl, 1 - distance AS similarity
+                FROM candidates
+                ORDER BY distance
+            """).format(where=where)
+
+        results = conn.execute(query, params).fetchall()
+        query_time = (time.time() - start_time) * 1000
+
+    plan = {'strategy': strategy, 'estimated_rows': estimated_rows}
+    return pd.DataFrame(results, columns=RESULT_COLUMNS), query_time, plan
+
+
+def quantized_similarity_search(query_embedding, top_k=5, mode='halfvec', rerank_depth=None):
+    """
+    Two-stage search: coarse candidates from the mode's quantized HNSW index,
+    then exact cosine re-ranking. Returns (DataFrame, query_time_ms).
+    """
+    if mode not in QUANTIZED_INDEXES:
+        raise ValueError(f"Unknown quantized search mode: {mode} (use one of {', '.join(QUANTIZED_INDEXES)})")
+    coarse_distance = QUANTIZED_INDEXES[mode][3]
+    rerank_depth = max(rerank_depth or top_k * RERANK_FACTOR, top_k)
+    params = {'embedding': query_embedding.tolist(), 'top_k': top_k, 'rerank_depth': rerank_depth}
+
+    with database.connection() as conn:
+        start_time = time.time()
+        # ef_search caps how many rows an HNSW scan can return
+        conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(min(1000, max(40, rerank_depth))),))
+        query = sql.SQL("""
+            WITH candidates AS MATERIALIZED (
+                SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                       imgURL, producturl, embedding
+                FROM bedrock_integration.product_catalog
+                ORDER BY {coarse_distance}
+                LIMIT %(rerank_depth)s
+            )
+            SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+                   imgURL, producturl, 1 - (embedding <=> %(embedding)s::vector) AS similarity
+            FROM candidates
+            ORDER BY embedding <=> %(embedding)s::vector
+            LIMIT %(top_k)s
+        """).format(coarse_distance=sql.SQL(coarse_distance))
+        results = conn.execute(query, params).fetchall()
+        query_time = (time.time() - start_time) * 1000
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS), query_time
+
+
+def create_quantized_index(conn, mode, m=16, ef_construction=64):
+    """Build the HNSW index for a quantized mode (conn must be in autocommit mode; needs pgvector >= 0.7)"""
+    index_name, expression, opclass, _ = QUANTIZED_INDEXES[mode]
+    conn.execute(sql.SQL("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON bedrock_integration.product_catalog
+        USING hnsw ({expression} {opclass}) WITH (m = {m}, ef_construction = {ef_construction})
+    """).format(name=sql.Identifier(index_name), expression=sql.SQL(expression), opclass=sql.SQL(opclass),
+                m=sql.Literal(m), ef_construction=sql.Literal(ef_construction)))
+
+
+def index_sizes(conn):
+    """On-disk size of every HNSW index on product_catalog, for comparing the storage modes"""
+    return conn.execute("""
+        SELECT indexrelid::regclass::text, pg_size_pretty(pg_relation_size(indexrelid))
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_am am ON am.oid = c.relam
+        WHERE indrelid = 'bedrock_integration.product_catalog'::regclass AND am.amname = 'hnsw'
+        ORDER BY pg_relation_size(indexrelid) DESC
+    """).fetchall()
+
+
+def create_category_index(conn, category):
+    """Build a partial HNSW index for one category (conn must be in autocommit mode)"""
+    conn.execute(sql.SQL("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON bedrock_integration.product_catalog
+        USING hnsw (embedding vector_cosine_ops)
+        WHERE category_name = {category}
+    """).format(name=sql.Identifier(category_index_name(category)), category=sql.Literal(category)))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--create-category-indexes", action="store_true")
+    parser.add_argument("--category", action="append", default=[], help="category to index (repeatable)")
+    parser.add_argument("--top", type=int, default=0, help="also index the N largest categories")
+    parser.add_argument("--create-quantized-index", choices=list(QUANTIZED_INDEXES),
+                        help="build the HNSW index used by quantized_similarity_search for this mode")
+    parser.add_argument("--index-sizes", action="store_true", help="print the size of each HNSW index")
+    args = parser.parse_args()
+
+    if args.create_quantized_index:
+        with psycopg.connect(database.get_conninfo(), autocommit=True) as conn:
+            start_time = time.time()
+            create_quantized_index(conn, args.create_quantized_index)
+            logger.info(f"Built {QUANTIZED_INDEXES[args.create_quantized_index][0]} in {time.time() - start_time:.1f}s")
+
+    if args.index_sizes:
+        with psycopg.connect(database.get_conninfo()) as conn:
+            for index_name, size in index_sizes(conn):
+                print(f"{index_name}: {size}")
+
+    if args.create_category_indexes:
+        with psycopg.connect(database.get_conninfo(), autocommit=True) as conn:
+            categories = list(args.category)
+            if args.top:
+                categories += [row[0] for row in conn.execute("""
+                    SELECT category_name FROM bedrock_integration.product_catalog
+                    GROUP BY category_name ORDER BY COUNT(*) DESC LIMIT %s
+                """, (args.top,)).fetchall()]
+            for category in dict.fromkeys(categories):
+                start_time = time.time()
+                create_category_index(conn, category)
+                logger.info(f"Indexed {category} as {category_index_name(category)} in {time.time() - start_time:.1f}s")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the services package importable however pytest is launched
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,105 @@
+"""
+services/citations.py against the citation loop pages/4_Bedrock_Agents.py used
+before it, which is kept here verbatim as the oracle.
+"""
+from services.citations import annotate_citations, format_citations
+
+
+def legacy_format_citations(output_text, citations):
+    if len(citations) > 0:
+        citation_num = 1
+        num_citation_chars = 0
+        citation_locs = ""
+        for citation in citations:
+            end_span = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
+            for retrieved_ref in citation["retrievedReferences"]:
+                citation_marker = f"[{citation_num}]"
+                output_text = output_text[:end_span + num_citation_chars] + citation_marker + output_text[end_span + num_citation_chars:]
+                citation_locs = citation_locs + "\n<br>" + citation_marker + " " + retrieved_ref["location"]["s3Location"]["uri"]
+                citation_num = citation_num + 1
+                num_citation_chars = num_citation_chars + len(citation_marker)
+            output_text = output_text[:end_span + num_citation_chars] + "\n" + output_text[end_span + num_citation_chars:]
+            num_citation_chars = num_citation_chars + 1
+        output_text = output_text + "\n" + citation_locs
+    return output_text
+
+
+def reference(uri):
+    return {"content": {"text": "..."}, "location": {"type": "S3", "s3Location": {"uri": uri}}}
+
+
+def citation(start, end, *uris):
+    return {
+        "generatedResponsePart": {"textResponsePart": {"text": "", "span": {"start": start, "end": end}}},
+        "retrievedReferences": [reference(uri) for uri in uris],
+    }
+
+
+TEXT = "Stock is low. Reorder from the supplier. Shipping takes a week."
+
+
+def test_matches_legacy_output_for_distinct_uris():
+    citations = [
+        citation(0, 12, "s3://kb/a.pdf", "s3://kb/b.pdf"),
+        citation(14, 39, "s3://kb/c.pdf"),
+        citation(41, len(TEXT) - 1, "s3://kb/d.pdf", "s3://kb/e.pdf"),
+    ]
+    assert format_citations(TEXT, citations) == legacy_format_citations(TEXT, citations)
+
+
+def test_repeated_uri_shares_one_number():
+    citations = [
+        citation(0, 12, "s3://kb/a.pdf", "s3://kb/b.pdf"),
+        citation(14, 39, "s3://kb/a.pdf"),
+    ]
+    annotated, references = annotate_citations(TEXT, citations)
+    assert references == ["s3://kb/a.pdf", "s3://kb/b.pdf"]
+    assert annotated == "Stock is low.[1][2]\n Reorder from the supplier.[1]\n Shipping takes a week."
+    assert format_citations(TEXT, citations).count("\n<br>[") == 2
+
+
+def test_same_uri_twice_in_one_citation_gets_one_marker():
+    annotated, _ = annotate_citations(TEXT, [citation(0, 12, "s3://kb/a.pdf", "s3://kb/a.pdf")])
+    assert annotated.startswith("Stock is low.[1]\n Reorder")
+
+
+def test_spans_ending_at_the_same_position_keep_their_order():
+    citations = [
+        citation(0, 12, "s3://kb/a.pdf"),
+        citation(5, 12, "s3://kb/b.pdf"),
+    ]
+    assert format_citations(TEXT, citations) == legacy_format_citations(TEXT, citations)
+    assert format_citations(TEXT, citations).startswith("Stock is low.[1]\n[2]\n Reorder")
+
+
+def test_citation_without_references_only_adds_a_line_break():
+    citations = [citation(0, 12), citation(14, 39, "s3://kb/a.pdf")]
+    assert format_citations(TEXT, citations) == legacy_format_citations(TEXT, citations)
+
+    no_key = {"generatedResponsePart": citations[0]["generatedResponsePart"]}
+    annotated, references = annotate_citations(TEXT, [no_key])
+    assert annotated == "Stock is low.\n Reorder from the supplier. Shipping takes a week."
+    assert references == []
+
+
+def test_no_citations_leaves_text_unchanged():
+    assert format_citations(TEXT, []) == TEXT
+    assert annotate_citations(TEXT, []) == (TEXT, [])
+
+
+def test_out_of_range_span_ends_are_clamped():
+    annotated, _ = annotate_citations(TEXT, [citation(0, len(TEXT) + 50, "s3://kb/a.pdf")])
+    assert annotated == TEXT + "[1]\n"
+    assert format_citations(TEXT, [citation(0, len(TEXT) + 50, "s3://kb/a.pdf")]) == \
+        legacy_format_citations(TEXT, [citation(0, len(TEXT) + 50, "s3://kb/a.pdf")])
+
+    annotated, _ = annotate_citations(TEXT, [citation(0, -10, "s3://kb/a.pdf")])
+    assert annotated == "[1]\n" + TEXT
+
+
+def test_matches_legacy_output_on_a_long_answer():
+    text = "inventory stock reorder supplier shipment " * 1200  # ~50 KB
+    ends = range(100, len(text) - 1, 170)
+    citations = [citation(0, end, f"s3://kb/doc-{i}a.pdf", f"s3://kb/doc-{i}b.pdf") for i, end in enumerate(ends)]
+    assert len(citations) > 250
+    assert format_citations(text, citations) == legacy_format_citations(text, citations)
@@ -0,0 +1,55 @@
+"""
+services/faq_index.py rebuild behaviour when question embeddings cannot be computed.
+"""
+import pytest
+
+from services import faq_index
+
+
+def failing_embed(question):
+    raise RuntimeError("throttled")
+
+
+CSV = "No.,Question,Answer\n1,What is the return policy?,30 days.\n2,Do you ship abroad?,Yes.\n"
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "faqs.csv"
+    path.write_text(CSV)
+    return str(path)
+
+
+def test_failed_build_is_not_retried_until_the_backoff_expires(csv_path, monkeypatch):
+    calls = []
+
+    def counting_embed(question):
+        calls.append(question)
+        return failing_embed(question)
+
+    monkeypatch.setattr(faq_index, "embed_question", counting_embed)
+    index = faq_index.FaqIndex(path=csv_path, retry_seconds=60)
+
+    with pytest.raises(RuntimeError):
+        index.match("What is the return policy?")
+    attempts = len(calls)
+    assert index.match("What is the return policy?") is None
+    assert len(calls) == attempts
+
+    index._retry_after = 0.0
+    with pytest.raises(RuntimeError):
+        index.match("What is the return policy?")
+    assert len(calls) > attempts
+
+
+def test_previous_index_keeps_serving_while_a_rebuild_backs_off(csv_path, monkeypatch):
+    monkeypatch.setattr(faq_index, "embed_question", lambda question: [1.0, float(len(question))])
+    index = faq_index.FaqIndex(path=csv_path, retry_seconds=60)
+    assert index.match("Do you ship abroad?")["answer"] == "Yes."
+
+    monkeypatch.setattr(faq_index, "embed_question", failing_embed)
+    with open(csv_path, "a") as f:
+        f.write("3,Can I cancel an order?,Within an hour.\n")
+    with pytest.raises(RuntimeError):
+        index.match("Do you ship abroad?")
+    assert index.match("Do you ship abroad?")["answer"] == "Yes."
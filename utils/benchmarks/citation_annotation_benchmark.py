@@ -0,0 +1,99 @@
+"""
+Citation annotation benchmark: the original re-slicing loop from pages/4_Bedrock_Agents.py
+vs. services/citations.format_citations.
+
+Generates synthetic agent answers (default 50 KB) with hundreds of citations and
+times both implementations. Correctness against the original loop is covered by
+tests/test_citations.py.
+
+    python utils/benchmarks/citation_annotation_benchmark.py
+    python utils/benchmarks/citation_annotation_benchmark.py --size-kb 200 --citations 100 500 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services.citations import format_citations
+
+
+def legacy_format_citations(output_text, citations):
+    """The loop pages/4_Bedrock_Agents.py used before services/citations.py, kept verbatim for timing"""
+    if len(citations) > 0:
+        citation_num = 1
+        num_citation_chars = 0
+        citation_locs = ""
+        for citation in citations:
+            end_span = citation["generatedResponsePart"]["textResponsePart"]["span"]["end"] + 1
+            for retrieved_ref in citation["retrievedReferences"]:
+                citation_marker = f"[{citation_num}]"
+                output_text = output_text[:end_span + num_citation_chars] + citation_marker + output_text[end_span + num_citation_chars:]
+                citation_locs = citation_locs + "\n<br>" + citation_marker + " " + retrieved_ref["location"]["s3Location"]["uri"]
+                citation_num = citation_num + 1
+                num_citation_chars = num_citation_chars + len(citation_marker)
+            output_text = output_text[:end_span + num_citation_chars] + "\n" + output_text[end_span + num_citation_chars:]
+            num_citation_chars = num_citation_chars + 1
+        output_text = output_text + "\n" + citation_locs
+    return output_text
+
+
+def make_answer(size_bytes, num_citations, refs_per_citation=2, seed=7):
+    """Synthetic answer text and citations with increasing, non-overlapping spans"""
+    rng = random.Random(seed)
+    words = "inventory stock reorder supplier shipment warehouse product price category rating".split()
+    text = []
+    length = 0
+    while length < size_bytes:
+        word = rng.choice(words)
+        text.append(word)
+        length += len(word) + 1
+    output_text = " ".join(text)[:size_bytes]
+
+    ends = sorted(rng.sample(range(1, len(output_text) - 1), num_citations))
+    citations = []
+    uri_number = 0
+    for start, end in zip([0] + ends[:-1], ends):
+        references = []
+        for _ in range(refs_per_citation):
+            uri_number += 1
+            uri = f"s3://kb-bucket/docs/doc-{uri_number}.pdf"
+            references.append({"content": {"text": "..."}, "location": {"type": "S3", "s3Location": {"uri": uri}}})
+        citations.append({
+            "generatedResponsePart": {"textResponsePart": {"text": output_text[start:end + 1],
+                                                           "span": {"start": start, "end": end}}},
+            "retrievedReferences": references,
+        })
+    return output_text, citations
+
+
+def time_call(fn, output_text, citations, repeats):
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        fn(output_text, citations)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=50)
+    parser.add_argument("--citations", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--refs-per-citation", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'citations':>10} {'refs':>6} | {'legacy p50':>11} | {'one-pass p50':>12} | {'speedup':>7}")
+    for num_citations in args.citations:
+        output_text, citations = make_answer(args.size_kb * 1024, num_citations, args.refs_per_citation)
+        legacy = time_call(legacy_format_citations, output_text, citations, args.repeats)
+        one_pass = time_call(format_citations, output_text, citations, args.repeats)
+        print(f"{num_citations:>10} {num_citations * args.refs_per_citation:>6} | {legacy:>9.2f}ms | "
+              f"{one_pass:>10.2f}ms | {legacy / one_pass:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
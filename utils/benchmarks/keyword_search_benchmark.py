@@ -0,0 +1,134 @@
+"""
+Keyword search benchmark: on-the-fly to_tsvector() vs. the indexed search_vector column.
+
+Builds a synthetic catalog in a scratch schema at each requested size, then times
+the legacy keyword_search query (re-tokenizes every row, twice) against the
+indexed query used by pages/2_Product_Recommendations.py.
+
+Run against a disposable local Postgres, never the workshop cluster:
+    python utils/benchmarks/keyword_search_benchmark.py --dsn "host=localhost dbname=postgres user=postgres"
+"""
+import argparse
+import random
+import statistics
+import time
+
+import psycopg
+
+SCHEMA = "keyword_bench"
+
+WORDS = (
+    "wireless bluetooth headphones noise cancelling portable speaker waterproof camera lens "
+    "stainless steel water bottle insulated cooler picnic camping tent hiking backpack jacket "
+    "lightweight spring cotton shirt leather wallet duffel gym bag yoga mat running shoes "
+    "organic eco friendly cleaning spray kitchen knife set cast iron skillet grill outdoor "
+    "cooking gaming laptop keyboard mouse monitor usb charger cable phone case tablet stand "
+    "cozy throw blanket pillow candle lamp decor wall art frame vase rug ceramic mug coffee"
+).split()
+CATEGORIES = [
+    "Electronics", "Sports & Outdoors", "Home & Kitchen", "Clothing", "Beauty",
+    "Toys & Games", "Automotive", "Office Products", "Pet Supplies", "Jewelry",
+]
+QUERIES = [
+    "wireless headphones", "insulated water bottle", "camping tent", "gaming laptop",
+    "leather wallet", "cast iron skillet", "yoga mat", "cozy blanket", "usb charger cable",
+    "eco friendly cleaning",
+]
+
+LEGACY_SQL = f"""
+SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth
+FROM {SCHEMA}.product_catalog
+WHERE to_tsvector('english', product_description || ' ' || category_name) @@ plainto_tsquery('english', %s)
+ORDER BY ts_rank(to_tsvector('english', product_description || ' ' || category_name), plainto_tsquery('english', %s)) DESC
+LIMIT %s
+"""
+
+INDEXED_SQL = f"""
+SELECT "productId", product_description, category_name, stars, price, boughtinlastmonth,
+       ts_rank(search_vector, tsq) AS rank
+FROM {SCHEMA}.product_catalog, plainto_tsquery('english', %s) AS tsq
+WHERE search_vector @@ tsq
+ORDER BY rank DESC
+LIMIT %s
+"""
+
+
+def build_catalog(conn, num_rows, seed=42):
+    """(Re)create the synthetic catalog with num_rows rows and a GIN index"""
+    rng = random.Random(seed)
+    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    conn.execute(f"DROP TABLE IF EXISTS {SCHEMA}.product_catalog")
+    # The benchmark table starts empty, so a generated column is fine here; it
+    # yields the same values as the trigger-maintained column in production.
+    conn.execute(f"""
+        CREATE TABLE {SCHEMA}.product_catalog (
+            "productId" VARCHAR(255) PRIMARY KEY,
+            product_description TEXT,
+            stars NUMERIC,
+            price NUMERIC,
+            boughtinlastmonth INT,
+            category_name VARCHAR(255),
+            search_vector tsvector GENERATED ALWAYS AS (
+                to_tsvector('english', coalesce(product_description, '') || ' ' || coalesce(category_name, ''))
+            ) STORED
+        )
+    """)
+    with conn.cursor() as cur:
+        with cur.copy(f"""COPY {SCHEMA}.product_catalog
+                          ("productId", product_description, stars, price, boughtinlastmonth, category_name)
+                          FROM STDIN""") as copy:
+            for i in range(num_rows):
+                copy.write_row((
+                    f"P{i:08d}",
+                    " ".join(rng.choices(WORDS, k=rng.randint(8, 20))),
+                    round(rng.uniform(1, 5), 1),
+                    round(rng.uniform(1, 500), 2),
+                    rng.randint(0, 5000),
+                    rng.choice(CATEGORIES),
+                ))
+    conn.execute(f"CREATE INDEX ON {SCHEMA}.product_catalog USING gin (search_vector)")
+    conn.execute(f"ANALYZE {SCHEMA}.product_catalog")
+
+
+def time_query(conn, sql, params_for, repeats):
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start_time = time.perf_counter()
+            conn.execute(sql, params_for(query)).fetchall()
+            timings.append((time.perf_counter() - start_time) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "mean": statistics.fmean(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="libpq connection string of a scratch database")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        print(f"{'rows':>10} | {'legacy p50':>11} {'legacy p95':>11} | {'indexed p50':>11} {'indexed p95':>11} | {'speedup':>7}")
+        for num_rows in args.sizes:
+            build_start = time.perf_counter()
+            build_catalog(conn, num_rows)
+            print(f"  built {num_rows} rows in {time.perf_counter() - build_start:.1f}s")
+
+            legacy = time_query(conn, LEGACY_SQL, lambda q: (q, q, args.top_k), args.repeats)
+            indexed = time_query(conn, INDEXED_SQL, lambda q: (q, args.top_k), args.repeats)
+            print(f"{num_rows:>10} | {legacy['p50']:>9.2f}ms {legacy['p95']:>9.2f}ms | "
+                  f"{indexed['p50']:>9.2f}ms {indexed['p95']:>9.2f}ms | {legacy['p50'] / indexed['p50']:>6.1f}x")
+
+        if not args.keep:
+            conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Vector index benchmark: recall@k vs latency for HNSW and IVFFlat parameter grids.
+
+For each catalog size, loads embeddings into a scratch schema (synthetic clustered
+unit vectors, or a sample of a real export written by generate_embeddings.py),
+computes the exact top-k for every query by brute force in NumPy, then for every
+index configuration reports:
+
+- build time and index size
+- per search setting (hnsw.ef_search / ivfflat.probes): recall@k, p50/p99 latency, QPS
+
+and finally recommends, per size, the fastest setting that reaches --target-recall.
+
+Run against a disposable local Postgres with pgvector, never the workshop cluster:
+    python utils/benchmarks/vector_index_benchmark.py --dsn "host=localhost dbname=postgres user=postgres"
+    python utils/benchmarks/vector_index_benchmark.py --dsn "..." --embeddings datasets/product_embeddings.npy \\
+        --sizes 10000 100000 --output vector_bench.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import psycopg
+from pgvector.psycopg import register_vector
+from psycopg import sql
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services.embedding_store import load_embeddings
+
+SCHEMA = "vector_bench"
+
+
+def synthetic_embeddings(num_rows, dimension, num_clusters=100, spread=0.8, seed=42):
+    """
+    Unit vectors scattered around random cluster centres (noise norm ~spread),
+    which is closer to real embeddings than uniform noise
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    noise = rng.standard_normal((num_rows, dimension)).astype(np.float32) * (spread / np.sqrt(dimension))
+    vectors = centres[rng.integers(num_clusters, size=num_rows)] + noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_dataset(args, num_rows, num_queries):
+    """Return (catalog matrix, query matrix); queries are held out from the catalog"""
+    if args.embeddings:
+        _, matrix = load_embeddings(args.embeddings)
+        if len(matrix) < num_rows + num_queries:
+            raise SystemExit(f"{args.embeddings} has {len(matrix)} rows; need {num_rows + num_queries}")
+        rows = np.random.default_rng(42).choice(len(matrix), size=num_rows + num_queries, replace=False)
+        sample = np.asarray(matrix[rows], dtype=np.float32)
+    else:
+        sample = synthetic_embeddings(num_rows + num_queries, args.dimension)
+    return sample[:num_rows], sample[num_rows:]
+
+
+def exact_top_k(catalog, queries, top_k):
+    """Ground-truth ids by cosine similarity (ids are row positions)"""
+    catalog = catalog / np.linalg.norm(catalog, axis=1, keepdims=True)
+    truth = []
+    for query in queries:
+        scores = catalog @ (query / np.linalg.norm(query))
+        best = np.argpartition(-scores, top_k)[:top_k]
+        truth.append(set(best.tolist()))
+    return truth
+
+
+def build_table(conn, catalog):
+    dimension = catalog.shape[1]
+    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    conn.execute(f"DROP TABLE IF EXISTS {SCHEMA}.items")
+    conn.execute(f"CREATE TABLE {SCHEMA}.items (id int PRIMARY KEY, embedding vector({dimension}))")
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {SCHEMA}.items (id, embedding) FROM STDIN (FORMAT BINARY)") as copy:
+            copy.set_types(['int4', 'vector'])
+            for row_id, vector in enumerate(catalog):
+                copy.write_row((row_id, vector))
+    conn.execute(f"ANALYZE {SCHEMA}.items")
+
+
+def index_configs(args, num_rows):
+    """Yield (label, CREATE INDEX statement, search GUC, search values)"""
+    for m, ef_construction in itertools.product(args.hnsw_m, args.hnsw_ef_construction):
+        yield (f"hnsw m={m} ef_construction={ef_construction}",
+               sql.SQL("CREATE INDEX bench_idx ON {}.items USING hnsw (embedding vector_cosine_ops) "
+                       "WITH (m = {}, ef_construction = {})").format(
+                   sql.Identifier(SCHEMA), sql.Literal(m), sql.Literal(ef_construction)),
+               "hnsw.ef_search", [ef for ef in args.hnsw_ef_search if ef >= args.top_k])
+    # pgvector's guidance: rows / 1000 lists up to 1M rows, sqrt(rows) beyond
+    lists_grid = args.ivf_lists or sorted({max(1, num_rows // 1000), max(1, int(np.sqrt(num_rows)))})
+    for lists in lists_grid:
+        yield (f"ivfflat lists={lists}",
+               sql.SQL("CREATE INDEX bench_idx ON {}.items USING ivfflat (embedding vector_cosine_ops) "
+                       "WITH (lists = {})").format(sql.Identifier(SCHEMA), sql.Literal(lists)),
+               "ivfflat.probes", [probes for probes in args.ivf_probes if probes <= lists])
+
+
+def run_queries(conn, queries, truth, top_k):
+    query_sql = f"SELECT id FROM {SCHEMA}.items ORDER BY embedding <=> %s LIMIT %s"
+    timings, recalls = [], []
+    run_start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        ids = [row[0] for row in conn.execute(query_sql, (query, top_k)).fetchall()]
+        timings.append((time.perf_counter() - start_time) * 1000)
+        recalls.append(len(expected.intersection(ids)) / top_k)
+    elapsed = time.perf_counter() - run_start
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "qps": len(queries) / elapsed,
+    }
+
+
+def recommend(results, target_recall):
+    """Fastest (by p50) row meeting the recall target, else the most accurate one"""
+    meeting = [row for row in results if row["recall"] >= target_recall]
+    if meeting:
+        return min(meeting, key=lambda row: row["p50_ms"]), True
+    return max(results, key=lambda row: (row["recall"], -row["p50_ms"])), False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="libpq connection string of a scratch database")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--embeddings", help="sample real vectors from a .npy/.parquet/.csv export instead of synthetic ones")
+    parser.add_argument("--dimension", type=int, default=1024, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--hnsw-ef-construction", type=int, nargs="+", default=[64, 128])
+    parser.add_argument("--hnsw-ef-search", type=int, nargs="+", default=[40, 100, 200])
+    parser.add_argument("--ivf-lists", type=int, nargs="+", help="default: rows/1000 and sqrt(rows)")
+    parser.add_argument("--ivf-probes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--maintenance-work-mem", default="2GB")
+    parser.add_argument("--output", help="also write every measurement to this CSV file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    all_results = []
+    recommendations = []
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        register_vector(conn)
+        conn.execute(sql.SQL("SET maintenance_work_mem = {}").format(sql.Literal(args.maintenance_work_mem)))
+
+        for num_rows in args.sizes:
+            catalog, queries = load_dataset(args, num_rows, args.queries)
+            load_start = time.perf_counter()
+            build_table(conn, catalog)
+            truth = exact_top_k(catalog, queries, args.top_k)
+            print(f"\n== {num_rows} rows x {catalog.shape[1]} dims (loaded in {time.perf_counter() - load_start:.1f}s)")
+            print(f"{'index':<36} {'search':<18} {'build':>8} {'size':>9} {'recall':>7} {'p50':>8} {'p99':>8} {'qps':>7}")
+
+            size_results = []
+            for label, create_sql, search_guc, search_values in index_configs(args, num_rows):
+                conn.execute(f"DROP INDEX IF EXISTS {SCHEMA}.bench_idx")
+                build_start = time.perf_counter()
+                conn.execute(create_sql)
+                build_seconds = time.perf_counter() - build_start
+                index_bytes = conn.execute(f"SELECT pg_relation_size('{SCHEMA}.bench_idx')").fetchone()[0]
+
+                for value in search_values:
+                    conn.execute("SELECT set_config(%s, %s, false)", (search_guc, str(value)))
+                    run_queries(conn, queries[:10], truth[:10], args.top_k)  # warm the buffer cache
+                    metrics = run_queries(conn, queries, truth, args.top_k)
+                    row = {"rows": num_rows, "index": label, "search": f"{search_guc}={value}",
+                           "build_s": build_seconds, "size_mb": index_bytes / 2 ** 20, **metrics}
+                    size_results.append(row)
+                    print(f"{label:<36} {row['search']:<18} {build_seconds:>7.1f}s {row['size_mb']:>7.1f}MB "
+                          f"{metrics['recall']:>7.3f} {metrics['p50_ms']:>6.2f}ms {metrics['p99_ms']:>6.2f}ms "
+                          f"{metrics['qps']:>7.0f}")
+                conn.execute("RESET hnsw.ef_search" if search_guc == "hnsw.ef_search" else "RESET ivfflat.probes")
+
+            if size_results:
+                best, met_target = recommend(size_results, args.target_recall)
+                recommendations.append((num_rows, best, met_target))
+            all_results.extend(size_results)
+
+        if not args.keep:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+    print(f"\nRecommended settings (fastest p50 with recall@{args.top_k} >= {args.target_recall}):")
+    for num_rows, best, met_target in recommendations:
+        note = "" if met_target else "  (target not reached; most accurate setting shown)"
+        print(f"  {num_rows:>10} rows: {best['index']}, {best['search']} -> recall {best['recall']:.3f}, "
+              f"p50 {best['p50_ms']:.2f}ms, {best['size_mb']:.1f}MB{note}")
+
+    if args.output and all_results:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(all_results[0]))
+            writer.writeheader()
+            writer.writerows(all_results)
+        print(f"Wrote {len(all_results)} measurements to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Online migration: add an indexed full-text search column to bedrock_integration.product_catalog.
+
+Steps (each safe to re-run):
+1. Add a nullable `search_vector tsvector` column (catalog-only change, no table rewrite).
+2. Install a trigger that keeps it in sync on INSERT and on UPDATE of the text columns.
+3. Backfill existing rows in small committed batches (FOR UPDATE SKIP LOCKED, so
+   concurrent writers are never blocked for long).
+4. Build the GIN index with CREATE INDEX CONCURRENTLY.
+
+A GENERATED ... STORED column would be simpler, but adding one to a populated
+table rewrites it under an ACCESS EXCLUSIVE lock; the trigger produces the same
+values without blocking readers or writers.
+
+Usage (from the repository root):
+    python utils/helper-functions/add_search_vector.py [--batch-size 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services.database import get_conninfo
+
+SEARCH_VECTOR_EXPR = "to_tsvector('english', coalesce({0}product_description, '') || ' ' || coalesce({0}category_name, ''))"
+
+ADD_COLUMN_SQL = """
+ALTER TABLE bedrock_integration.product_catalog
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+"""
+
+TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION bedrock_integration.product_catalog_search_vector_update()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_EXPR.format('NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS product_catalog_search_vector_trg ON bedrock_integration.product_catalog;
+CREATE TRIGGER product_catalog_search_vector_trg
+    BEFORE INSERT OR UPDATE OF product_description, category_name
+    ON bedrock_integration.product_catalog
+    FOR EACH ROW EXECUTE FUNCTION bedrock_integration.product_catalog_search_vector_update();
+"""
+
+BACKFILL_BATCH_SQL = f"""
+UPDATE bedrock_integration.product_catalog p
+SET search_vector = {SEARCH_VECTOR_EXPR.format('p.')}
+WHERE p."productId" IN (
+    SELECT "productId"
+    FROM bedrock_integration.product_catalog
+    WHERE search_vector IS NULL
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+CREATE_INDEX_SQL = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS product_catalog_search_vector_idx
+ON bedrock_integration.product_catalog
+USING gin (search_vector)
+"""
+
+
+def migrate(conninfo, batch_size=5000):
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        print("Adding search_vector column and trigger...")
+        conn.execute(ADD_COLUMN_SQL)
+        conn.execute(TRIGGER_SQL)
+
+        print(f"Backfilling search_vector in batches of {batch_size}...")
+        total = 0
+        start_time = time.time()
+        while True:
+            with conn.transaction():
+                updated = conn.execute(BACKFILL_BATCH_SQL, (batch_size,)).rowcount
+            if updated == 0:
+                break
+            total += updated
+            print(f"  {total} rows backfilled ({total / (time.time() - start_time):.0f} rows/s)")
+
+        # CREATE INDEX CONCURRENTLY must run outside a transaction block
+        print("Building GIN index concurrently...")
+        conn.execute(CREATE_INDEX_SQL)
+        conn.execute("ANALYZE bedrock_integration.product_catalog")
+
+    print(f"Migration complete ✅ ({total} rows backfilled in {time.time() - start_time:.1f}s)")
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+    migrate(get_conninfo(), args.batch_size)
@@ -0,0 +1,298 @@
+"""
+Bulk-load bedrock_integration.product_catalog with COPY ... FROM STDIN (FORMAT BINARY).
+
+Rows are streamed in PostgreSQL binary format, with embeddings sent in pgvector's
+binary encoding, instead of executemany INSERTs.
+
+Modes:
+  swap    (default) load into an index-less staging table, then build the primary
+          key, HNSW and full-text indexes once, after the data is in, and swap the
+          staging table in with a short ACCESS EXCLUSIVE rename
+  upsert  load into an UNLOGGED staging table (dropped afterwards), then merge into the
+          live table with INSERT ... ON CONFLICT ("productId") DO UPDATE; --defer-index
+          rebuilds the HNSW index after the merge with CREATE INDEX CONCURRENTLY and
+          swaps it in, so readers are never blocked by the build
+
+Index builds run with the given maintenance_work_mem and parallel maintenance workers.
+Loaded rows get the same embedding_hash reembed_changed.py computes (the input was
+embedded with its model), so the incremental job does not re-embed them. Duplicate
+productIds in the input keep their last occurrence.
+
+Usage (from the repository root):
+    python utils/helper-functions/bulk_load_catalog.py --input datasets/product_embeddings.parquet
+    python utils/helper-functions/bulk_load_catalog.py --input datasets/delta.parquet --mode upsert
+"""
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+import psycopg
+from dotenv import load_dotenv
+from pgvector.psycopg import register_vector
+from psycopg import sql
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services import insights_aggregates
+from services.database import get_conninfo
+from services.embedding_store import load_embeddings
+from reembed_changed import EMBEDDING_DIMENSION, HASH_SQL, MODEL_ID
+
+SCHEMA = "bedrock_integration"
+TABLE = "product_catalog"
+STAGING_TABLE = "product_catalog_staging"
+HNSW_INDEX = "product_catalog_embedding_idx"
+SEARCH_VECTOR_INDEX = "product_catalog_search_vector_idx"
+SEARCH_VECTOR_TRIGGER = "product_catalog_search_vector_trg"
+# Installed by python -m services.local_vector_index --setup
+EMBEDDING_TOUCH_TRIGGER = "product_catalog_embedding_touch_trg"
+
+# Column name -> type used for binary COPY (must match the table definition exactly)
+CATALOG_COLUMNS = {
+    "productId": "varchar",
+    "product_description": "text",
+    "imgurl": "text",
+    "producturl": "text",
+    "stars": "numeric",
+    "reviews": "int4",
+    "price": "numeric",
+    "category_id": "int4",
+    "isbestseller": "bool",
+    "boughtinlastmonth": "int4",
+    "category_name": "varchar",
+    "quantity": "int4",
+    "embedding": "vector",
+}
+NUMERIC_COLUMNS = {name for name, type_name in CATALOG_COLUMNS.items() if type_name == "numeric"}
+INT_COLUMNS = {name for name, type_name in CATALOG_COLUMNS.items() if type_name == "int4"}
+
+# Same defaults the Part 1 notebook applies before loading
+FILL_VALUES = {
+    'stars': 0, 'reviews': 0, 'price': 0, 'category_id': 0, 'isbestseller': False,
+    'boughtinlastmonth': 0, 'category_name': 'Unknown', 'quantity': 0,
+}
+
+
+def qualified(table):
+    return sql.Identifier(SCHEMA, table)
+
+
+def iter_rows(metadata, matrix):
+    """Yield COPY rows with Python types matching CATALOG_COLUMNS (numeric -> Decimal, int4 -> int)"""
+    columns = [name for name in CATALOG_COLUMNS if name != "embedding"]
+    for values, embedding in zip(metadata[columns].itertuples(index=False, name=None), matrix):
+        row = []
+        for name, value in zip(columns, values):
+            if name in NUMERIC_COLUMNS:
+                value = Decimal(repr(float(value)))
+            elif name in INT_COLUMNS:
+                value = int(value)
+            elif name == "isbestseller":
+                value = bool(value)
+            row.append(value)
+        row.append(embedding)
+        yield row
+
+
+def copy_rows(conn, table, metadata, matrix, report_every=50000):
+    start_time = time.time()
+    column_list = sql.SQL(", ").join(sql.Identifier(name) for name in CATALOG_COLUMNS)
+    with conn.cursor() as cur:
+        with cur.copy(sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(qualified(table), column_list)) as copy:
+            copy.set_types(list(CATALOG_COLUMNS.values()))
+            for i, row in enumerate(iter_rows(metadata, matrix), 1):
+                copy.write_row(row)
+                if i % report_every == 0:
+                    print(f"  {i} rows copied ({i / (time.time() - start_time):.0f} rows/s)")
+    print(f"Copied {len(metadata)} rows in {time.time() - start_time:.1f}s")
+
+
+def has_column(conn, column):
+    return conn.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+    """, (SCHEMA, TABLE, column)).fetchone() is not None
+
+
+def has_search_vector(conn):
+    return has_column(conn, 'search_vector')
+
+
+def has_embedding_touch(conn):
+    return conn.execute(
+        "SELECT to_regprocedure('bedrock_integration.product_catalog_embedding_touch()')"
+    ).fetchone()[0] is not None
+
+
+def fill_embedding_hash(conn, table):
+    """Record reembed_changed.py's content hash for every loaded row"""
+    start_time = time.time()
+    updated = conn.execute(
+        sql.SQL("UPDATE {} SET embedding_hash = " + HASH_SQL.format('')).format(qualified(table)),
+        {'model_id': MODEL_ID, 'dimension': str(EMBEDDING_DIMENSION)}
+    ).rowcount
+    print(f"Recorded embedding hashes for {updated} rows in {time.time() - start_time:.1f}s")
+
+
+def tune_index_build(conn, maintenance_work_mem, parallel_workers):
+    conn.execute(sql.SQL("SET maintenance_work_mem = {}").format(sql.Literal(maintenance_work_mem)))
+    conn.execute(sql.SQL("SET max_parallel_maintenance_workers = {}").format(sql.Literal(parallel_workers)))
+
+
+def build_hnsw_index(conn, table, index_name, m, ef_construction, concurrently=False):
+    start_time = time.time()
+    conn.execute(sql.SQL("""
+        CREATE INDEX {} IF NOT EXISTS {} ON {}
+        USING hnsw (embedding vector_cosine_ops) WITH (m = {}, ef_construction = {})
+    """).format(sql.SQL("CONCURRENTLY" if concurrently else ""), sql.Identifier(index_name), qualified(table),
+                sql.Literal(m), sql.Literal(ef_construction)))
+    print(f"Built HNSW index {index_name} in {time.time() - start_time:.1f}s")
+
+
+def load_swap(conn, metadata, matrix, args):
+    search_vector = has_search_vector(conn)
+    embedding_hash = has_column(conn, 'embedding_hash')
+    embedding_touch = has_embedding_touch(conn)
+    staging_hnsw = f"{STAGING_TABLE}_embedding_idx"
+    staging_gin = f"{STAGING_TABLE}_search_vector_idx"
+
+    print("Creating staging table...")
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(qualified(STAGING_TABLE)))
+    conn.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING GENERATED)").format(
+        qualified(STAGING_TABLE), qualified(TABLE)))
+    if search_vector:
+        # Fill search_vector during COPY with the same trigger the live table uses
+        conn.execute(sql.SQL("""
+            CREATE TRIGGER {} BEFORE INSERT OR UPDATE OF product_description, category_name ON {}
+            FOR EACH ROW EXECUTE FUNCTION bedrock_integration.product_catalog_search_vector_update()
+        """).format(sql.Identifier(SEARCH_VECTOR_TRIGGER), qualified(STAGING_TABLE)))
+    if embedding_touch:
+        # The live table's trigger is dropped with it; without this copy, later embedding
+        # updates would stop bumping embedding_updated_at and the local vector index would go stale
+        conn.execute(sql.SQL("""
+            CREATE TRIGGER {} BEFORE INSERT OR UPDATE OF embedding ON {}
+            FOR EACH ROW EXECUTE FUNCTION bedrock_integration.product_catalog_embedding_touch()
+        """).format(sql.Identifier(EMBEDDING_TOUCH_TRIGGER), qualified(STAGING_TABLE)))
+
+    copy_rows(conn, STAGING_TABLE, metadata, matrix)
+    if embedding_hash:
+        # Before any index exists, so this is one cheap pass over the staging heap
+        fill_embedding_hash(conn, STAGING_TABLE)
+
+    print("Building indexes on staging table...")
+    tune_index_build(conn, args.maintenance_work_mem, args.parallel_workers)
+    conn.execute(sql.SQL('ALTER TABLE {} ADD PRIMARY KEY ("productId")').format(qualified(STAGING_TABLE)))
+    build_hnsw_index(conn, STAGING_TABLE, staging_hnsw, args.m, args.ef_construction)
+    if search_vector:
+        conn.execute(sql.SQL("CREATE INDEX {} ON {} USING gin (search_vector)").format(
+            sql.Identifier(staging_gin), qualified(STAGING_TABLE)))
+    conn.execute(sql.SQL("ANALYZE {}").format(qualified(STAGING_TABLE)))
+
+    # Materialized views depend on the live table and are dropped with it; rebuild them after the swap
+    had_views = conn.execute("""
+        SELECT 1 FROM pg_matviews WHERE schemaname = %s AND matviewname = ANY(%s)
+    """, (SCHEMA, list(insights_aggregates.AGGREGATE_VIEWS))).fetchone() is not None
+
+    print("Swapping staging table into place...")
+    with conn.transaction():
+        conn.execute(sql.SQL("SET LOCAL lock_timeout = {}").format(sql.Literal(args.lock_timeout)))
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(qualified(TABLE)))
+        conn.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(qualified(STAGING_TABLE), sql.Identifier(TABLE)))
+        conn.execute(sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+            qualified(TABLE), sql.Identifier(f"{STAGING_TABLE}_pkey"), sql.Identifier(f"{TABLE}_pkey")))
+        conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+            sql.Identifier(SCHEMA, staging_hnsw), sql.Identifier(HNSW_INDEX)))
+        if search_vector:
+            conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier(SCHEMA, staging_gin), sql.Identifier(SEARCH_VECTOR_INDEX)))
+    # Outside the swap transaction so readers are not blocked while the views build
+    if had_views:
+        insights_aggregates.create_views(conn)
+    print("Swap complete (per-category partial and quantized HNSW indexes, if any, must be rebuilt)")
+
+
+def load_upsert(conn, metadata, matrix, args):
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(qualified(STAGING_TABLE)))
+    conn.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+        qualified(STAGING_TABLE), qualified(TABLE)))
+    try:
+        copy_rows(conn, STAGING_TABLE, metadata, matrix)
+
+        column_names = list(CATALOG_COLUMNS)
+        if has_column(conn, 'embedding_hash'):
+            fill_embedding_hash(conn, STAGING_TABLE)
+            column_names.append('embedding_hash')
+        columns = sql.SQL(", ").join(sql.Identifier(name) for name in column_names)
+        updates = sql.SQL(", ").join(
+            sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(name)) for name in column_names if name != "productId")
+
+        # The merge commits on its own; the existing HNSW index keeps serving (and is maintained) throughout
+        with conn.transaction():
+            start_time = time.time()
+            merged = conn.execute(sql.SQL("""
+                INSERT INTO {target} ({columns})
+                SELECT {columns} FROM {staging}
+                ON CONFLICT ("productId") DO UPDATE SET {updates}
+            """).format(target=qualified(TABLE), staging=qualified(STAGING_TABLE), columns=columns, updates=updates)).rowcount
+            print(f"Upserted {merged} rows in {time.time() - start_time:.1f}s")
+        conn.execute(sql.SQL("ANALYZE {}").format(qualified(TABLE)))
+        if args.defer_index:
+            rebuild_hnsw_index_concurrently(conn, args)
+    finally:
+        conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(qualified(STAGING_TABLE)))
+
+
+def rebuild_hnsw_index_concurrently(conn, args):
+    """
+    Build a fresh HNSW graph next to the live one without blocking reads or writes,
+    then swap names. A large merge leaves the incrementally grown graph with worse
+    recall than a single build over the final data.
+    """
+    new_index = f"{HNSW_INDEX}_new"
+    # A failed concurrent build leaves an INVALID index behind
+    conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(SCHEMA, new_index)))
+    tune_index_build(conn, args.maintenance_work_mem, args.parallel_workers)
+    build_hnsw_index(conn, TABLE, new_index, args.m, args.ef_construction, concurrently=True)
+    conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(SCHEMA, HNSW_INDEX)))
+    conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier(SCHEMA, new_index), sql.Identifier(HNSW_INDEX)))
+
+
+def prepare_frame(path):
+    metadata, matrix = load_embeddings(path)
+    keep = metadata['product_description'].notna().to_numpy()
+    # A repeated productId would fail ADD PRIMARY KEY (swap) or ON CONFLICT DO UPDATE (upsert)
+    # only after the whole COPY; keep the last occurrence, the newest row in an appended export
+    keep &= ~metadata['productId'].duplicated(keep='last').to_numpy()
+    metadata = metadata[keep].fillna(FILL_VALUES).reset_index(drop=True)
+    return metadata, matrix[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True, help=".parquet, .npy or .csv written by generate_embeddings.py")
+    parser.add_argument('--mode', choices=['swap', 'upsert'], default='swap')
+    parser.add_argument('--defer-index', action='store_true', help="upsert mode: rebuild the HNSW index concurrently after the merge")
+    parser.add_argument('--maintenance-work-mem', default='2GB')
+    parser.add_argument('--parallel-workers', type=int, default=4, help="max_parallel_maintenance_workers for index builds")
+    parser.add_argument('--m', type=int, default=16)
+    parser.add_argument('--ef-construction', type=int, default=64)
+    parser.add_argument('--lock-timeout', default='10s', help="give up on the swap rather than queue behind long readers")
+    args = parser.parse_args()
+
+    metadata, matrix = prepare_frame(args.input)
+    print(f"Loaded {len(metadata)} products with {matrix.shape[1]}-dim embeddings from {args.input}")
+
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        register_vector(conn)
+        start_time = time.time()
+        if args.mode == 'swap':
+            load_swap(conn, metadata, matrix, args)
+        else:
+            load_upsert(conn, metadata, matrix, args)
+        print(f"Bulk load complete ✅ ({time.time() - start_time:.1f}s)")
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    main()
@@ -1,10 +1,50 @@
-import boto3
+"""
+Generate Titan text embeddings for a product CSV.
+
+Default mode is the original fire-and-forget ThreadPoolExecutor run. --resilient
+turns on the production ingestion mode:
+
+- adaptive concurrency (AIMD): +1 in-flight request after a run of successes,
+  halved on every throttling response or transient error (5xx, timeout, dropped
+  connection)
+- retries with full-jitter exponential backoff for throttling / transient errors
+- checkpointing: finished rows are appended to <checkpoint-dir>/embeddings.jsonl,
+  so a restarted run skips them
+- dead-letter file: rows that fail permanently go to <checkpoint-dir>/dead_letter.jsonl
+  (they are not checkpointed, so the next run tries them again)
+- periodic throughput / ETA report
+
+The output format follows the --output suffix: .csv (default), .parquet
+(fixed-size float32 lists) or .npy (memory-mappable float32 matrix plus a
+.meta.csv sidecar); see services/embedding_store.py for the matching loader.
+
+Usage (from the repository root):
+    python utils/helper-functions/generate_embeddings.py
+    python utils/helper-functions/generate_embeddings.py --output datasets/product_embeddings.parquet
+    python utils/helper-functions/generate_embeddings.py --resilient --checkpoint-dir datasets/embedding_checkpoint
+"""
+import argparse
+import base64
 import json
-import pandas as pd
+import os
+import random
+import sys
+import threading
+import time
+
+import boto3
 import numpy as np
+import pandas as pd
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, ReadTimeoutError
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services.embedding_store import save_embeddings
+
+MODEL_ID = "amazon.titan-embed-text-v2:0"
+
 # Initialize Bedrock client
 bedrock = boto3.client('bedrock-runtime')
 
@@ -12,7 +52,7 @@ bedrock = boto3.client('bedrock-runtime')
 def get_embedding(text):
     try:
         response = bedrock.invoke_model(
-            modelId="amazon.titan-embed-text-v2:0",
+            modelId=MODEL_ID,
             contentType="application/json",
             accept="application/json",
             body=json.dumps({"inputText": text})
@@ -33,16 +73,243 @@ def generate_embeddings_parallel(df, max_workers=50):
     df['embedding'] = embeddings
     return df
 
-# Load your data
-df = pd.read_csv('datasets/top_bottom_100_products.csv')
 
-# Generate embeddings
-df_with_embeddings = generate_embeddings_parallel(df)
+# Production ingestion mode
+THROTTLING_ERRORS = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+TRANSIENT_ERRORS = {"ServiceUnavailableException", "InternalServerException", "ModelNotReadyException",
+                    "ModelTimeoutException"}
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows additively while requests succeed and is cut
+    multiplicatively whenever Bedrock throttles us or fails transiently.
+
+    release() takes the request's outcome:
+    - "success":   counts towards the next increase
+    - "throttled": halves the limit
+    - "error":     a transient failure (5xx, timeout, connection); halves the limit too,
+                   since these also show up when the service is overloaded
+    - "rejected":  a permanent error such as a validation failure; says nothing about
+                   load, so it neither grows nor shrinks the limit
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=50, increase_every=20):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_every = increase_every
+        self.in_flight = 0
+        self.throttles = 0
+        self.errors = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome="success"):
+        with self._condition:
+            self.in_flight -= 1
+            if outcome in ("throttled", "error"):
+                if outcome == "throttled":
+                    self.throttles += 1
+                else:
+                    self.errors += 1
+                self._successes = 0
+                self.limit = max(self.minimum, self.limit // 2)
+            elif outcome == "success":
+                self._successes += 1
+                if self._successes >= self.increase_every and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class Checkpoint:
+    """Append-only JSONL logs of finished and permanently failed rows"""
+
+    def __init__(self, checkpoint_dir):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.done_path = os.path.join(checkpoint_dir, "embeddings.jsonl")
+        self.dead_letter_path = os.path.join(checkpoint_dir, "dead_letter.jsonl")
+        self._lock = threading.Lock()
+
+    def completed_keys(self):
+        keys = set()
+        if os.path.exists(self.done_path):
+            with open(self.done_path) as f:
+                for line in f:
+                    try:
+                        keys.add(json.loads(line)["key"])
+                    except (ValueError, KeyError):
+                        pass  # torn final line from a crash; the row is simply redone
+        return keys
+
+    def load_embeddings(self):
+        embeddings = {}
+        if os.path.exists(self.done_path):
+            with open(self.done_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    embeddings[record["key"]] = np.frombuffer(base64.b64decode(record["embedding"]), dtype='<f4')
+        return embeddings
+
+    def record_success(self, key, embedding):
+        # float32 as base64 keeps each checkpoint line ~5.5 KB instead of ~20 KB of decimal text
+        line = json.dumps({"key": key, "embedding": base64.b64encode(np.asarray(embedding, dtype='<f4').tobytes()).decode()})
+        self._append(self.done_path, line)
+
+    def record_failure(self, key, text, error):
+        line = json.dumps({"key": key, "text": text, "error": error, "failed_at": time.strftime('%Y-%m-%dT%H:%M:%S')})
+        self._append(self.dead_letter_path, line)
+
+    def _append(self, path, line):
+        with self._lock:
+            with open(path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def embed_with_retries(client, limiter, text, max_attempts=8, base_delay=0.5, max_delay=30.0):
+    """Returns (embedding, None) on success or (None, error message) once retries are exhausted"""
+    for attempt in range(1, max_attempts + 1):
+        limiter.acquire()
+        outcome = "rejected"
+        try:
+            response = client.invoke_model(
+                modelId=MODEL_ID,
+                contentType="application/json",
+                accept="application/json",
+                body=json.dumps({"inputText": text})
+            )
+            embedding = json.loads(response['body'].read())['embedding']
+            outcome = "success"
+            return embedding, None
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in THROTTLING_ERRORS:
+                outcome = "throttled"
+            elif code in TRANSIENT_ERRORS:
+                outcome = "error"
+            else:
+                return None, f"{code}: {e}"  # e.g. ValidationException: retrying cannot help
+            error = f"{code}: {e}"
+        except (ConnectionError, ReadTimeoutError) as e:
+            outcome = "error"
+            error = str(e)
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+        finally:
+            limiter.release(outcome)
+        # Full jitter: sleep uniformly in [0, min(cap, base * 2^attempt)]
+        time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+    return None, f"gave up after {max_attempts} attempts: {error}"
+
+
+def generate_embeddings_resilient(df, checkpoint_dir, key_column='productId', max_concurrency=50,
+                                  initial_concurrency=8, max_attempts=8, report_every=10.0):
+    # Client-side retries are disabled so throttling reaches the AIMD limiter immediately
+    client = boto3.client('bedrock-runtime', config=Config(
+        retries={'total_max_attempts': 1, 'mode': 'standard'},
+        max_pool_connections=max_concurrency,
+        read_timeout=60
+    ))
+    checkpoint = Checkpoint(checkpoint_dir)
+    limiter = AIMDLimiter(initial=initial_concurrency, maximum=max_concurrency)
+
+    keys = df[key_column].astype(str) if key_column in df.columns else df.index.astype(str)
+    completed = checkpoint.completed_keys()
+    pending = [(key, text) for key, text in zip(keys, df['product_description']) if key not in completed]
+    print(f"{len(completed)} rows already checkpointed, {len(pending)} to embed")
+
+    stats = {"succeeded": 0, "failed": 0}
+    stats_lock = threading.Lock()
+    start_time = time.time()
+
+    def process(item):
+        key, text = item
+        embedding, error = embed_with_retries(client, limiter, text, max_attempts=max_attempts)
+        if embedding is not None:
+            checkpoint.record_success(key, embedding)
+        else:
+            checkpoint.record_failure(key, text, error)
+        with stats_lock:
+            stats["succeeded" if embedding is not None else "failed"] += 1
+
+    def report():
+        with stats_lock:
+            done = stats["succeeded"] + stats["failed"]
+        elapsed = time.time() - start_time
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (len(pending) - done) / rate if rate > 0 else float('inf')
+        print(f"[{elapsed:7.0f}s] {done}/{len(pending)} rows | {rate:6.1f} rows/s | ETA {eta / 60:6.1f} min | "
+              f"concurrency {limiter.limit} | throttles {limiter.throttles} | transient errors {limiter.errors} | dead-lettered {stats['failed']}")
+
+    finished = threading.Event()
+
+    def reporter():
+        while not finished.wait(report_every):
+            report()
+
+    reporter_thread = threading.Thread(target=reporter, daemon=True)
+    reporter_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            list(executor.map(process, pending))
+    finally:
+        finished.set()
+        report()
+
+    # Assemble the final frame from the checkpoint so rows from earlier runs are included
+    embeddings = checkpoint.load_embeddings()
+    df = df.copy()
+    df['embedding'] = [embeddings[key].tolist() if key in embeddings else None for key in keys]
+    if stats["failed"]:
+        print(f"{stats['failed']} rows dead-lettered to {checkpoint.dead_letter_path}")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='datasets/top_bottom_100_products.csv')
+    parser.add_argument('--output', default='datasets/top_bottom_100_products_embeddings.csv')
+    parser.add_argument('--resilient', action='store_true', help="adaptive, checkpointed production mode")
+    parser.add_argument('--checkpoint-dir', default='datasets/embedding_checkpoint')
+    parser.add_argument('--max-concurrency', type=int, default=50)
+    parser.add_argument('--initial-concurrency', type=int, default=8)
+    parser.add_argument('--max-attempts', type=int, default=8)
+    args = parser.parse_args()
+
+    # Load your data
+    df = pd.read_csv(args.input)
+
+    # Generate embeddings
+    if args.resilient:
+        df_with_embeddings = generate_embeddings_resilient(
+            df, args.checkpoint_dir,
+            max_concurrency=args.max_concurrency,
+            initial_concurrency=args.initial_concurrency,
+            max_attempts=args.max_attempts
+        )
+    else:
+        df_with_embeddings = generate_embeddings_parallel(df)
+
+    # Remove rows where embedding generation failed
+    df_with_embeddings = df_with_embeddings.dropna(subset=['embedding'])
+
+    # Save the results
+    save_embeddings(df_with_embeddings, args.output)
 
-# Remove rows where embedding generation failed
-df_with_embeddings = df_with_embeddings.dropna(subset=['embedding'])
+    print(f"Processed {len(df_with_embeddings)} products. Results saved to '{args.output}'.")
 
-# Save the results
-df_with_embeddings.to_csv('datasets/top_bottom_100_products_embeddings.csv', index=False)
 
-print(f"Processed {len(df_with_embeddings)} products. Results saved to 'top_bottom_100_products_embeddings.csv'.")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
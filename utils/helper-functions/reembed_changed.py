@@ -0,0 +1,146 @@
+"""
+Incremental re-embedding for bedrock_integration.product_catalog.
+
+product_catalog.embedding_hash records sha256(model_id | dimension | product_description)
+for the text each stored embedding was generated from. This job selects only rows
+whose embedding is NULL or whose hash no longer matches, embeds them in batches
+(with the adaptive, retrying client from generate_embeddings.py) and writes each
+batch back via COPY into a temp table followed by a single UPDATE ... FROM.
+
+The UPDATE re-checks the hash against the row's current description, so a row
+edited while its embedding was in flight is left for the next run.
+
+Usage (from the repository root):
+    python utils/helper-functions/reembed_changed.py --adopt-existing   # once: trust current embeddings
+    python utils/helper-functions/reembed_changed.py                    # daily incremental run
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import psycopg
+from botocore.config import Config
+from dotenv import load_dotenv
+from pgvector.psycopg import register_vector
+
+from generate_embeddings import MODEL_ID, AIMDLimiter, embed_with_retries
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from services.database import get_conninfo
+
+EMBEDDING_DIMENSION = 1024
+
+# Must produce the same bytes as content_hash() below
+HASH_SQL = "sha256(convert_to(%(model_id)s || '|' || %(dimension)s || '|' || coalesce({0}product_description, ''), 'UTF8'))"
+
+ADD_COLUMN_SQL = """
+ALTER TABLE bedrock_integration.product_catalog
+    ADD COLUMN IF NOT EXISTS embedding_hash BYTEA
+"""
+
+SELECT_CHANGED_SQL = f"""
+SELECT "productId", product_description
+FROM bedrock_integration.product_catalog
+WHERE product_description IS NOT NULL
+AND (embedding IS NULL OR embedding_hash IS DISTINCT FROM {HASH_SQL.format('')})
+"""
+
+ADOPT_EXISTING_SQL = f"""
+UPDATE bedrock_integration.product_catalog
+SET embedding_hash = {HASH_SQL.format('')}
+WHERE embedding IS NOT NULL AND embedding_hash IS NULL
+"""
+
+UPDATE_FROM_STAGING_SQL = f"""
+UPDATE bedrock_integration.product_catalog p
+SET embedding = s.embedding, embedding_hash = s.embedding_hash
+FROM reembed_staging s
+WHERE p."productId" = s."productId"
+AND s.embedding_hash = {HASH_SQL.format('p.')}
+"""
+
+
+def content_hash(text, model_id=MODEL_ID, dimension=EMBEDDING_DIMENSION):
+    return hashlib.sha256(f"{model_id}|{dimension}|{text or ''}".encode('utf-8')).digest()
+
+
+def write_batch(conn, batch):
+    """COPY (productId, embedding, hash) rows into a temp table and apply them with one UPDATE"""
+    hash_params = {'model_id': MODEL_ID, 'dimension': str(EMBEDDING_DIMENSION)}
+    with conn.transaction():
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS reembed_staging (
+                "productId" VARCHAR(255), embedding vector, embedding_hash BYTEA
+            ) ON COMMIT DELETE ROWS
+        """)
+        with conn.cursor() as cur:
+            with cur.copy('COPY reembed_staging ("productId", embedding, embedding_hash) FROM STDIN (FORMAT BINARY)') as copy:
+                copy.set_types(['varchar', 'vector', 'bytea'])
+                for row in batch:
+                    copy.write_row(row)
+        return conn.execute(UPDATE_FROM_STAGING_SQL, hash_params).rowcount
+
+
+def reembed(conn, batch_size=500, max_concurrency=20, limit=None):
+    hash_params = {'model_id': MODEL_ID, 'dimension': str(EMBEDDING_DIMENSION)}
+    changed = conn.execute(SELECT_CHANGED_SQL + (" LIMIT %(limit)s" if limit else ""),
+                           dict(hash_params, limit=limit)).fetchall()
+    total = conn.execute("SELECT COUNT(*) FROM bedrock_integration.product_catalog").fetchone()[0]
+    print(f"{len(changed)} of {total} products need new embeddings "
+          f"({100 * len(changed) / total if total else 0:.2f}%)")
+
+    client = boto3.client('bedrock-runtime', config=Config(
+        retries={'total_max_attempts': 1, 'mode': 'standard'},
+        max_pool_connections=max_concurrency
+    ))
+    limiter = AIMDLimiter(maximum=max_concurrency)
+    updated = failed = 0
+    start_time = time.time()
+
+    def embed_row(row):
+        product_id, description = row
+        embedding, error = embed_with_retries(client, limiter, description)
+        if embedding is None:
+            print(f"Failed to embed {product_id}: {error}")
+            return None
+        return (product_id, embedding, content_hash(description))
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for offset in range(0, len(changed), batch_size):
+            results = list(executor.map(embed_row, changed[offset:offset + batch_size]))
+            batch = [result for result in results if result is not None]
+            failed += len(results) - len(batch)
+            if batch:
+                updated += write_batch(conn, batch)
+            done = offset + len(results)
+            rate = done / (time.time() - start_time)
+            print(f"  {done}/{len(changed)} embedded | {updated} updated | {failed} failed | {rate:.1f} rows/s")
+
+    print(f"Re-embedding complete ✅ ({updated} updated, {failed} failed, {time.time() - start_time:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--adopt-existing', action='store_true',
+                        help="record hashes for rows that already have embeddings instead of re-embedding them")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-concurrency', type=int, default=20)
+    parser.add_argument('--limit', type=int, help="embed at most this many rows in this run")
+    args = parser.parse_args()
+
+    with psycopg.connect(get_conninfo(), autocommit=True) as conn:
+        register_vector(conn)
+        conn.execute(ADD_COLUMN_SQL)
+        if args.adopt_existing:
+            adopted = conn.execute(ADOPT_EXISTING_SQL, {'model_id': MODEL_ID, 'dimension': str(EMBEDDING_DIMENSION)}).rowcount
+            print(f"Recorded content hashes for {adopted} existing embeddings")
+        reembed(conn, args.batch_size, args.max_concurrency, args.limit)
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    main()